@@ -0,0 +1,756 @@
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# Spread3D BlendUp pre-import analyzer, usable without bpy
+#
+#   python blendup_analyze.py analyze export.json [--memory 16000] [--json]
+#   python blendup_analyze.py calibrate blendup_batch.jsonl
+#
+# The predictions come from per element costs. The defaults are rough
+# figures for Blender 2.7x; calibrate rescales them from the "seconds" and
+# "peakMB" of the jobs logged by blendup_batch.py.
+
+import argparse
+import codecs
+import json
+import os
+import re
+import struct
+import sys
+
+sys.path.append( os.path.dirname( os.path.abspath(__file__) ) )
+
+import blendup_json
+
+defaultCalibration = "blendup_calibration.json"
+
+#bytes per element, decoded nested lists first (CPython floats, ints and lists), then typed buffers
+
+pythonBytes = { "vertex" : 152, "loop" : 56 + 152 + 120 + 8, "face" : 56 + 16 }
+
+typedBytes = { "vertex" : 12, "loop" : 4 + 12 + 8 + 1, "face" : 12 }
+
+#Blender mesh data with its evaluated copy, per element, and per object
+
+blenderBytes = { "vertex" : 40, "edge" : 24, "loop" : 48, "face" : 24, "object" : 1600, "material" : 20000 }
+
+#seconds per element, objects also have a quadratic term from the unique name lookups
+
+seconds = { "byte" : 1e-8, "vertex" : 5e-7, "loop" : 1.5e-6, "object" : 2e-4, "object2" : 1e-9,
+            "material" : 5e-3, "textureMB" : 0.02 }
+
+#recommendation thresholds
+
+thresholds = { "memoryShare" : 0.6, "streamingFileMB" : 500, "instancingRatio" : 4.0,
+               "batchingObjects" : 20000, "batchingFaces" : 200, "chunkFaces" : 100000, "proxyShare" : 0.5 }
+
+def readMaterialDefinitions( path ):
+
+    #same parsing as Skp2Blend.parseMaterialDefinitions, index 0 is the default material
+
+    if not os.path.exists(path):
+
+        return []
+
+    with codecs.open(path, "r", "utf-8") as file:
+
+        return parseMaterialLines(file)
+
+def parseMaterialLines( lines ):
+
+    definitions = []
+
+    for line in lines:
+
+        definition = {}
+
+        for param in line.strip().split(";"):
+
+            values = param.split("=")
+
+            if len(values) != 2 : continue
+
+            definition[ values[0].strip() ] = values[1].strip()
+
+        definitions.append(definition)
+
+    return definitions
+
+def imageSize( path ):
+
+    #width and height from the PNG or JPEG header, None for other formats
+
+    with open(path, 'rb') as file:
+
+        header = file.read(24)
+
+        if header[:8] == b"\x89PNG\r\n\x1a\n":
+
+            return struct.unpack(">II", header[16:24])
+
+        if header[:2] != b"\xff\xd8":
+
+            return None
+
+        file.seek(2)
+
+        while True:
+
+            marker = file.read(4)
+
+            if len(marker) < 4 or marker[0] != 0xff:
+
+                return None
+
+            length = struct.unpack(">H", marker[2:4])[0]
+
+            if marker[1] in [ 0xc0, 0xc1, 0xc2 ]:
+
+                [height, width] = struct.unpack(">xHH", file.read(5))
+
+                return ( width, height )
+
+            file.seek(length - 2, 1)
+
+def meshStats( mesh ):
+
+    #records left out by a selective import are None
+
+    if mesh is None:
+
+        return { "vertices" : 0, "loops" : 0, "faces" : 0 }
+
+    faces = blendup_json.faceCount(mesh)
+
+    if blendup_json.isFlatMesh(mesh):
+
+        vertices = len(mesh["vertices"]) // 3
+
+        loops = len(mesh["indices"])
+
+    else:
+
+        vertices = len(mesh["vertices"])
+
+        loops = sum( len(face) for face in mesh["indices"] )
+
+    return { "vertices" : vertices, "loops" : loops, "faces" : faces }
+
+def meshMaterialPairs( mesh ):
+
+    if mesh is None:
+
+        return set()
+
+    backs = mesh.get("backMaterials")
+
+    if backs is None:
+
+        backs = [ -1 ] * len(mesh["materials"])
+
+    return set( zip( [ int(m) for m in mesh["materials"] ], [ int(m) for m in backs ] ) )
+
+class Flattening:
+
+    #instance counts of the definitions and meshes once the hierarchy is flattened
+
+    def __init__ ( self, model ):
+
+        self.backMaterials = ( model["options"].get('back_materials') == 1 )
+
+        self.meshes = [ meshStats(mesh) for mesh in model["meshes"] ]
+
+        self.meshPairs = [ meshMaterialPairs(mesh) for mesh in model["meshes"] ]
+
+        self.meshInstances = [ 0 ] * len(self.meshes)
+
+        self.definitions = model.get("definitions", [])
+
+        self.definitionNames = [ definition.get("name", "#%d" % d) for d, definition in enumerate(self.definitions) ]
+
+        self.instances = [ 0 ] * len(self.definitions)
+
+        self.totals = { "objects" : 0, "vertices" : 0, "loops" : 0, "faces" : 0 }
+
+        self.pairs = set()
+
+        #flattened copies of each definition per inherited material, expanded once per definition
+
+        self.pending = [ {} for definition in self.definitions ]
+
+        self.walk( model["hierarchy"][0], 1, -1 )
+
+        for definitionId in self.definitionOrder():
+
+            for [nodeMaterial, count] in self.pending[definitionId].items():
+
+                self.instances[definitionId] += count
+
+                self.walkContent( self.definitions[definitionId], count, nodeMaterial )
+
+    def addMesh( self, meshId, count, nodeMaterial ):
+
+        self.meshInstances[meshId] += count
+
+        for key in [ "vertices", "loops", "faces" ]:
+
+            self.totals[key] += count * self.meshes[meshId][key]
+
+        #the material keys the importer creates for this mesh and its node material
+
+        for [front, back] in self.meshPairs[meshId]:
+
+            if not self.backMaterials:
+
+                back = None
+
+            self.pairs.add( (front, back) )
+
+            if nodeMaterial != -1 and ( front == -1 or back == -1 ):
+
+                self.pairs.add( ( nodeMaterial if front == -1 else front, None if back is None else ( nodeMaterial if back == -1 else back ) ) )
+
+    def walk( self, node, count, parentMaterial ):
+
+        #count is the number of flattened copies of node
+
+        nodeMaterial = node.get("material", -1)
+
+        if nodeMaterial == -1:
+
+            nodeMaterial = parentMaterial
+
+        self.totals["objects"] += count
+
+        if "definition" in node:
+
+            pending = self.pending[ node["definition"] ]
+
+            pending[nodeMaterial] = pending.get(nodeMaterial, 0) + count
+
+            return
+
+        self.walkContent( node, count, nodeMaterial )
+
+    def walkContent( self, node, count, nodeMaterial ):
+
+        if "mesh" in node:
+
+            self.addMesh( node["mesh"], count, nodeMaterial )
+
+        for child in node.get("children", []):
+
+            self.walk( child, count, nodeMaterial )
+
+    def definitionReferences( self, node, references ):
+
+        for child in node.get("children", []):
+
+            if "definition" in child:
+
+                references.add( child["definition"] )
+
+            else:
+
+                self.definitionReferences( child, references )
+
+        return references
+
+    def definitionOrder( self ):
+
+        #definitions before the ones nested in them
+
+        order = []
+
+        visited = set()
+
+        def visit( definitionId ):
+
+            visited.add(definitionId)
+
+            for nested in self.definitionReferences( self.definitions[definitionId], set() ):
+
+                if nested not in visited:
+
+                    visit(nested)
+
+            order.append(definitionId)
+
+        for definitionId in range(0, len(self.definitions)):
+
+            if definitionId not in visited:
+
+                visit(definitionId)
+
+        return reversed(order)
+
+    def definitionFaces( self ):
+
+        #flattened faces of one instance of each definition, nested definitions included
+
+        faces = {}
+
+        def contentFaces( node ):
+
+            total = self.meshes[ node["mesh"] ]["faces"] if "mesh" in node else 0
+
+            for child in node.get("children", []):
+
+                if "definition" in child:
+
+                    total += definitionFaces( child["definition"] )
+
+                else:
+
+                    total += contentFaces(child)
+
+            return total
+
+        def definitionFaces( definitionId ):
+
+            if definitionId not in faces:
+
+                faces[definitionId] = contentFaces( self.definitions[definitionId] )
+
+            return faces[definitionId]
+
+        return [ definitionFaces(d) for d in range(0, len(self.definitions)) ]
+
+    def heaviestDefinitions( self, count ):
+
+        perInstance = self.definitionFaces()
+
+        ranked = []
+
+        for d in range(0, len(self.definitions)):
+
+            if self.instances[d] == 0:
+
+                continue
+
+            ranked.append( { "name" : self.definitionNames[d], "instances" : self.instances[d],
+                             "faces" : perInstance[d], "flattenedFaces" : self.instances[d] * perInstance[d] } )
+
+        ranked.sort( key = lambda entry: -entry["flattenedFaces"] )
+
+        return ranked[:count]
+
+    def definitionMeshes( self, definitionId ):
+
+        #meshes of a definition itself, nested definitions excluded
+
+        meshes = []
+
+        nodes = [ self.definitions[definitionId] ]
+
+        while nodes:
+
+            node = nodes.pop()
+
+            if "mesh" in node:
+
+                meshes.append( node["mesh"] )
+
+            nodes.extend( child for child in node.get("children", []) if "definition" not in child )
+
+        return meshes
+
+class Analysis(Flattening):
+
+    def __init__ ( self, path, sourceDir = None ):
+
+        self.path = path
+
+        self.sourceDir = sourceDir or os.path.dirname( os.path.abspath(path) )
+
+        self.fileBytes = os.stat(path).st_size
+
+        model = blendup_json.load(path)
+
+        Flattening.__init__( self, model )
+
+        materialFile = "materials2.txt" if model["options"].get('rendering') == "Blender Cycles" else "materials.txt"
+
+        self.materialDefinitions = readMaterialDefinitions( os.path.join(self.sourceDir, materialFile) )
+
+        self.readTextures()
+
+    def readTextures( self ):
+
+        #textures of the definitions the material keys use, as the importer loads them
+
+        names = set()
+
+        ids = set()
+
+        for [front, back] in self.pairs:
+
+            ids.add( front + 1 )
+
+            if back is not None:
+
+                ids.add( back + 1 )
+
+        for id in ids:
+
+            if id < 0 or id >= len(self.materialDefinitions):
+
+                continue
+
+            for value in self.materialDefinitions[id].values():
+
+                for name in re.findall(r"Texture\w*\(([^)]*)\)", value):
+
+                    names.add( name.strip() )
+
+        self.textures = []
+
+        for name in sorted(names):
+
+            path = os.path.join( self.sourceDir, name )
+
+            if not os.path.exists(path):
+
+                self.textures.append( { "name" : name, "bytes" : 0, "pixels" : 0, "missing" : True } )
+
+                continue
+
+            size = imageSize(path)
+
+            self.textures.append( { "name" : name, "bytes" : os.stat(path).st_size, "pixels" : size[0] * size[1] if size else 0 } )
+
+    def uniqueTotals( self ):
+
+        #every mesh record is decoded and created once, however many instances share it, unused ones included
+
+        totals = { "meshes" : 0, "vertices" : 0, "loops" : 0, "faces" : 0 }
+
+        for m in range(0, len(self.meshes)):
+
+            totals["meshes"] += 1
+
+            for key in [ "vertices", "loops", "faces" ]:
+
+                totals[key] += self.meshes[m][key]
+
+        return totals
+
+    def predict( self, calibration, typed = False ):
+
+        unique = self.uniqueTotals()
+
+        objects = self.totals["objects"]
+
+        materials = len(self.pairs)
+
+        textureBytes = sum( texture["bytes"] for texture in self.textures )
+
+        pixelBytes = sum( texture["pixels"] * 4 for texture in self.textures )
+
+        decoded = typedBytes if typed else pythonBytes
+
+        #the export text, the decoded model and the Blender data all live until the end of the import
+
+        memory = { "text" : self.fileBytes * ( 1 if typed else 2 ),
+                   "decoded" : unique["vertices"] * decoded["vertex"] + unique["loops"] * decoded["loop"] + unique["faces"] * decoded["face"],
+                   "meshes" : unique["vertices"] * blenderBytes["vertex"] + unique["loops"] // 2 * blenderBytes["edge"] +
+                              unique["loops"] * blenderBytes["loop"] + unique["faces"] * blenderBytes["face"],
+                   "objects" : objects * blenderBytes["object"] + materials * blenderBytes["material"],
+                   "textures" : pixelBytes + textureBytes }
+
+        duration = { "decode" : self.fileBytes * seconds["byte"],
+                     "meshes" : unique["vertices"] * seconds["vertex"] + unique["loops"] * seconds["loop"],
+                     "objects" : objects * seconds["object"] + objects * objects * seconds["object2"],
+                     "materials" : materials * seconds["material"] + textureBytes / 1e6 * seconds["textureMB"] }
+
+        peakMB = calibration["memoryBaseMB"] + calibration["memoryScale"] * sum( memory.values() ) / 1e6
+
+        totalSeconds = calibration["timeScale"] * sum( duration.values() )
+
+        return { "peakMB" : peakMB, "seconds" : totalSeconds,
+                 "memoryMB" : dict( (k, v / 1e6) for k, v in memory.items() ), "secondsBreakdown" : duration }
+
+    def recommend( self, prediction, memoryLimitMB ):
+
+        recommendations = []
+
+        unique = self.uniqueTotals()
+
+        if prediction["peakMB"] > thresholds["memoryShare"] * memoryLimitMB or self.fileBytes / 1e6 > thresholds["streamingFileMB"]:
+
+            recommendations.append( { "mode" : "streaming", "options" : { "typed_arrays" : "array", "pipeline_depth" : 4 },
+                                      "reason" : "predicted peak %.0f MB of %.0f MB, export %.0f MB" % ( prediction["peakMB"], memoryLimitMB, self.fileBytes / 1e6 ) } )
+
+        if unique["faces"] > 0 and self.totals["faces"] > thresholds["instancingRatio"] * unique["faces"]:
+
+            recommendations.append( { "mode" : "instancing", "options" : { "static_batching" : 0 },
+                                      "reason" : "instances share meshes, batching would write %.1fx the faces" % ( self.totals["faces"] / float(unique["faces"]) ) } )
+
+        elif self.totals["objects"] > thresholds["batchingObjects"] and self.totals["faces"] < thresholds["batchingFaces"] * self.totals["objects"]:
+
+            recommendations.append( { "mode" : "static batching", "options" : { "static_batching" : 1 },
+                                      "reason" : "%d objects of %.0f faces on average" % ( self.totals["objects"], self.totals["faces"] / float(self.totals["objects"]) ) } )
+
+        largest = max( [ mesh["faces"] for mesh in self.meshes ] or [ 0 ] )
+
+        if largest > thresholds["chunkFaces"]:
+
+            recommendations.append( { "mode" : "chunking", "options" : { "chunk_mode" : "octree" },
+                                      "reason" : "largest mesh has %d faces" % largest } )
+
+        if prediction["peakMB"] > memoryLimitMB:
+
+            #nested definitions count in their parents too, only the heaviest one is a share of the total
+
+            heaviest = self.heaviestDefinitions(1)
+
+            share = heaviest[0]["flattenedFaces"] / float( max(self.totals["faces"], 1) ) if heaviest else 0.0
+
+            if share > thresholds["proxyShare"]:
+
+                recommendations.append( { "mode" : "proxy", "options" : { "lazy_meshes" : 1 },
+                                          "reason" : "over the memory limit, %.0f%% of the faces are instances of %s" % ( share * 100, heaviest[0]["name"] ) } )
+
+        return recommendations
+
+    def report( self, calibration, memoryLimitMB ):
+
+        unique = self.uniqueTotals()
+
+        prediction = self.predict(calibration)
+
+        typedPrediction = self.predict(calibration, True)
+
+        return { "export" : self.path,
+                 "fileMB" : self.fileBytes / 1e6,
+                 "meshes" : unique["meshes"],
+                 "uniqueVertices" : unique["vertices"],
+                 "uniqueLoops" : unique["loops"],
+                 "uniqueFaces" : unique["faces"],
+                 "objects" : self.totals["objects"],
+                 "flattenedVertices" : self.totals["vertices"],
+                 "flattenedLoops" : self.totals["loops"],
+                 "flattenedFaces" : self.totals["faces"],
+                 "definitions" : len(self.definitions),
+                 "materialPairs" : len(self.pairs),
+                 "textures" : len(self.textures),
+                 "textureMB" : sum( texture["bytes"] for texture in self.textures ) / 1e6,
+                 "missingTextures" : [ texture["name"] for texture in self.textures if texture.get("missing") ],
+                 "heaviestDefinitions" : self.heaviestDefinitions(10),
+                 "prediction" : prediction,
+                 "typedPrediction" : typedPrediction,
+                 "recommendations" : self.recommend( prediction, memoryLimitMB ) }
+
+def loadCalibration( path ):
+
+    calibration = { "timeScale" : 1.0, "memoryScale" : 1.0, "memoryBaseMB" : 200.0 }
+
+    if path and os.path.exists(path):
+
+        with open(path) as file:
+
+            calibration.update( json.load(file) )
+
+    return calibration
+
+def fitLine( xs, ys ):
+
+    #least squares y = a * x + b, through the origin below two distinct points
+
+    n = len(xs)
+
+    if n == 0:
+
+        return [ 1.0, 0.0 ]
+
+    meanX = sum(xs) / n
+
+    meanY = sum(ys) / n
+
+    variance = sum( (x - meanX) ** 2 for x in xs )
+
+    if n < 2 or variance == 0:
+
+        return [ sum( x * y for x, y in zip(xs, ys) ) / max( sum( x * x for x in xs ), 1e-12 ), 0.0 ]
+
+    a = sum( (x - meanX) * (y - meanY) for x, y in zip(xs, ys) ) / variance
+
+    return [ a, meanY - a * meanX ]
+
+def calibrate( logPath, outputPath ):
+
+    #fits the predictions of the raw cost model to the jobs of a batch log
+
+    raw = { "timeScale" : 1.0, "memoryScale" : 1.0, "memoryBaseMB" : 0.0 }
+
+    predictedSeconds = []
+
+    actualSeconds = []
+
+    predictedMB = []
+
+    actualMB = []
+
+    with open(logPath) as file:
+
+        for line in file:
+
+            result = json.loads(line)
+
+            if result.get("status") != "ok" or not os.path.exists( result.get("export", "") ):
+
+                continue
+
+            prediction = Analysis( result["export"] ).predict(raw)
+
+            if "seconds" in result and "import" in result["seconds"]:
+
+                predictedSeconds.append( prediction["seconds"] )
+
+                actualSeconds.append( result["seconds"]["import"] )
+
+            if result.get("peakMB", 0) > 0:
+
+                predictedMB.append( prediction["peakMB"] )
+
+                actualMB.append( result["peakMB"] )
+
+    timeScale = fitLine( predictedSeconds, actualSeconds )[0] if actualSeconds else 1.0
+
+    [memoryScale, memoryBaseMB] = fitLine( predictedMB, actualMB ) if actualMB else [ 1.0, 200.0 ]
+
+    #a negative base means too few jobs to separate Blender's own memory from the export's
+
+    if memoryBaseMB < 0 or memoryScale <= 0:
+
+        [memoryScale, memoryBaseMB] = [ fitLine( predictedMB, [ y - 200.0 for y in actualMB ] )[0] if actualMB else 1.0, 200.0 ]
+
+    calibration = { "timeScale" : timeScale, "memoryScale" : memoryScale, "memoryBaseMB" : memoryBaseMB,
+                    "jobs" : max( len(actualSeconds), len(actualMB) ) }
+
+    with open(outputPath, 'w') as file:
+
+        json.dump(calibration, file, indent = 2, sort_keys = True)
+
+    return calibration
+
+def systemMemoryMB():
+
+    try:
+
+        with open("/proc/meminfo") as file:
+
+            for line in file:
+
+                if line.startswith("MemTotal:"):
+
+                    return int( line.split()[1] ) / 1024.0
+
+    except (IOError, OSError):
+
+        pass
+
+    return 8192.0
+
+def printReport( report ):
+
+    prediction = report["prediction"]
+
+    print( "BlendUp analysis of %s (%.1f MB)" % ( report["export"], report["fileMB"] ) )
+
+    print( "  meshes %d, definitions %d, objects %d, material pairs %d" % ( report["meshes"], report["definitions"], report["objects"], report["materialPairs"] ) )
+
+    print( "  unique    vertices %d, loops %d, faces %d" % ( report["uniqueVertices"], report["uniqueLoops"], report["uniqueFaces"] ) )
+
+    print( "  flattened vertices %d, loops %d, faces %d" % ( report["flattenedVertices"], report["flattenedLoops"], report["flattenedFaces"] ) )
+
+    print( "  textures %d, %.1f MB%s" % ( report["textures"], report["textureMB"], ( ", missing: " + ", ".join(report["missingTextures"]) ) if report["missingTextures"] else "" ) )
+
+    print( "  predicted peak %.0f MB (%.0f MB with typed arrays), import %.1f s" %
+           ( prediction["peakMB"], report["typedPrediction"]["peakMB"], prediction["seconds"] ) )
+
+    print( "    memory MB: " + ", ".join( "%s %.0f" % (k, v) for k, v in sorted( prediction["memoryMB"].items() ) ) )
+
+    print( "    seconds:   " + ", ".join( "%s %.1f" % (k, v) for k, v in sorted( prediction["secondsBreakdown"].items() ) ) )
+
+    if report["heaviestDefinitions"]:
+
+        print( "  heaviest definitions:" )
+
+        for entry in report["heaviestDefinitions"]:
+
+            print( "    %-40s %6d x %8d faces = %10d" % ( entry["name"][:40], entry["instances"], entry["faces"], entry["flattenedFaces"] ) )
+
+    for recommendation in report["recommendations"]:
+
+        print( "  recommend %s %s: %s" % ( recommendation["mode"], json.dumps(recommendation["options"], sort_keys = True), recommendation["reason"] ) )
+
+def main( argv ):
+
+    parser = argparse.ArgumentParser( description = "Predict the cost of a BlendUp import without Blender" )
+
+    parser.add_argument( "--calibration", default = defaultCalibration, help = "cost model scales written by calibrate" )
+
+    subparsers = parser.add_subparsers( dest = "command" )
+
+    analyzeParser = subparsers.add_parser( "analyze", help = "counts, predictions and recommended modes of exports" )
+
+    analyzeParser.add_argument( "exports", nargs = "+" )
+
+    analyzeParser.add_argument( "--memory", type = float, default = 0, help = "RAM of the import machine in MB, this machine by default" )
+
+    analyzeParser.add_argument( "--json", action = "store_true", help = "print the reports as JSON" )
+
+    calibrateParser = subparsers.add_parser( "calibrate", help = "fit the cost model to a blendup_batch.py log" )
+
+    calibrateParser.add_argument( "log" )
+
+    arguments = parser.parse_args(argv)
+
+    if arguments.command == "analyze":
+
+        calibration = loadCalibration( arguments.calibration )
+
+        memoryLimitMB = arguments.memory or systemMemoryMB()
+
+        reports = [ Analysis(path).report( calibration, memoryLimitMB ) for path in arguments.exports ]
+
+        if arguments.json:
+
+            print( json.dumps( reports, indent = 2, sort_keys = True ) )
+
+        else:
+
+            for report in reports:
+
+                printReport(report)
+
+        return 0
+
+    if arguments.command == "calibrate":
+
+        calibration = calibrate( arguments.log, arguments.calibration )
+
+        print( "BlendUp calibration from %d jobs: time x%.3f, memory x%.3f + %.0f MB" %
+               ( calibration["jobs"], calibration["timeScale"], calibration["memoryScale"], calibration["memoryBaseMB"] ) )
+
+        return 0
+
+    parser.print_help()
+
+    return 1
+
+if __name__ == "__main__":
+
+    sys.exit( main( sys.argv[1:] ) )
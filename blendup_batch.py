@@ -0,0 +1,452 @@
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# Spread3D BlendUp headless batch conversion
+#
+# Supervisor, run with a plain python:
+#
+#   python blendup_batch.py --blender /opt/blender/blender --workers 4 \
+#       --output /data/blends --log results.jsonl /data/exports
+#
+# The input is a directory searched for exports (a .json file next to a
+# materials.txt or materials2.txt) or a manifest with one export path or
+# one JSON job {"export": ..., "output": ..., "options": {...}} per line.
+#
+# Each worker is a "blender --background" process running this same file
+# with --worker; it imports and saves jobs read from stdin until it is
+# recycled after --jobs-per-worker jobs.
+
+import argparse
+import importlib.util
+import json
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+resultPrefix = "BLENDUP_RESULT "
+
+scriptDir = os.path.dirname( os.path.abspath(__file__) )
+
+#supervisor side
+
+def isExport( path ):
+
+    directory = os.path.dirname(path)
+
+    return path.endswith(".json") and ( os.path.exists( os.path.join(directory, "materials2.txt") ) or
+                                        os.path.exists( os.path.join(directory, "materials.txt") ) )
+
+def findJobs( source, outputDir ):
+
+    jobs = []
+
+    if os.path.isdir(source):
+
+        for root, dirs, files in os.walk(source):
+
+            dirs.sort()
+
+            for name in sorted(files):
+
+                path = os.path.join(root, name)
+
+                if isExport(path):
+                    jobs.append( { "export" : path } )
+
+    else:
+
+        with open(source) as file:
+
+            for line in file:
+
+                line = line.strip()
+
+                if line == "" or line.startswith("#"):
+                    continue
+
+                if line.startswith("{"):
+                    jobs.append( json.loads(line) )
+                else:
+                    jobs.append( { "export" : line } )
+
+    for job in jobs:
+
+        job["export"] = os.path.abspath( job["export"] )
+
+        if "output" not in job:
+
+            name = os.path.splitext( os.path.basename(job["export"]) )[0]
+
+            #exports are often all called model.json, name the blend after their folder then
+
+            if name == "model":
+                name = os.path.basename( os.path.dirname(job["export"]) )
+
+            job["output"] = os.path.join( outputDir, name + ".blend" )
+
+    return jobs
+
+def residentMemory( pid ):
+
+    #current resident set size in MB, from /proc
+
+    rss = 0.0
+
+    try:
+        with open("/proc/%d/status" % pid) as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    rss = int( line.split()[1] ) / 1024.0
+    except (IOError, OSError):
+        pass
+
+    return rss
+
+class Worker:
+
+    def __init__ ( self, arguments ):
+
+        command = [ arguments.blender, "--background", "--factory-startup", "--python", os.path.abspath(__file__),
+                    "--", "--worker", "--importer", arguments.importer ]
+
+        if arguments.template:
+            command += [ "--template", arguments.template ]
+
+        self.process = subprocess.Popen( command, stdin = subprocess.PIPE, stdout = subprocess.PIPE,
+                                         stderr = subprocess.STDOUT, universal_newlines = True, bufsize = 1 )
+
+        self.jobsDone = 0
+
+        self.lines = queue.Queue()
+
+        self.output = []
+
+        reader = threading.Thread( target = self.readLines )
+
+        reader.daemon = True
+
+        reader.start()
+
+    def readLines( self ):
+
+        for line in self.process.stdout:
+
+            self.lines.put(line)
+
+        self.lines.put(None)
+
+    def run( self, job, timeout, memoryLimit ):
+
+        #sends one job and waits for its result, enforcing the time and memory limits
+
+        self.output = []
+
+        self.process.stdin.write( json.dumps(job) + "\n" )
+
+        self.process.stdin.flush()
+
+        start = time.time()
+
+        peak = 0.0
+
+        while True:
+
+            peak = max( peak, residentMemory(self.process.pid) )
+
+            if memoryLimit > 0 and peak > memoryLimit:
+
+                self.kill()
+
+                return { "status" : "memory", "error" : "resident memory above %d MB" % memoryLimit, "peakMB" : peak }
+
+            if timeout > 0 and time.time() - start > timeout:
+
+                self.kill()
+
+                return { "status" : "timeout", "error" : "no result after %d s" % timeout, "peakMB" : peak }
+
+            try:
+                line = self.lines.get( timeout = 0.5 )
+            except queue.Empty:
+                continue
+
+            if line is None:
+
+                return { "status" : "crash", "error" : "".join( self.output[-20:] ), "peakMB" : peak }
+
+            if line.startswith(resultPrefix):
+
+                self.jobsDone += 1
+
+                result = json.loads( line[len(resultPrefix):] )
+
+                result["peakMB"] = peak
+
+                return result
+
+            self.output.append(line)
+
+    def stop( self ):
+
+        try:
+            self.process.stdin.write( json.dumps( { "command" : "quit" } ) + "\n" )
+            self.process.stdin.flush()
+            self.process.wait( timeout = 30 )
+        except Exception:
+            self.kill()
+
+    def kill( self ):
+
+        self.process.kill()
+
+        self.process.wait()
+
+def runWorkerSlot( arguments, jobs, log, logLock, results ):
+
+    worker = None
+
+    while True:
+
+        try:
+            job = jobs.get_nowait()
+        except queue.Empty:
+            break
+
+        if worker is None:
+            worker = Worker(arguments)
+
+        start = time.time()
+
+        result = worker.run( job, arguments.timeout, arguments.memory )
+
+        result["export"] = job["export"]
+
+        result["output"] = job["output"]
+
+        result["worker"] = worker.process.pid
+
+        result["wallSeconds"] = round( time.time() - start, 3 )
+
+        with logLock:
+
+            log.write( json.dumps(result, sort_keys = True) + "\n" )
+
+            log.flush()
+
+            results.append(result)
+
+            print( "%-8s %7.1fs  %s" % ( result["status"], result["wallSeconds"], job["export"] ) )
+
+        #killed or crashed workers are replaced, healthy ones recycled after a number of jobs
+
+        if worker.process.poll() is not None:
+
+            worker = None
+
+        elif worker.jobsDone >= arguments.jobs_per_worker:
+
+            worker.stop()
+
+            worker = None
+
+    if worker is not None:
+        worker.stop()
+
+def runSupervisor( arguments ):
+
+    jobs = findJobs( arguments.source, arguments.output )
+
+    if not os.path.isdir(arguments.output):
+        os.makedirs(arguments.output)
+
+    pending = queue.Queue()
+
+    for job in jobs:
+        pending.put(job)
+
+    logLock = threading.Lock()
+
+    results = []
+
+    start = time.time()
+
+    with open(arguments.log, 'a') as log:
+
+        slots = []
+
+        for i in range( 0, min( arguments.workers, max(len(jobs), 1) ) ):
+
+            slot = threading.Thread( target = runWorkerSlot, args = (arguments, pending, log, logLock, results) )
+
+            slot.start()
+
+            slots.append(slot)
+
+        for slot in slots:
+            slot.join()
+
+    failed = len( [ result for result in results if result["status"] != "ok" ] )
+
+    print( "%d jobs, %d failed, %.1fs" % ( len(jobs), failed, time.time() - start ) )
+
+    return 1 if failed > 0 else 0
+
+#worker side, runs inside blender --background
+
+def loadImporter( path ):
+
+    spec = importlib.util.spec_from_file_location( "blendup_import", path )
+
+    module = importlib.util.module_from_spec(spec)
+
+    spec.loader.exec_module(module)
+
+    return module
+
+def resetScene( template ):
+
+    import bpy
+
+    if template:
+
+        bpy.ops.wm.open_mainfile( filepath = template )
+
+    else:
+
+        bpy.ops.wm.read_factory_settings()
+
+        cube = bpy.data.objects.get("Cube")
+
+        if cube is not None:
+
+            bpy.context.scene.objects.unlink(cube)
+
+            bpy.data.objects.remove(cube)
+
+def convert( importer, job, template ):
+
+    import bpy
+
+    timings = {}
+
+    start = time.time()
+
+    resetScene(template)
+
+    timings["reset"] = time.time() - start
+
+    start = time.time()
+
+    skp = importer.Skp2Blend( job.get("options") )
+
+    skp.importJSON( job["export"], os.path.dirname(job["export"]) )
+
+    skp.end()
+
+    timings["import"] = time.time() - start
+
+    start = time.time()
+
+    outputDir = os.path.dirname(job["output"])
+
+    if outputDir and not os.path.isdir(outputDir):
+        os.makedirs(outputDir)
+
+    bpy.ops.wm.save_as_mainfile( filepath = job["output"], check_existing = False )
+
+    timings["save"] = time.time() - start
+
+    return timings
+
+def runWorker( arguments ):
+
+    importer = loadImporter( arguments.importer )
+
+    for line in sys.stdin:
+
+        job = json.loads(line)
+
+        if job.get("command") == "quit":
+            break
+
+        try:
+
+            timings = convert( importer, job, arguments.template )
+
+            result = { "status" : "ok", "seconds" : dict( (k, round(v, 3)) for k, v in timings.items() ) }
+
+        except Exception as e:
+
+            result = { "status" : "error", "error" : "%s: %s" % ( type(e).__name__, e ) }
+
+        sys.stdout.write( resultPrefix + json.dumps(result) + "\n" )
+
+        sys.stdout.flush()
+
+def main( argv ):
+
+    parser = argparse.ArgumentParser( description = "Convert BlendUp exports to .blend files with a pool of Blender workers" )
+
+    parser.add_argument( "source", nargs = "?", help = "directory of exports or manifest file" )
+
+    parser.add_argument( "--blender", default = "blender", help = "Blender executable" )
+
+    parser.add_argument( "--importer", default = os.path.join(scriptDir, "import.py"), help = "path of import.py" )
+
+    parser.add_argument( "--template", default = "", help = ".blend opened before each job instead of the factory scene" )
+
+    parser.add_argument( "--output", default = "blends", help = "directory of the saved .blend files" )
+
+    parser.add_argument( "--log", default = "blendup_batch.jsonl", help = "per job result log" )
+
+    parser.add_argument( "--workers", type = int, default = 2 )
+
+    parser.add_argument( "--jobs-per-worker", type = int, default = 20, help = "jobs before a worker process is recycled" )
+
+    parser.add_argument( "--timeout", type = float, default = 1800, help = "seconds allowed per job, 0 for none" )
+
+    parser.add_argument( "--memory", type = float, default = 0, help = "resident MB allowed per worker, 0 for none" )
+
+    parser.add_argument( "--worker", action = "store_true", help = argparse.SUPPRESS )
+
+    arguments = parser.parse_args(argv)
+
+    if arguments.worker:
+
+        runWorker(arguments)
+
+        return 0
+
+    if arguments.source is None:
+
+        parser.error("an export directory or manifest is required")
+
+    return runSupervisor(arguments)
+
+if __name__ == "__main__":
+
+    #inside Blender our arguments follow "--"
+
+    argv = sys.argv[1:]
+
+    if "--" in sys.argv:
+        argv = sys.argv[ sys.argv.index("--") + 1 : ]
+
+    code = main(argv)
+
+    if "--worker" not in argv:
+        sys.exit(code)
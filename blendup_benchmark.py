@@ -0,0 +1,658 @@
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# Spread3D BlendUp benchmarks on synthetic exports
+#
+#   python blendup_benchmark.py decoders [--scales small,medium] [--repeat 3]
+#   python blendup_benchmark.py container [--scales small,medium] [--repeat 3] [--threads 4]
+#
+# Regression gate of the importer, run in Blender (started with --blender from a
+# plain python, or inside "blender --background --python blendup_benchmark.py --"):
+#
+#   python blendup_benchmark.py baseline --output baseline.json [--scales small,medium] [--samples a.json,b.bup]
+#   python blendup_benchmark.py check --baseline baseline.json [--tolerance 0.1] [--noise 3]
+#
+# baseline imports each synthetic scale and sample --repeat times and stores the
+# median and spread of importJSON and of each import phase, the peak traced
+# memory and the datablocks created. check imports the same exports with the
+# same options and exits with 1 when a time exceeds its baseline median by more
+# than the tolerance plus --noise times the larger spread of the two runs.
+
+import argparse
+import gc
+import hashlib
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append( os.path.dirname( os.path.abspath(__file__) ) )
+
+import blendup_json
+import blendup_container
+import blendup_batch
+
+baselineVersion = 1
+
+resultPrefix = "BLENDUP_BENCHMARK "
+
+#datablock collections counted after each import
+
+datablockCollections = [ "objects", "meshes", "materials", "images", "textures", "node_groups", "cameras", "lamps" ]
+
+#definitions, grid resolution of each definition mesh, instances
+
+scales = { "small" : ( 10, 10, 100 ),
+           "medium" : ( 50, 30, 1000 ),
+           "large" : ( 100, 50, 5000 ) }
+
+def makeGridMesh( size, materialId ):
+
+    vertices = []
+
+    indices = []
+
+    normals = []
+
+    uvs = []
+
+    edges = []
+
+    for j in range(0, size + 1):
+        for i in range(0, size + 1):
+            vertices.append( [ float(i), float(j), math.sin(i * 0.3) * math.cos(j * 0.3) ] )
+
+    for j in range(0, size):
+        for i in range(0, size):
+
+            a = j * (size + 1) + i
+
+            face = [ a, a + 1, a + size + 2, a + size + 1 ]
+
+            indices.append(face)
+
+            for v in face:
+
+                normals.append( [ 0.0, 0.0, 1.0 ] )
+
+                uvs.append( [ vertices[v][0] / size, vertices[v][1] / size ] )
+
+                edges.append( 1 if i == 0 or j == 0 else 0 )
+
+    nbFaces = len(indices)
+
+    return { "vertices" : vertices,
+             "indices" : indices,
+             "normals" : normals,
+             "uvs" : uvs,
+             "edges" : edges,
+             "materials" : [ materialId ] * nbFaces,
+             "backMaterials" : [ -1 ] * nbFaces }
+
+def makeSyntheticExport( directory, scale ):
+
+    #writes model.json and materials files in directory, returns the export path
+
+    [nbDefinitions, gridSize, nbInstances] = scales[scale]
+
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    nbMaterials = 8
+
+    meshes = [ makeGridMesh( gridSize, d % nbMaterials ) for d in range(0, nbDefinitions) ]
+
+    definitions = [ { "name" : "Component#%d" % d, "mesh" : d } for d in range(0, nbDefinitions) ]
+
+    children = []
+
+    side = int( math.ceil( math.sqrt(nbInstances) ) )
+
+    for k in range(0, nbInstances):
+
+        x = (k % side) * (gridSize + 2)
+
+        y = (k // side) * (gridSize + 2)
+
+        children.append( { "name" : "Instance%d" % k,
+                           "matrix" : [ 1,0,0,0, 0,1,0,0, 0,0,1,0, x,y,0,1 ],
+                           "material" : -1,
+                           "definition" : k % nbDefinitions } )
+
+    hierarchy = [ { "name" : "Model", "matrix" : [ 1,0,0,0, 0,1,0,0, 0,0,1,0, 0,0,0,1 ], "material" : -1, "children" : children } ]
+
+    extent = side * (gridSize + 2)
+
+    views = [ { "name" : "Scene 1", "mode" : "perspective", "fov" : 35.0,
+                "eye" : [ -extent * 0.2, -extent * 0.2, extent * 0.3 ],
+                "target" : [ extent * 0.5, extent * 0.5, 0.0 ],
+                "up" : [ 0.0, 0.0, 1.0 ] } ]
+
+    options = { "rendering" : "Blender Cycles", "shadow" : 0, "shadowX" : 0, "shadowY" : 0, "shadowZ" : 1,
+                "vpWidth" : 1280, "vpHeight" : 720, "samples" : 16, "back_materials" : 0,
+                "use_sharp_edge" : 1, "use_seam" : 0, "use_freestyle_mark" : 0, "unit" : "m" }
+
+    model = { "options" : options, "meshes" : meshes, "hierarchy" : hierarchy, "definitions" : definitions, "views" : views }
+
+    path = os.path.join( directory, "model.json" )
+
+    with open(path, 'w') as file:
+        json.dump(model, file)
+
+    lines = [ "Name=Default;Type=BlendUpDiffuse;Color=Color(200,200,200)\n" ]
+
+    for m in range(0, nbMaterials):
+        lines.append( "Name=Material%d;Type=BlendUpDiffuse;Color=Color(%d,%d,%d);Roughness=0.2\n" % ( m, 30 * m, 255 - 30 * m, 128 ) )
+
+    for name in [ "materials.txt", "materials2.txt" ]:
+
+        with open( os.path.join(directory, name), 'w' ) as file:
+            file.writelines(lines)
+
+    return path
+
+def syntheticExport( directory, scale ):
+
+    path = os.path.join( directory, scale, "model.json" )
+
+    if not os.path.exists(path):
+        path = makeSyntheticExport( os.path.join(directory, scale), scale )
+
+    return path
+
+def measure( function, repeat ):
+
+    #best wall time over repeat runs, then one traced run for the peak
+
+    times = []
+
+    for r in range(0, repeat):
+
+        gc.collect()
+
+        start = time.perf_counter()
+
+        result = function()
+
+        times.append( time.perf_counter() - start )
+
+        del result
+
+    gc.collect()
+
+    tracemalloc.start()
+
+    result = function()
+
+    peak = tracemalloc.get_traced_memory()[1]
+
+    tracemalloc.stop()
+
+    del result
+
+    return min(times), peak
+
+def benchmarkDecoders( arguments ):
+
+    typedModes = [ None, "array" ]
+
+    if blendup_json.numpy is not None:
+        typedModes.append("numpy")
+
+    print( "%-8s %-10s %-7s %10s %12s %10s" % ( "scale", "backend", "typed", "size MB", "parse s", "peak MB" ) )
+
+    for scale in arguments.scales.split(","):
+
+        path = syntheticExport( arguments.dir, scale )
+
+        with open(path, 'rb') as file:
+            data = file.read()
+
+        for backend in blendup_json.availableBackends():
+
+            for typed in typedModes:
+
+                [seconds, peak] = measure( lambda: blendup_json.loads(data, backend, typed), arguments.repeat )
+
+                print( "%-8s %-10s %-7s %10.1f %12.3f %10.1f" % ( scale, backend, typed or "-", len(data) / 1e6, seconds, peak / 1e6 ) )
+
+def benchmarkContainer( arguments ):
+
+    #size and load time of the containers against the JSON export they come from
+
+    configurations = [ ( "zlib", 0, 0 ), ( "lzma", 0, 0 ) ]
+
+    if blendup_container.numpy is not None:
+        configurations += [ ( "zlib", 16, 16 ), ( "lzma", 16, 16 ) ]
+
+    typed = "numpy" if blendup_json.numpy is not None else "array"
+
+    print( "%-8s %-16s %10s %8s %10s %10s %10s %10s %12s" % ( "scale", "format", "size MB", "ratio", "write s", "load s", "mesh ms", "peak MB", "max error" ) )
+
+    for scale in arguments.scales.split(","):
+
+        path = syntheticExport( arguments.dir, scale )
+
+        size = os.path.getsize(path)
+
+        [seconds, peak] = measure( lambda: blendup_json.load(path, None, typed), arguments.repeat )
+
+        print( "%-8s %-16s %10.2f %8s %10s %10.3f %10s %10.1f %12s" % ( scale, "json", size / 1e6, "1.0", "-", seconds, "-", peak / 1e6, "-" ) )
+
+        for [codec, positionBits, normalBits] in configurations:
+
+            name = "%s p%d n%d" % ( codec, positionBits, normalBits )
+
+            output = os.path.join( os.path.dirname(path), "model-%s-%d-%d.bup" % ( codec, positionBits, normalBits ) )
+
+            start = time.perf_counter()
+
+            stats = blendup_container.convertExport( path, output, codec, None, positionBits, normalBits, arguments.threads )
+
+            written = time.perf_counter() - start
+
+            def load():
+
+                with blendup_container.Container(output) as container:
+
+                    return container.loadModel( True, typed, arguments.threads )
+
+            def loadMesh():
+
+                with blendup_container.Container(output) as container:
+
+                    return container.loadMesh( container.toc["meshes"] // 2, typed )
+
+            [seconds, peak] = measure( load, arguments.repeat )
+
+            [meshSeconds, meshPeak] = measure( loadMesh, arguments.repeat )
+
+            print( "%-8s %-16s %10.2f %8.1f %10.2f %10.3f %10.2f %10.1f %12.3g" %
+                   ( scale, name, stats["containerBytes"] / 1e6, size / float( stats["containerBytes"] ), written, seconds, meshSeconds * 1000, peak / 1e6, stats["positionError"] ) )
+
+def fileDigest( path ):
+
+    with open(path, 'rb') as file:
+
+        return hashlib.sha1( file.read() ).hexdigest()
+
+def summarize( values ):
+
+    #median and median absolute deviation of repeated timings
+
+    median = statistics.median(values)
+
+    return { "median" : median,
+             "spread" : statistics.median( [ abs( value - median ) for value in values ] ),
+             "runs" : [ round( value, 6 ) for value in values ] }
+
+def countDatablocks( bpy ):
+
+    return dict( ( name, len( getattr( bpy.data, name ) ) ) for name in datablockCollections if hasattr( bpy.data, name ) )
+
+def importOnce( importer, bpy, path, options ):
+
+    #seconds of importJSON with end, seconds per phase and datablocks created by one import into a reset scene
+
+    blendup_batch.resetScene(None)
+
+    gc.collect()
+
+    before = countDatablocks(bpy)
+
+    start = time.perf_counter()
+
+    skp = importer.Skp2Blend( dict(options) )
+
+    skp.importJSON( path, os.path.dirname(path) )
+
+    skp.end()
+
+    seconds = { "importJSON" : time.perf_counter() - start }
+
+    #phases run once per mesh or batch are summed
+
+    for record in skp.memory.phases:
+
+        seconds[ record["name"] ] = seconds.get( record["name"], 0.0 ) + record["seconds"]
+
+    after = countDatablocks(bpy)
+
+    datablocks = dict( ( name, after[name] - before.get(name, 0) ) for name in after )
+
+    peak = max( [ record.get("peak", 0) for record in skp.memory.phases ] + [ 0 ] )
+
+    return seconds, datablocks, peak
+
+def measureImports( cases, repeat, options, importerPath ):
+
+    #inside Blender: medians over repeat untraced imports, then one traced import for the peak
+
+    import bpy
+
+    importer = blendup_batch.loadImporter(importerPath)
+
+    results = {}
+
+    for [key, path] in cases:
+
+        runs = []
+
+        for r in range(0, repeat):
+
+            [seconds, datablocks, peak] = importOnce( importer, bpy, path, options )
+
+            runs.append(seconds)
+
+        traced = dict(options)
+
+        traced["memory_report"] = 1
+
+        peak = importOnce( importer, bpy, path, traced )[2]
+
+        phases = {}
+
+        for name in runs[0]:
+
+            phases[name] = summarize( [ run.get(name, 0.0) for run in runs ] )
+
+        results[key] = { "path" : path, "phases" : phases, "peakMB" : peak / 1e6, "datablocks" : datablocks }
+
+    return results
+
+def runImports( arguments, cases, options ):
+
+    #in this process inside Blender, else in a background Blender reporting one result line per case
+
+    try:
+        import bpy
+    except ImportError:
+        bpy = None
+
+    if bpy is not None:
+        return measureImports( cases, arguments.repeat, options, arguments.importer )
+
+    command = [ arguments.blender, "--background", "--factory-startup", "--python", os.path.abspath(__file__), "--",
+                "--dir", arguments.dir, "measure", "--importer", arguments.importer, "--repeat", str(arguments.repeat),
+                "--options", json.dumps(options) ] + [ "%s=%s" % ( key, path ) for [key, path] in cases ]
+
+    try:
+        process = subprocess.Popen( command, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, universal_newlines = True )
+    except OSError as e:
+        raise NameError("Cannot run Blender %s: %s" % ( arguments.blender, e ))
+
+    output = process.communicate()[0].splitlines()
+
+    results = {}
+
+    for line in output:
+
+        if line.startswith(resultPrefix):
+
+            result = json.loads( line[len(resultPrefix):] )
+
+            results[ result["key"] ] = result["result"]
+
+    missing = [ key for [key, path] in cases if key not in results ]
+
+    if process.returncode != 0 or missing:
+        raise NameError("Blender stopped before measuring %s:\n%s" % ( ", ".join(missing) or "all the exports", "\n".join( output[-20:] ) ))
+
+    return results
+
+def benchmarkCases( arguments ):
+
+    cases = [ ( "synthetic:" + scale, syntheticExport( arguments.dir, scale ) ) for scale in arguments.scales.split(",") if scale ]
+
+    for path in arguments.samples.split(","):
+
+        if path:
+
+            if not os.path.exists(path):
+                raise NameError("Sample %s does not exist" % path)
+
+            cases.append( ( "sample:" + path, os.path.abspath(path) ) )
+
+    return cases
+
+def recordBaseline( arguments ):
+
+    options = json.loads(arguments.options)
+
+    cases = benchmarkCases(arguments)
+
+    results = runImports( arguments, cases, options )
+
+    baseline = { "version" : baselineVersion,
+                 "created" : time.strftime("%Y-%m-%d %H:%M:%S"),
+                 "machine" : "%s %s, python %s" % ( platform.node(), platform.machine(), platform.python_version() ),
+                 "importer" : fileDigest(arguments.importer),
+                 "repeat" : arguments.repeat,
+                 "options" : options,
+                 "scales" : arguments.scales,
+                 "samples" : arguments.samples,
+                 "results" : results }
+
+    with open(arguments.output, 'w') as file:
+        json.dump( baseline, file, indent = 1, sort_keys = True )
+
+    print( "BlendUp benchmark baseline: %d exports, %d runs each, written to %s" % ( len(cases), arguments.repeat, arguments.output ) )
+
+    return 0
+
+def compareResults( baseline, results, tolerance, noise, minimum ):
+
+    #report lines and number of regressions, a time regresses above median + tolerance + noise * spread
+
+    lines = [ "%-24s %-12s %10s %10s %8s %8s" % ( "export", "phase", "baseline", "current", "change", "limit" ) ]
+
+    regressions = 0
+
+    for key in sorted( baseline["results"] ):
+
+        base = baseline["results"][key]
+
+        current = results[key]
+
+        for name in sorted( base["phases"], key = lambda name: ( name != "importJSON", name ) ):
+
+            if name not in current["phases"]:
+
+                lines.append( "%-24s %-12s %9.3fs %10s  phase no longer run" % ( key, name, base["phases"][name]["median"], "-" ) )
+
+                continue
+
+            before = base["phases"][name]
+
+            after = current["phases"][name]
+
+            margin = max( before["median"] * tolerance + noise * max( before["spread"], after["spread"] ), minimum )
+
+            change = after["median"] - before["median"]
+
+            status = ""
+
+            if change > margin:
+
+                status = "  REGRESSION"
+
+                regressions += 1
+
+            elif change < -margin:
+
+                status = "  faster"
+
+            lines.append( "%-24s %-12s %9.3fs %9.3fs %+7.1f%% %+7.1f%%%s" %
+                          ( key, name, before["median"], after["median"], 100.0 * change / max( before["median"], 1e-9 ),
+                            100.0 * margin / max( before["median"], 1e-9 ), status ) )
+
+        for name in sorted( set( current["phases"] ) - set( base["phases"] ) ):
+
+            lines.append( "%-24s %-12s %10s %9.3fs  new phase" % ( key, name, "-", current["phases"][name]["median"] ) )
+
+        lines.append( "%-24s %-12s %8.1fMB %8.1fMB %+7.1f%%" % ( key, "peak memory", base["peakMB"], current["peakMB"],
+                                                               100.0 * ( current["peakMB"] - base["peakMB"] ) / max( base["peakMB"], 1e-9 ) ) )
+
+        for name in sorted( set( base["datablocks"] ) | set( current["datablocks"] ) ):
+
+            if base["datablocks"].get(name) != current["datablocks"].get(name):
+
+                lines.append( "%-24s %-12s %10s %10s  datablocks changed" % ( key, name, base["datablocks"].get(name, "-"), current["datablocks"].get(name, "-") ) )
+
+    return lines, regressions
+
+def checkBaseline( arguments ):
+
+    with open(arguments.baseline) as file:
+        baseline = json.load(file)
+
+    if baseline.get("version") != baselineVersion:
+        raise NameError("Baseline %s has version %s, this benchmark reads version %d, record it again" % ( arguments.baseline, baseline.get("version"), baselineVersion ))
+
+    #the exports and options of the baseline, the repeat count of this run
+
+    arguments.scales = baseline["scales"]
+
+    arguments.samples = baseline["samples"]
+
+    cases = benchmarkCases(arguments)
+
+    results = runImports( arguments, cases, baseline["options"] )
+
+    print( "BlendUp benchmark check against %s (%s, %s)" % ( arguments.baseline, baseline["created"], baseline["machine"] ) )
+
+    if fileDigest(arguments.importer) != baseline["importer"]:
+        print( "  import.py changed since the baseline" )
+
+    [lines, regressions] = compareResults( baseline, results, arguments.tolerance, arguments.noise, arguments.min_seconds )
+
+    for line in lines:
+        print(line)
+
+    print( "%d regressions" % regressions )
+
+    return 1 if regressions > 0 else 0
+
+def main( argv ):
+
+    parser = argparse.ArgumentParser( description = "BlendUp importer benchmarks" )
+
+    parser.add_argument( "--dir", default = os.path.join( tempfile.gettempdir(), "blendup_benchmark" ), help = "where synthetic exports are generated" )
+
+    subparsers = parser.add_subparsers( dest = "command" )
+
+    decoders = subparsers.add_parser( "decoders", help = "parse time and peak memory per JSON backend" )
+
+    decoders.add_argument( "--scales", default = "small,medium" )
+
+    decoders.add_argument( "--repeat", type = int, default = 3 )
+
+    container = subparsers.add_parser( "container", help = "size and load time of compressed containers against JSON" )
+
+    container.add_argument( "--scales", default = "small,medium" )
+
+    container.add_argument( "--repeat", type = int, default = 3 )
+
+    container.add_argument( "--threads", type = int, default = None, help = "decompression threads, all the cores by default" )
+
+    for [name, description] in [ ( "baseline", "record the import times, memory and datablocks of each export" ),
+                          ( "check", "compare the imports against a baseline, exit with 1 on regressions" ) ]:
+
+        gate = subparsers.add_parser( name, help = description )
+
+        gate.add_argument( "--repeat", type = int, default = 5, help = "imports per export, their median is compared" )
+
+        gate.add_argument( "--blender", default = "blender", help = "Blender executable, unused inside Blender" )
+
+        gate.add_argument( "--importer", default = os.path.join( blendup_batch.scriptDir, "import.py" ), help = "path of import.py" )
+
+        if name == "baseline":
+
+            gate.add_argument( "--output", default = "blendup_baseline.json" )
+
+            gate.add_argument( "--scales", default = "small,medium" )
+
+            gate.add_argument( "--samples", default = "", help = "comma separated real exports" )
+
+            gate.add_argument( "--options", default = "{}", help = "importer options as JSON" )
+
+        else:
+
+            gate.add_argument( "--baseline", default = "blendup_baseline.json" )
+
+            gate.add_argument( "--tolerance", type = float, default = 0.1, help = "slowdown allowed as a fraction of the baseline median" )
+
+            gate.add_argument( "--noise", type = float, default = 3.0, help = "spreads of the timings added to the allowed slowdown" )
+
+            gate.add_argument( "--min-seconds", type = float, default = 0.005, help = "slowdown always allowed, for the shortest phases" )
+
+    measure = subparsers.add_parser( "measure" )
+
+    measure.add_argument( "--repeat", type = int, default = 5 )
+
+    measure.add_argument( "--importer" )
+
+    measure.add_argument( "--options", default = "{}" )
+
+    measure.add_argument( "cases", nargs = "*" )
+
+    arguments = parser.parse_args(argv)
+
+    if arguments.command == "decoders":
+
+        benchmarkDecoders(arguments)
+
+    elif arguments.command == "container":
+
+        benchmarkContainer(arguments)
+
+    elif arguments.command == "baseline":
+
+        return recordBaseline(arguments)
+
+    elif arguments.command == "check":
+
+        return checkBaseline(arguments)
+
+    elif arguments.command == "measure":
+
+        #inside the Blender started by runImports
+
+        results = measureImports( [ case.split("=", 1) for case in arguments.cases ], arguments.repeat, json.loads(arguments.options), arguments.importer )
+
+        for [key, result] in sorted( results.items() ):
+            print( resultPrefix + json.dumps( { "key" : key, "result" : result } ) )
+
+    else:
+
+        parser.print_help()
+
+    return 0
+
+if __name__ == "__main__":
+
+    #inside Blender our arguments follow "--"
+
+    argv = sys.argv[1:]
+
+    if "--" in sys.argv:
+        argv = sys.argv[ sys.argv.index("--") + 1 : ]
+
+    sys.exit( main(argv) )
@@ -0,0 +1,656 @@
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# Spread3D BlendUp compressed chunked export container, usable without bpy
+#
+#   python blendup_container.py convert model.json model.bup [--codec lzma] [--position-bits 16] [--normal-bits 16]
+#   python blendup_container.py info model.bup
+#
+# Layout: a fixed header (magic, version, offset and length of the table of
+# contents), the chunks, then the table of contents as zlib compressed JSON.
+# Each chunk is compressed on its own so any of them can be read without the
+# others: "model/<key>" holds one top level key of the export (options,
+# hierarchy, definitions, views...) as JSON, "text/<name>" a material file of
+# the export directory and "mesh/<id>" one mesh record in binary.
+#
+# A mesh chunk is a struct header followed by the flat buffers of
+# blendup_json.flatTypes, each byte shuffled (the first bytes of all the values,
+# then the second bytes...) so the compressors see the slowly changing exponent
+# bytes together. Positions can be quantized to integers on a grid over the mesh
+# bounds and normals octahedral encoded; the table of contents keeps the largest
+# position error (export units) and normal error (degrees) of each mesh.
+# Quantized chunks need NumPy to be written or read.
+
+import argparse
+import array
+import codecs
+import concurrent.futures
+import json
+import math
+import os
+import struct
+import sys
+import threading
+import zlib
+
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+sys.path.append( os.path.dirname( os.path.abspath(__file__) ) )
+
+import blendup_json
+
+magic = b'BUPC'
+
+version = 1
+
+#magic, version, flags, table of contents offset and length
+
+headerFormat = "<4sHHQQ"
+
+headerSize = struct.calcsize(headerFormat)
+
+#vertices, loops, faces, position bits, normal bits, length of the JSON of the other keys
+
+meshHeaderFormat = "<IIIBBI"
+
+meshHeaderSize = struct.calcsize(meshHeaderFormat)
+
+#grid origin and step of quantized positions
+
+gridFormat = "<6d"
+
+gridSize = struct.calcsize(gridFormat)
+
+materialFiles = [ "materials.txt", "materials2.txt" ]
+
+codecNames = [ "zlib", "lzma", "none" ]
+
+littleEndian = ( sys.byteorder == "little" )
+
+def isContainer( path ):
+
+    with open(path, 'rb') as file:
+
+        return file.read( len(magic) ) == magic
+
+def compress( data, codec, level = None ):
+
+    if codec == "zlib":
+        return zlib.compress( data, 6 if level is None else level )
+
+    if codec == "lzma":
+
+        if lzma is None:
+            raise NameError("lzma is not available in this Python")
+
+        return lzma.compress( data, preset = 6 if level is None else level )
+
+    return data
+
+def decompress( data, codec ):
+
+    #both decompressors release the GIL, the reading threads decompress in parallel
+
+    if codec == "zlib":
+        return zlib.decompress(data)
+
+    if codec == "lzma":
+        return lzma.decompress(data)
+
+    return data
+
+def shuffle( data, itemSize ):
+
+    return b''.join( data[k::itemSize] for k in range(itemSize) )
+
+def unshuffle( data, itemSize ):
+
+    result = bytearray( len(data) )
+
+    count = len(data) // itemSize
+
+    for k in range(itemSize):
+
+        result[k::itemSize] = data[k * count : (k + 1) * count]
+
+    return bytes(result)
+
+def packValues( values, typecode ):
+
+    #little endian bytes of a flat buffer, array, NumPy array or list
+
+    if numpy is not None:
+
+        return numpy.asarray( values, dtype = numpy.dtype( blendup_json.numpyTypes.get(typecode, typecode) ).newbyteorder('<') ).tobytes()
+
+    values = array.array( typecode, values )
+
+    if not littleEndian:
+        values.byteswap()
+
+    return values.tobytes()
+
+def unpackValues( data, typecode, typed ):
+
+    if typed == "numpy":
+
+        return numpy.frombuffer( data, dtype = numpy.dtype( blendup_json.numpyTypes.get(typecode, typecode) ).newbyteorder('<') ).astype( blendup_json.numpyTypes.get(typecode, typecode) )
+
+    values = array.array(typecode)
+
+    values.frombytes(data)
+
+    if not littleEndian:
+        values.byteswap()
+
+    return values
+
+def quantizedType( bits ):
+
+    return 'H' if bits <= 16 else 'I'
+
+def octahedralEncode( normals, bits ):
+
+    #unit vectors folded on the octahedron and flattened to two signed integers
+
+    normals = numpy.asarray( normals, dtype = numpy.float64 ).reshape(-1, 3)
+
+    norms = numpy.abs(normals).sum(axis = 1)
+
+    p = normals[:, :2] / numpy.maximum( norms, 1e-30 )[:, None]
+
+    signs = numpy.where( p >= 0, 1.0, -1.0 )
+
+    folded = ( 1.0 - numpy.abs( p[:, ::-1] ) ) * signs
+
+    p = numpy.where( ( normals[:, 2] < 0 )[:, None], folded, p )
+
+    scale = ( 1 << ( bits - 1 ) ) - 1
+
+    return numpy.round( p * scale ).astype( numpy.int16 if bits <= 16 else numpy.int32 )
+
+def octahedralDecode( encoded, bits ):
+
+    scale = ( 1 << ( bits - 1 ) ) - 1
+
+    p = encoded.reshape(-1, 2).astype(numpy.float64) / scale
+
+    z = 1.0 - numpy.abs(p).sum(axis = 1)
+
+    t = numpy.maximum( -z, 0.0 )
+
+    p = p - numpy.where( p >= 0, t[:, None], -t[:, None] )
+
+    normals = numpy.concatenate( ( p, z[:, None] ), axis = 1 )
+
+    normals /= numpy.maximum( numpy.linalg.norm( normals, axis = 1 ), 1e-30 )[:, None]
+
+    return normals.astype(numpy.float32).reshape(-1)
+
+def encodeMesh( mesh, positionBits = 0, normalBits = 0 ):
+
+    #binary chunk of a mesh record, returns it with the bounds and the quantization errors
+
+    mesh = blendup_json.flattenMesh( mesh, "numpy" if numpy is not None else "array" )
+
+    if ( positionBits or normalBits ) and numpy is None:
+        raise NameError("NumPy is needed to quantize meshes")
+
+    nbVertices = len( mesh["vertices"] ) // 3
+
+    nbLoops = len( mesh["indices"] )
+
+    nbFaces = len( mesh["faceSizes"] )
+
+    extra = dict( (key, value) for [key, value] in mesh.items() if key not in blendup_json.flatTypes )
+
+    extra = json.dumps(extra).encode('utf-8') if extra else b''
+
+    parts = []
+
+    info = { "faces" : nbFaces, "bounds" : None, "positionError" : 0.0, "normalError" : 0.0 }
+
+    #exact bounds, the lazy and culled imports read them from the table of contents
+
+    if nbVertices > 0 and numpy is not None:
+
+        points = numpy.asarray( mesh["vertices"], dtype = numpy.float64 ).reshape(-1, 3)
+
+        info["bounds"] = [ points.min(axis = 0).tolist(), points.max(axis = 0).tolist() ]
+
+    elif nbVertices > 0:
+
+        values = mesh["vertices"]
+
+        info["bounds"] = [ [ min( values[k::3] ) for k in range(3) ], [ max( values[k::3] ) for k in range(3) ] ]
+
+    if positionBits and nbVertices > 0:
+
+        points = numpy.asarray( mesh["vertices"], dtype = numpy.float64 ).reshape(-1, 3)
+
+        origin = points.min(axis = 0)
+
+        steps = ( points.max(axis = 0) - origin ) / ( ( 1 << positionBits ) - 1 )
+
+        steps[ steps <= 0 ] = 1.0
+
+        grid = numpy.round( ( points - origin ) / steps ).astype( numpy.uint16 if positionBits <= 16 else numpy.uint32 )
+
+        info["positionError"] = float( numpy.abs( grid * steps + origin - points ).max() )
+
+        parts.append( struct.pack( gridFormat, *( origin.tolist() + steps.tolist() ) ) )
+
+        parts.append( shuffle( packValues( grid.reshape(-1), quantizedType(positionBits) ), grid.itemsize ) )
+
+    else:
+
+        positionBits = 0
+
+        parts.append( shuffle( packValues( mesh["vertices"], 'f' ), 4 ) )
+
+    for key in [ "faceSizes", "indices" ]:
+
+        parts.append( shuffle( packValues( mesh[key], 'i' ), 4 ) )
+
+    if normalBits and nbLoops > 0:
+
+        encoded = octahedralEncode( mesh["normals"], normalBits )
+
+        normals = numpy.asarray( mesh["normals"], dtype = numpy.float64 ).reshape(-1, 3)
+
+        lengths = numpy.linalg.norm( normals, axis = 1 )
+
+        decoded = octahedralDecode( encoded, normalBits ).reshape(-1, 3).astype(numpy.float64)
+
+        cosines = ( decoded * normals ).sum(axis = 1)[ lengths > 0 ] / lengths[ lengths > 0 ]
+
+        if len(cosines) > 0:
+            info["normalError"] = math.degrees( math.acos( max( min( float( cosines.min() ), 1.0 ), -1.0 ) ) )
+
+        parts.append( shuffle( packValues( encoded.reshape(-1), 'h' if normalBits <= 16 else 'i' ), encoded.itemsize ) )
+
+    else:
+
+        normalBits = 0
+
+        parts.append( shuffle( packValues( mesh["normals"], 'f' ), 4 ) )
+
+    parts.append( shuffle( packValues( mesh["uvs"], 'f' ), 4 ) )
+
+    parts.append( packValues( mesh["edges"], 'b' ) )
+
+    for key in [ "materials", "backMaterials" ]:
+
+        parts.append( shuffle( packValues( mesh[key], 'i' ), 4 ) )
+
+    header = struct.pack( meshHeaderFormat, nbVertices, nbLoops, nbFaces, positionBits, normalBits, len(extra) )
+
+    return header + b''.join(parts) + extra, info
+
+def decodeMesh( data, typed = None ):
+
+    #flat mesh record of a binary chunk, typed is "numpy" or "array" (the default without NumPy)
+
+    if typed is None:
+        typed = "numpy" if numpy is not None else "array"
+
+    [nbVertices, nbLoops, nbFaces, positionBits, normalBits, extraLength] = struct.unpack_from( meshHeaderFormat, data, 0 )
+
+    if ( positionBits or normalBits ) and numpy is None:
+        raise NameError("NumPy is needed to read quantized meshes")
+
+    pos = meshHeaderSize
+
+    mesh = {}
+
+    def take( typecode, itemSize, count, shuffled = True ):
+
+        nonlocal pos
+
+        chunk = data[pos : pos + itemSize * count]
+
+        pos += itemSize * count
+
+        return unpackValues( unshuffle( chunk, itemSize ) if shuffled else chunk, typecode, "numpy" if numpy is not None else typed )
+
+    if positionBits:
+
+        grid = struct.unpack_from( gridFormat, data, pos )
+
+        pos += gridSize
+
+        itemSize = 2 if positionBits <= 16 else 4
+
+        values = take( quantizedType(positionBits), itemSize, nbVertices * 3 ).reshape(-1, 3)
+
+        mesh["vertices"] = ( values * numpy.array( grid[3:] ) + numpy.array( grid[:3] ) ).astype(numpy.float32).reshape(-1)
+
+    else:
+
+        mesh["vertices"] = take( 'f', 4, nbVertices * 3 )
+
+    mesh["faceSizes"] = take( 'i', 4, nbFaces )
+
+    mesh["indices"] = take( 'i', 4, nbLoops )
+
+    if normalBits:
+
+        itemSize = 2 if normalBits <= 16 else 4
+
+        mesh["normals"] = octahedralDecode( take( 'h' if normalBits <= 16 else 'i', itemSize, nbLoops * 2 ), normalBits )
+
+    else:
+
+        mesh["normals"] = take( 'f', 4, nbLoops * 3 )
+
+    mesh["uvs"] = take( 'f', 4, nbLoops * 2 )
+
+    mesh["edges"] = take( 'b', 1, nbLoops, False )
+
+    mesh["materials"] = take( 'i', 4, nbFaces )
+
+    mesh["backMaterials"] = take( 'i', 4, nbFaces )
+
+    if extraLength:
+        mesh.update( json.loads( data[pos : pos + extraLength].decode('utf-8') ) )
+
+    if typed != "numpy" and numpy is not None:
+
+        for key in blendup_json.flatTypes:
+
+            mesh[key] = array.array( blendup_json.flatTypes[key], mesh[key].tolist() )
+
+    return mesh
+
+class Container:
+
+    #reader of a container, chunks are read under a lock and decompressed outside it;
+    #the file is reopened when a chunk is read after close
+
+    def __init__ ( self, path ):
+
+        self.path = path
+
+        self.file = None
+
+        self.lock = threading.Lock()
+
+        with open(path, 'rb') as file:
+
+            [fileMagic, fileVersion, flags, tocOffset, tocLength] = struct.unpack( headerFormat, file.read(headerSize) )
+
+            if fileMagic != magic:
+                raise NameError("Not a BlendUp container: %s" % path)
+
+            if fileVersion > version:
+                raise NameError("BlendUp container version %d is newer than this importer" % fileVersion)
+
+            file.seek(tocOffset)
+
+            self.toc = json.loads( zlib.decompress( file.read(tocLength) ).decode('utf-8') )
+
+        self.chunks = dict( (entry["name"], entry) for entry in self.toc["chunks"] )
+
+        self.meshEntries = [ self.chunks["mesh/%d" % meshId] for meshId in range( self.toc["meshes"] ) ]
+
+    def close( self ):
+
+        with self.lock:
+
+            if self.file is not None:
+
+                self.file.close()
+
+                self.file = None
+
+    def __enter__ ( self ):
+
+        return self
+
+    def __exit__ ( self, *exception ):
+
+        self.close()
+
+    def readChunk( self, name ):
+
+        entry = self.chunks[name]
+
+        with self.lock:
+
+            if self.file is None:
+                self.file = open(self.path, 'rb')
+
+            self.file.seek( entry["offset"] )
+
+            data = self.file.read( entry["length"] )
+
+        return decompress( data, entry["codec"] )
+
+    def hasText( self, name ):
+
+        return ( "text/" + name ) in self.chunks
+
+    def readText( self, name ):
+
+        return self.readChunk( "text/" + name ).decode('utf-8')
+
+    def loadModel( self, withMeshes = False, typed = None, threads = None ):
+
+        #the export without its meshes (an empty list) unless withMeshes
+
+        model = {}
+
+        for name in self.toc["model"]:
+
+            model[name] = json.loads( self.readChunk( "model/" + name ).decode('utf-8') )
+
+        model["meshes"] = self.loadMeshes( range( self.toc["meshes"] ), typed, threads ) if withMeshes else []
+
+        return model
+
+    def loadMesh( self, meshId, typed = None ):
+
+        return decodeMesh( self.readChunk( "mesh/%d" % meshId ), typed )
+
+    def loadMeshes( self, meshIds, typed = None, threads = None ):
+
+        #decodes the meshes in parallel threads, returns them in the order of meshIds
+
+        meshIds = list(meshIds)
+
+        if threads is None:
+            threads = os.cpu_count() or 1
+
+        if threads <= 1 or len(meshIds) <= 1:
+            return [ self.loadMesh( meshId, typed ) for meshId in meshIds ]
+
+        with concurrent.futures.ThreadPoolExecutor( max_workers = threads ) as pool:
+
+            return list( pool.map( lambda meshId: self.loadMesh( meshId, typed ), meshIds ) )
+
+    def meshBounds( self, meshId ):
+
+        return self.meshEntries[meshId]["bounds"]
+
+def convertExport( jsonPath, outputPath, codec = "zlib", level = None, positionBits = 0, normalBits = 0, threads = None ):
+
+    #writes the container of a JSON export and the material files next to it, returns its stats
+
+    model = blendup_json.load(jsonPath)
+
+    meshes = model.pop( "meshes", [] )
+
+    sourceDir = os.path.dirname( os.path.abspath(jsonPath) )
+
+    def encode( mesh ):
+
+        [data, info] = encodeMesh( mesh, positionBits, normalBits )
+
+        return compress( data, codec, level ), len(data), info
+
+    if threads is None:
+        threads = os.cpu_count() or 1
+
+    with concurrent.futures.ThreadPoolExecutor( max_workers = max( threads, 1 ) ) as pool:
+
+        encoded = list( pool.map( encode, meshes ) )
+
+    meshes = None
+
+    entries = []
+
+    stats = { "meshes" : len(encoded), "jsonBytes" : os.path.getsize(jsonPath), "positionError" : 0.0, "normalError" : 0.0 }
+
+    with open(outputPath, 'wb') as file:
+
+        file.write( struct.pack( headerFormat, magic, version, 0, 0, 0 ) )
+
+        def write( name, data, size, info = None ):
+
+            entry = { "name" : name, "offset" : file.tell(), "length" : len(data), "size" : size, "codec" : codec }
+
+            if info is not None:
+                entry.update(info)
+
+            file.write(data)
+
+            entries.append(entry)
+
+        for key in sorted(model):
+
+            data = json.dumps( model[key] ).encode('utf-8')
+
+            write( "model/" + key, compress( data, codec, level ), len(data) )
+
+        for name in materialFiles:
+
+            path = os.path.join( sourceDir, name )
+
+            if os.path.exists(path):
+
+                with codecs.open(path, "r", "utf-8") as text:
+
+                    data = text.read().encode('utf-8')
+
+                write( "text/" + name, compress( data, codec, level ), len(data) )
+
+        for [meshId, [data, size, info]] in enumerate(encoded):
+
+            write( "mesh/%d" % meshId, data, size, info )
+
+            stats["positionError"] = max( stats["positionError"], info["positionError"] )
+
+            stats["normalError"] = max( stats["normalError"], info["normalError"] )
+
+        toc = { "version" : version, "meshes" : len(encoded), "model" : sorted(model), "chunks" : entries,
+                "positionBits" : positionBits, "normalBits" : normalBits }
+
+        tocData = zlib.compress( json.dumps(toc).encode('utf-8') )
+
+        tocOffset = file.tell()
+
+        file.write(tocData)
+
+        file.seek(0)
+
+        file.write( struct.pack( headerFormat, magic, version, 0, tocOffset, len(tocData) ) )
+
+    stats["containerBytes"] = os.path.getsize(outputPath)
+
+    return stats
+
+def printInfo( path ):
+
+    with Container(path) as container:
+
+        entries = container.toc["chunks"]
+
+        print( "%s: version %d, %d chunks, %d meshes, positions %s, normals %s" %
+               ( path, container.toc["version"], len(entries), container.toc["meshes"],
+                 "%d bits" % container.toc["positionBits"] if container.toc["positionBits"] else "float",
+                 "%d bits octahedral" % container.toc["normalBits"] if container.toc["normalBits"] else "float" ) )
+
+        for kind in [ "model", "text", "mesh" ]:
+
+            chunks = [ entry for entry in entries if entry["name"].startswith(kind + "/") ]
+
+            length = sum( entry["length"] for entry in chunks )
+
+            size = sum( entry["size"] for entry in chunks )
+
+            print( "  %-6s %6d chunks %10.2f MB -> %8.2f MB" % ( kind, len(chunks), size / 1e6, length / 1e6 ) )
+
+        meshes = container.meshEntries
+
+        if meshes:
+
+            print( "  largest position error %.6g, normal error %.4g degrees" %
+                   ( max( entry["positionError"] for entry in meshes ), max( entry["normalError"] for entry in meshes ) ) )
+
+def main( argv ):
+
+    parser = argparse.ArgumentParser( description = "BlendUp export container" )
+
+    subparsers = parser.add_subparsers( dest = "command" )
+
+    convert = subparsers.add_parser( "convert", help = "convert a JSON export to a container" )
+
+    convert.add_argument( "export" )
+
+    convert.add_argument( "output" )
+
+    convert.add_argument( "--codec", choices = codecNames, default = "zlib" )
+
+    convert.add_argument( "--level", type = int, default = None )
+
+    convert.add_argument( "--position-bits", type = int, default = 0, help = "quantize the positions, 0 keeps floats" )
+
+    convert.add_argument( "--normal-bits", type = int, default = 0, help = "octahedral normals, 0 keeps floats" )
+
+    convert.add_argument( "--threads", type = int, default = None )
+
+    info = subparsers.add_parser( "info", help = "chunks and errors of a container" )
+
+    info.add_argument( "container" )
+
+    arguments = parser.parse_args(argv)
+
+    if arguments.command == "convert":
+
+        stats = convertExport( arguments.export, arguments.output, arguments.codec, arguments.level,
+                               arguments.position_bits, arguments.normal_bits, arguments.threads )
+
+        print( "%s: %d meshes, %.2f MB -> %.2f MB (%.1fx), position error %.6g, normal error %.4g degrees" %
+               ( arguments.output, stats["meshes"], stats["jsonBytes"] / 1e6, stats["containerBytes"] / 1e6,
+                 stats["jsonBytes"] / float( max( stats["containerBytes"], 1 ) ), stats["positionError"], stats["normalError"] ) )
+
+    elif arguments.command == "info":
+
+        printInfo( arguments.container )
+
+    else:
+
+        parser.print_help()
+
+if __name__ == "__main__":
+
+    main( sys.argv[1:] )
@@ -0,0 +1,314 @@
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# Spread3D BlendUp polygon budget and vertex clustering decimation, usable without bpy
+
+import math
+
+import numpy
+
+import blendup_validate
+
+#corners of a vertex whose normals differ more than this are on a crease
+
+creaseCosine = 0.9
+
+uvTolerance = 1e-5
+
+#cell size search, the finest cell is the mesh extent divided by 2^finestCells
+
+searchSteps = 10
+
+finestCells = 19
+
+#a search result within this fraction under the target is kept
+
+targetSlack = 0.05
+
+def allocateBudget( flattening, budget, minimumRatio ):
+
+    #water filling of the flattened faces: every definition keeps its faces up to a common cap,
+    #the heaviest ones are cut down to it; faces outside definitions are never decimated.
+    #returns the allocations sorted by contribution and the mesh ratios
+
+    allocations = []
+
+    for definitionId in range( len(flattening.definitions) ):
+
+        instances = flattening.instances[definitionId]
+
+        ownFaces = sum( flattening.meshes[m]["faces"] for m in flattening.definitionMeshes(definitionId) )
+
+        if instances > 0 and ownFaces > 0:
+
+            allocations.append( { "definition" : definitionId,
+                                  "name" : flattening.definitionNames[definitionId],
+                                  "instances" : instances,
+                                  "faces" : ownFaces,
+                                  "flattened" : instances * ownFaces } )
+
+    available = budget - ( flattening.totals["faces"] - sum( a["flattened"] for a in allocations ) )
+
+    allocations.sort( key = lambda a: a["flattened"] )
+
+    for [i, allocation] in enumerate(allocations):
+
+        cap = max( available, 0 ) / float( len(allocations) - i )
+
+        if allocation["flattened"] > cap:
+
+            break
+
+        available -= allocation["flattened"]
+
+    else:
+
+        cap = None
+
+    ratios = {}
+
+    for allocation in allocations:
+
+        if cap is None or allocation["flattened"] <= cap:
+
+            allocation["ratio"] = 1.0
+
+        else:
+
+            allocation["ratio"] = max( cap / allocation["flattened"], minimumRatio )
+
+        allocation["target"] = int( math.ceil( allocation["ratio"] * allocation["faces"] ) )
+
+        if allocation["ratio"] < 1.0:
+
+            for meshId in flattening.definitionMeshes( allocation["definition"] ):
+
+                ratios[meshId] = min( ratios.get(meshId, 1.0), allocation["ratio"] )
+
+    allocations.reverse()
+
+    return allocations, ratios
+
+def lockedVertices( mesh ):
+
+    #vertices on sharp edges, uv seams, material boundaries, normal creases and open borders
+    #keep their place
+
+    indices = mesh["indices"].astype(numpy.int64)
+
+    faceSizes = mesh["faceSizes"].astype(numpy.int64)
+
+    nbVertices = len(mesh["vertices"]) // 3
+
+    nbLoops = len(indices)
+
+    following = blendup_validate.nextCorners( faceSizes, nbLoops )
+
+    loopFaces = numpy.repeat( numpy.arange( len(faceSizes) ), faceSizes )
+
+    locked = numpy.zeros( nbVertices, dtype = bool )
+
+    sharp = mesh["edges"] == 1
+
+    locked[ indices[sharp] ] = True
+
+    locked[ indices[following][sharp] ] = True
+
+    #every corner is compared with the last corner written for its vertex
+
+    reference = numpy.zeros( nbVertices, dtype = numpy.int64 )
+
+    reference[indices] = numpy.arange( nbLoops )
+
+    other = reference[indices]
+
+    uvs = mesh["uvs"].reshape(-1, 2)
+
+    normals = mesh["normals"].reshape(-1, 3)
+
+    split = numpy.abs( uvs - uvs[other] ).max(axis = 1) > uvTolerance
+
+    split |= mesh["materials"][loopFaces] != mesh["materials"][ loopFaces[other] ]
+
+    split |= mesh["backMaterials"][loopFaces] != mesh["backMaterials"][ loopFaces[other] ]
+
+    split |= ( normals * normals[other] ).sum(axis = 1) < creaseCosine
+
+    locked[ indices[split] ] = True
+
+    #edges used by a single face are borders
+
+    [edgeVertices, loopEdges, sharpEdges] = blendup_validate.uniqueEdges( indices, faceSizes, mesh["edges"] )
+
+    border = numpy.bincount( loopEdges, minlength = len(edgeVertices) // 2 )[loopEdges] == 1
+
+    locked[ indices[border] ] = True
+
+    locked[ indices[following][border] ] = True
+
+    return locked
+
+def vertexDirections( mesh ):
+
+    #dominant axis and sign of the summed corner normals, keeps the two sides of thin parts apart
+
+    summed = numpy.zeros( ( len(mesh["vertices"]) // 3, 3 ) )
+
+    numpy.add.at( summed, mesh["indices"], mesh["normals"].reshape(-1, 3) )
+
+    axis = numpy.abs(summed).argmax(axis = 1)
+
+    return axis * 2 + ( summed[ numpy.arange(len(summed)), axis ] < 0 )
+
+def clusterVertices( points, locked, directions, cellSize ):
+
+    #cluster of each vertex, locked vertices are clusters of their own
+
+    cells = numpy.floor( ( points - points.min(axis = 0) ) / cellSize ).astype(numpy.int64)
+
+    size = int( cells.max() ) + 1 if len(cells) > 0 else 1
+
+    keys = ( ( cells[:, 0] * size + cells[:, 1] ) * size + cells[:, 2] ) * 6 + directions
+
+    keys = numpy.where( locked, -1 - numpy.arange( len(points) ), keys )
+
+    return numpy.unique( keys, return_inverse = True )[1].reshape(-1)
+
+def collapseMesh( mesh, labels, locked ):
+
+    #moves each cluster to the mean of its vertices, the corners of free vertices get the
+    #mean uv and normal of their cluster; degenerate faces are then dropped by the validation
+
+    points = mesh["vertices"].reshape(-1, 3).astype(numpy.float64)
+
+    count = int( labels.max() ) + 1
+
+    members = numpy.bincount( labels, minlength = count ).astype(numpy.float64)
+
+    positions = numpy.stack( [ numpy.bincount( labels, weights = points[:, k], minlength = count ) for k in range(3) ], axis = 1 ) / members[:, None]
+
+    indices = labels[ mesh["indices"] ]
+
+    free = ~locked[ mesh["indices"] ]
+
+    corners = numpy.bincount( indices, minlength = count ).astype(numpy.float64)
+
+    def average( values, size ):
+
+        values = values.reshape(-1, size)
+
+        means = numpy.stack( [ numpy.bincount( indices, weights = values[:, k], minlength = count ) for k in range(size) ], axis = 1 ) / numpy.maximum( corners, 1 )[:, None]
+
+        return numpy.where( free[:, None], means[indices], values )
+
+    uvs = average( mesh["uvs"], 2 )
+
+    normals = average( mesh["normals"], 3 )
+
+    lengths = numpy.linalg.norm( normals, axis = 1 )
+
+    normals = numpy.where( lengths[:, None] > 0, normals / numpy.maximum( lengths, 1e-12 )[:, None], normals )
+
+    collapsed = dict(mesh)
+
+    collapsed["vertices"] = positions.astype(numpy.float32).reshape(-1)
+
+    collapsed["indices"] = indices.astype(numpy.int32)
+
+    collapsed["uvs"] = uvs.astype(numpy.float32).reshape(-1)
+
+    collapsed["normals"] = normals.astype(numpy.float32).reshape(-1)
+
+    collapsed = blendup_validate.validateMesh(collapsed)[0]
+
+    #vertices of collapsed faces only are dropped
+
+    [used, remap] = numpy.unique( collapsed["indices"], return_inverse = True )
+
+    collapsed["vertices"] = collapsed["vertices"].reshape(-1, 3)[used].reshape(-1)
+
+    collapsed["indices"] = remap.reshape(-1).astype(numpy.int32)
+
+    return collapsed
+
+def decimateMesh( mesh, ratio ):
+
+    #searches the cell size whose clustering comes closest under ratio times the faces;
+    #returns the decimated flat NumPy record and the face counts before and after
+
+    mesh = blendup_validate.validateMesh(mesh)[0]
+
+    before = len( mesh["faceSizes"] )
+
+    target = int( math.ceil( ratio * before ) )
+
+    if ratio >= 1.0 or before == 0:
+
+        return mesh, before, before
+
+    points = mesh["vertices"].reshape(-1, 3).astype(numpy.float64)
+
+    extent = float( numpy.ptp( points, axis = 0 ).max() )
+
+    if extent <= 0:
+
+        return mesh, before, before
+
+    locked = lockedVertices(mesh)
+
+    directions = vertexDirections(mesh)
+
+    def attempt( cellSize ):
+
+        return collapseMesh( mesh, clusterVertices( points, locked, directions, cellSize ), locked )
+
+    #the coarsest clustering is the best that the locked vertices allow
+
+    coarsest = attempt(extent)
+
+    if len( coarsest["faceSizes"] ) >= target:
+
+        return coarsest, before, len( coarsest["faceSizes"] )
+
+    best = coarsest
+
+    low = math.log( extent / 2 ** finestCells )
+
+    high = math.log( extent )
+
+    for step in range(searchSteps):
+
+        middle = ( low + high ) / 2
+
+        candidate = attempt( math.exp(middle) )
+
+        faces = len( candidate["faceSizes"] )
+
+        if faces > target:
+
+            low = middle
+
+            continue
+
+        high = middle
+
+        if faces > len( best["faceSizes"] ):
+
+            best = candidate
+
+        if faces >= target * ( 1.0 - targetSlack ):
+
+            break
+
+    return best, before, len( best["faceSizes"] )
@@ -0,0 +1,406 @@
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# Spread3D BlendUp view frustum culling of the hierarchy, usable without bpy
+#
+# Matrices are the 16 column-major floats of the export, bounds are
+# [ [minX, minY, minZ], [maxX, maxY, maxZ] ] in the space of their node.
+
+import fnmatch
+import math
+
+identity = [ 1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1 ]
+
+def multiply( a, b ):
+
+    return [ sum( a[k * 4 + row] * b[column * 4 + k] for k in range(4) ) for column in range(4) for row in range(4) ]
+
+def transformPoint( m, p ):
+
+    return [ m[0] * p[0] + m[4] * p[1] + m[8] * p[2] + m[12],
+             m[1] * p[0] + m[5] * p[1] + m[9] * p[2] + m[13],
+             m[2] * p[0] + m[6] * p[1] + m[10] * p[2] + m[14] ]
+
+def boxCorners( bounds ):
+
+    return [ [ bounds[i & 1][0], bounds[(i >> 1) & 1][1], bounds[(i >> 2) & 1][2] ] for i in range(8) ]
+
+def pointsBounds( points ):
+
+    return [ [ min( p[k] for p in points ) for k in range(3) ], [ max( p[k] for p in points ) for k in range(3) ] ]
+
+def transformBounds( m, bounds ):
+
+    return pointsBounds( [ transformPoint( m, corner ) for corner in boxCorners(bounds) ] )
+
+def unionBounds( a, b ):
+
+    if a is None:
+        return b
+
+    if b is None:
+        return a
+
+    return [ [ min( a[0][k], b[0][k] ) for k in range(3) ], [ max( a[1][k], b[1][k] ) for k in range(3) ] ]
+
+def subtract( a, b ):
+
+    return [ a[0] - b[0], a[1] - b[1], a[2] - b[2] ]
+
+def dot( a, b ):
+
+    return a[0] * b[0] + a[1] * b[1] + a[2] * b[2]
+
+def cross( a, b ):
+
+    return [ a[1] * b[2] - a[2] * b[1], a[2] * b[0] - a[0] * b[2], a[0] * b[1] - a[1] * b[0] ]
+
+def normalize( a ):
+
+    length = math.sqrt( dot(a, a) ) or 1.0
+
+    return [ a[0] / length, a[1] / length, a[2] / length ]
+
+def boxRecord( bounds ):
+
+    #mesh record of a box, its faces inherit the node material
+
+    corners = boxCorners(bounds)
+
+    faces = [ [0, 2, 3, 1], [4, 5, 7, 6], [0, 1, 5, 4], [2, 6, 7, 3], [0, 4, 6, 2], [1, 3, 7, 5] ]
+
+    normals = [ [0, 0, -1], [0, 0, 1], [0, -1, 0], [0, 1, 0], [-1, 0, 0], [1, 0, 0] ]
+
+    return { "vertices" : corners,
+             "indices" : faces,
+             "normals" : [ normals[f] for f in range(6) for corner in range(4) ],
+             "uvs" : [ [0, 0] ] * 24,
+             "edges" : [ 0 ] * 24,
+             "materials" : [ -1 ] * 6,
+             "backMaterials" : [ -1 ] * 6 }
+
+class ViewFrustum:
+
+    def __init__ ( self, view, aspect, viewportHeight, margin ):
+
+        self.name = view.get("name", "")
+
+        self.eye = [ float(v) for v in view["eye"] ]
+
+        self.forward = normalize( subtract( view["target"], self.eye ) )
+
+        self.right = normalize( cross( self.forward, view["up"] ) )
+
+        self.up = cross( self.right, self.forward )
+
+        self.perspective = ( view["mode"] == "perspective" )
+
+        #the camera of createCamera fits its angle or scale to the larger side of the viewport
+
+        if self.perspective:
+
+            larger = math.tan( math.radians( view["fov"] ) * 0.5 ) * aspect
+
+        else:
+
+            larger = view["orthoHeight"] * 0.5
+
+        if aspect >= 1:
+
+            [self.halfWidth, self.halfHeight] = [ larger, larger / aspect ]
+
+        else:
+
+            [self.halfWidth, self.halfHeight] = [ larger * aspect, larger ]
+
+        self.viewportHeight = viewportHeight
+
+        #planes n.p + d >= 0 inside, the sides widened by the margin
+
+        width = self.halfWidth * ( 1.0 + margin )
+
+        height = self.halfHeight * ( 1.0 + margin )
+
+        self.planes = [ self.plane( self.forward, 0.0 ) ]
+
+        for [axis, half] in [ [ self.right, width ], [ self.up, height ] ]:
+
+            for sign in [ 1, -1 ]:
+
+                if self.perspective:
+
+                    self.planes.append( self.plane( [ self.forward[k] * half - sign * axis[k] for k in range(3) ], 0.0 ) )
+
+                else:
+
+                    self.planes.append( self.plane( [ -sign * axis[k] for k in range(3) ], half ) )
+
+    def plane( self, normal, offset ):
+
+        return [ normal, offset - dot( normal, self.eye ) ]
+
+    def outside( self, corners ):
+
+        for [normal, d] in self.planes:
+
+            if all( dot( normal, corner ) + d < 0 for corner in corners ):
+                return True
+
+        return False
+
+    def screenSize( self, bounds ):
+
+        #projected diameter in pixels of the sphere around the bounds
+
+        center = [ ( bounds[0][k] + bounds[1][k] ) * 0.5 for k in range(3) ]
+
+        radius = math.sqrt( sum( ( bounds[1][k] - bounds[0][k] ) ** 2 for k in range(3) ) ) * 0.5
+
+        if not self.perspective:
+
+            return radius / self.halfHeight * self.viewportHeight
+
+        depth = dot( subtract( center, self.eye ), self.forward )
+
+        if depth <= radius:
+
+            return float( self.viewportHeight )
+
+        return min( radius / ( depth * self.halfHeight ) * self.viewportHeight, float( self.viewportHeight ) )
+
+def viewFrusta( views, names, options, margin ):
+
+    #frusta of the views whose name matches one of the patterns, all of them without patterns
+
+    width = float( options.get("vpWidth", 1) )
+
+    height = float( options.get("vpHeight", 1) )
+
+    frusta = []
+
+    for view in views:
+
+        if names and not any( fnmatch.fnmatchcase( view.get("name", ""), name ) for name in names ):
+            continue
+
+        frusta.append( ViewFrustum( view, width / height, height, margin ) )
+
+    return frusta
+
+class Culling:
+
+    #prunes the hierarchy to the nodes whose world bounds meet a frustum, the others are dropped
+    #("skip") or replaced by a box of their bounds ("proxy") whose mesh ids follow proxyBase;
+    #with a blendup_spatial.FlatHierarchy of the same model the world bounds come from its arrays
+
+    def __init__ ( self, model, meshBounds, frusta, mode, proxyBase, hierarchy = None ):
+
+        self.definitions = model.get("definitions", [])
+
+        self.meshBounds = meshBounds
+
+        self.frusta = frusta
+
+        self.mode = mode
+
+        self.proxyBase = proxyBase
+
+        self.hierarchy = hierarchy
+
+        self.proxies = []
+
+        self.proxyIds = {}
+
+        self.contentCache = {}
+
+        self.meshes = set()
+
+        #largest screen size of each mesh, and of each mesh with an inherited material
+
+        self.meshPixels = {}
+
+        self.instancePixels = {}
+
+        self.kept = 0
+
+        self.culled = 0
+
+        self.root = self.cull( model["hierarchy"][0], identity, -1, True, 0 )
+
+    def contentBounds( self, node ):
+
+        #bounds of the geometry under a node in its own space, once per definition
+
+        if "definition" in node:
+
+            definitionId = node["definition"]
+
+            if definitionId in self.contentCache:
+                return self.contentCache[definitionId]
+
+            content = self.definitions[definitionId]
+
+        else:
+
+            content = node
+
+        bounds = self.meshBounds[ content["mesh"] ] if "mesh" in content else None
+
+        for child in content.get("children", []):
+
+            childBounds = self.contentBounds(child)
+
+            if childBounds is not None:
+
+                bounds = unionBounds( bounds, transformBounds( child["matrix"], childBounds ) )
+
+        if "definition" in node:
+
+            self.contentCache[definitionId] = bounds
+
+        return bounds
+
+    def worldCorners( self, node, world, index ):
+
+        #corners of the world bounds of everything under a node, None when it holds no geometry
+
+        if self.hierarchy is not None:
+
+            bounds = self.hierarchy.subtreeBounds[index]
+
+            if not ( bounds[0] <= bounds[1] ).all():
+                return None
+
+            return boxCorners( bounds.tolist() )
+
+        bounds = self.contentBounds(node)
+
+        if bounds is None:
+            return None
+
+        return [ transformPoint( world, corner ) for corner in boxCorners(bounds) ]
+
+    def meshWorldBounds( self, meshId, world, index ):
+
+        if self.hierarchy is not None:
+
+            return self.hierarchy.bounds[index].tolist()
+
+        return transformBounds( world, self.meshBounds[meshId] )
+
+    def cull( self, node, parentMatrix, parentMaterial, isRoot = False, index = 0 ):
+
+        #returns the node itself when it is kept whole, a pruned copy, a proxy or None;
+        #index is the position of the node in the flattened hierarchy
+
+        world = multiply( parentMatrix, node["matrix"] ) if self.hierarchy is None else None
+
+        material = node.get("material", -1)
+
+        if material == -1:
+
+            material = parentMaterial
+
+        corners = self.worldCorners( node, world, index )
+
+        if corners is None:
+
+            return node
+
+        visible = [ frustum for frustum in self.frusta if not frustum.outside(corners) ]
+
+        if not visible and not isRoot:
+
+            self.culled += 1
+
+            if self.mode != "proxy":
+                return None
+
+            return self.proxyNode( node, self.contentBounds(node), material )
+
+        self.kept += 1
+
+        content = self.definitions[ node["definition"] ] if "definition" in node else node
+
+        if "mesh" in content:
+
+            meshId = content["mesh"]
+
+            self.meshes.add(meshId)
+
+            #a root kept while no view sees it has no screen size
+
+            if self.meshBounds[meshId] is not None and visible:
+
+                worldBounds = self.meshWorldBounds( meshId, world, index )
+
+                pixels = max( frustum.screenSize(worldBounds) for frustum in visible )
+
+                self.meshPixels[meshId] = max( self.meshPixels.get(meshId, 0.0), pixels )
+
+                self.instancePixels[ (meshId, material) ] = max( self.instancePixels.get( (meshId, material), 0.0 ), pixels )
+
+        children = []
+
+        changed = False
+
+        childIndex = index + 1
+
+        for child in content.get("children", []):
+
+            result = self.cull( child, world, material, False, childIndex )
+
+            if self.hierarchy is not None:
+
+                childIndex = int( self.hierarchy.ends[childIndex] )
+
+            if result is not child:
+                changed = True
+
+            if result is not None:
+                children.append(result)
+
+        if not changed:
+            return node
+
+        copy = dict( (key, value) for [key, value] in node.items() if key not in [ "definition", "mesh", "children" ] )
+
+        copy["children"] = children
+
+        if "mesh" in content:
+            copy["mesh"] = content["mesh"]
+
+        return copy
+
+    def proxyNode( self, node, bounds, material ):
+
+        #instances of a definition share their box
+
+        key = ( "definition", node["definition"] ) if "definition" in node else ( "node", id(node) )
+
+        if key not in self.proxyIds:
+
+            self.proxyIds[key] = self.proxyBase + len(self.proxies)
+
+            self.proxies.append(bounds)
+
+        meshId = self.proxyIds[key]
+
+        self.instancePixels[ (meshId, material) ] = self.instancePixels.get( (meshId, material), 0.0 )
+
+        proxy = dict( (name, value) for [name, value] in node.items() if name not in [ "definition", "mesh", "children" ] )
+
+        proxy["mesh"] = meshId
+
+        return proxy
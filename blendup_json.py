@@ -0,0 +1,309 @@
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# Spread3D BlendUp export decoding, usable without bpy
+
+import array
+import importlib
+import re
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#fastest first, the stdlib decoder is always available
+
+backendNames = [ "orjson", "ujson", "simplejson", "json" ]
+
+#typecodes of the flat per mesh buffers
+
+flatTypes = { "vertices" : 'f',
+              "normals" : 'f',
+              "uvs" : 'f',
+              "indices" : 'i',
+              "faceSizes" : 'i',
+              "materials" : 'i',
+              "backMaterials" : 'i',
+              "edges" : 'b' }
+
+numpyTypes = { 'f' : "float32", 'i' : "int32", 'b' : "int8" }
+
+#mesh records hold arrays of numbers only, a record ends at its first closing brace
+#and its vertices before the next key
+
+meshesStart = re.compile(rb'"meshes"\s*:\s*\[\s*')
+
+recordSeparator = re.compile(rb'[\s,]*')
+
+verticesStart = re.compile(rb'"vertices"\s*:\s*\[')
+
+numberSeparators = bytes.maketrans(b'[],', b'   ')
+
+#the vertices array and what follows it up to the next key or the end of the record
+
+numberArray = re.compile(rb'[-+0-9eE.,\s\[\]]*')
+
+def availableBackends():
+
+    backends = []
+
+    for name in backendNames:
+
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            continue
+
+        backends.append(name)
+
+    return backends
+
+def getBackend( name = None ):
+
+    if name is None:
+
+        name = availableBackends()[0]
+
+    return importlib.import_module(name)
+
+def isFlatMesh( mesh ):
+
+    return "faceSizes" in mesh
+
+def faceCount( mesh ):
+
+    if isFlatMesh(mesh):
+        return len(mesh["faceSizes"])
+
+    return len(mesh["indices"])
+
+def makeBuffer( typecode, values, typed ):
+
+    if typed == "numpy":
+
+        if numpy is None:
+            raise NameError("NumPy is not available for typed arrays")
+
+        return numpy.array( values, dtype = numpyTypes[typecode] )
+
+    return array.array( typecode, values )
+
+def flattenMesh( mesh, typed = "array" ):
+
+    #converts the nested lists of a mesh record into flat typed buffers
+
+    if isFlatMesh(mesh):
+        return mesh
+
+    faces = mesh["indices"]
+
+    flat = {}
+
+    for key in mesh:
+
+        if key not in flatTypes:
+
+            flat[key] = mesh[key]
+
+    flat["faceSizes"] = makeBuffer( 'i', [ len(face) for face in faces ], typed )
+
+    for key in [ "vertices", "normals", "uvs", "indices" ]:
+
+        values = array.array( flatTypes[key] )
+
+        for item in mesh[key]:
+            values.extend(item)
+
+        if typed == "numpy":
+            values = makeBuffer( flatTypes[key], values, typed )
+
+        flat[key] = values
+
+    for key in [ "materials", "backMaterials", "edges" ]:
+
+        flat[key] = makeBuffer( flatTypes[key], mesh[key], typed )
+
+    return flat
+
+def expandMesh( mesh ):
+
+    #back to the nested layout of the export, for passes that work on lists
+
+    if not isFlatMesh(mesh):
+        return mesh
+
+    nested = {}
+
+    for key in mesh:
+
+        if key not in flatTypes:
+
+            nested[key] = mesh[key]
+
+    def split( values, size ):
+
+        values = list(values)
+
+        return [ values[i:i+size] for i in range(0, len(values), size) ]
+
+    nested["vertices"] = split( mesh["vertices"], 3 )
+
+    nested["normals"] = split( mesh["normals"], 3 )
+
+    nested["uvs"] = split( mesh["uvs"], 2 )
+
+    indices = list( mesh["indices"] )
+
+    faces = []
+
+    start = 0
+
+    for size in mesh["faceSizes"]:
+
+        size = int(size)
+
+        faces.append( indices[start:start+size] )
+
+        start += size
+
+    nested["indices"] = faces
+
+    for key in [ "materials", "backMaterials", "edges" ]:
+
+        nested[key] = [ int(v) for v in mesh[key] ]
+
+    return nested
+
+def isMeshRecord( value ):
+
+    return "indices" in value and "vertices" in value and "uvs" in value
+
+def loads( text, backend = None, typed = None ):
+
+    #orjson decodes bytes directly and skips the str copy
+    #typed is None for nested lists, "array" or "numpy" for flat mesh buffers
+
+    module = getBackend(backend)
+
+    if isinstance( text, bytes ) and module.__name__ != "orjson":
+        text = text.decode('utf-8')
+
+    if typed is not None and module.__name__ in [ "json", "simplejson" ]:
+
+        #convert each mesh record as soon as it is decoded so its nested lists die young
+
+        def hook( value ):
+
+            if isMeshRecord(value):
+                return flattenMesh( value, typed )
+
+            return value
+
+        return module.loads( text, object_hook = hook )
+
+    model = module.loads(text)
+
+    if typed is not None:
+
+        meshes = model.get("meshes", [])
+
+        for i in range(0, len(meshes)):
+
+            meshes[i] = flattenMesh( meshes[i], typed )
+
+    return model
+
+def indexRecords( data ):
+
+    #byte offset and length of each mesh record in the raw export, and the export with an
+    #empty meshes array so the rest of the model decodes on its own
+
+    match = meshesStart.search(data)
+
+    if match is None:
+        raise NameError("No meshes found in the export")
+
+    offsets = []
+
+    pos = match.end()
+
+    while data[pos:pos + 1] == b'{':
+
+        end = data.index(b'}', pos) + 1
+
+        offsets.append( ( pos, end - pos ) )
+
+        pos = recordSeparator.match(data, end).end()
+
+    if data[pos:pos + 1] != b']':
+        raise NameError("Unexpected content in the meshes at byte %d" % pos)
+
+    return offsets, data[:match.end()] + data[pos:]
+
+def loadRecord( file, offset, length, backend = None, typed = None ):
+
+    #decodes one indexed mesh record from an open binary file
+
+    file.seek(offset)
+
+    record = getBackend(backend).loads( file.read(length).decode('utf-8') )
+
+    if typed is not None:
+        record = flattenMesh( record, typed )
+
+    return record
+
+def recordBounds( record ):
+
+    #min and max corners of the raw bytes of a mesh record, only its vertices are read;
+    #None when it has no vertices
+
+    match = verticesStart.search(record)
+
+    if match is None:
+        return None
+
+    #numbers, commas and brackets run past the closing bracket of the array only up to
+    #a separator, its last bracket closes the array whether or not a key follows
+
+    span = numberArray.match( record, match.end() - 1 )
+
+    end = record.rfind( b']', match.end() - 1, span.end() ) + 1
+
+    text = record[match.end() - 1 : end].translate(numberSeparators)
+
+    if numpy is not None:
+
+        points = numpy.array( text.split(), dtype = numpy.float64 ).reshape(-1, 3)
+
+        if len(points) == 0:
+            return None
+
+        return [ points.min(axis = 0).tolist(), points.max(axis = 0).tolist() ]
+
+    values = [ float(value) for value in text.split() ]
+
+    if len(values) < 3:
+        return None
+
+    return [ [ min( values[k::3] ) for k in range(3) ], [ max( values[k::3] ) for k in range(3) ] ]
+
+def load( path, backend = None, typed = None ):
+
+    with open(path, 'rb') as file:
+
+        data = file.read()
+
+    return loads( data, backend, typed )
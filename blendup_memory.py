@@ -0,0 +1,234 @@
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# Spread3D BlendUp import phases with collector control and memory tracing, usable without bpy
+#
+#   phases = MemoryPhases( trace = True )
+#   with phases.phase( "decode", bulk = True ):
+#       model = blendup_json.load(path)
+#   phases.freeze()
+#   yield from phases.phaseSteps( "meshes", meshSteps, bulk = True )
+#   ...
+#   phases.restore()
+#   for line in phases.report(): print(line)
+#
+# Bulk phases allocate millions of small lists and dicts that all stay alive,
+# the cyclic collector is paused during them since its passes would find
+# nothing to free. freeze moves the objects allocated so far (the decoded
+# export) out of the collected generations so later passes skip them; it needs
+# Python 3.7, resetting the traced peak per phase needs Python 3.9, before that
+# the peak of a phase is the peak since tracing started.
+#
+# The phases of step generators only pause the collector and count time while
+# a step runs: between steps a modal operator hands control back to Blender.
+# Such interactive imports do not freeze, the other add-ons' objects allocated
+# so far would stay out of the collector until the import ends.
+
+import contextlib
+import gc
+import time
+import tracemalloc
+
+class MemoryPhases:
+
+    def __init__ ( self, trace = False, pauseCollector = True ):
+
+        self.trace = trace
+
+        self.pauseCollector = pauseCollector
+
+        self.phases = []
+
+        #names of the phases being run, innermost last
+
+        self.active = []
+
+        self.paused = 0
+
+        self.collectorWasEnabled = gc.isenabled()
+
+        self.frozen = False
+
+        self.interactive = False
+
+        self.startedTracing = False
+
+    def startTracing( self ):
+
+        if self.trace and not tracemalloc.is_tracing():
+
+            tracemalloc.start()
+
+            self.startedTracing = True
+
+    def begin( self, name, bulk ):
+
+        self.startTracing()
+
+        record = { "name" : name, "seconds" : 0.0, "collectorPaused" : bulk and self.pauseCollector }
+
+        if tracemalloc.is_tracing():
+
+            record["before"] = tracemalloc.get_traced_memory()[0]
+
+            if hasattr( tracemalloc, "reset_peak" ):
+                tracemalloc.reset_peak()
+
+        return record
+
+    def finish( self, record ):
+
+        if "before" in record:
+
+            [current, peak] = tracemalloc.get_traced_memory()
+
+            record["peak"] = peak
+
+            record["retained"] = current - record.pop("before")
+
+        self.phases.append(record)
+
+    @contextlib.contextmanager
+    def running( self, record ):
+
+        #one stretch of work of a phase, timed, with the collector paused for bulk phases
+
+        pause = record["collectorPaused"]
+
+        if pause:
+
+            if self.paused == 0:
+
+                self.collectorWasEnabled = gc.isenabled()
+
+                gc.disable()
+
+            self.paused += 1
+
+        self.active.append( record["name"] )
+
+        start = time.perf_counter()
+
+        try:
+
+            yield
+
+        finally:
+
+            record["seconds"] += time.perf_counter() - start
+
+            self.active.pop()
+
+            if pause:
+
+                self.paused -= 1
+
+                if self.paused == 0 and self.collectorWasEnabled:
+                    gc.enable()
+
+    @contextlib.contextmanager
+    def phase( self, name, bulk = False ):
+
+        record = self.begin( name, bulk )
+
+        try:
+
+            with self.running(record):
+
+                yield
+
+        finally:
+
+            self.finish(record)
+
+    def phaseSteps( self, name, steps, bulk = False ):
+
+        #runs a step generator as one phase, the yields between steps are outside of it
+
+        record = self.begin( name, bulk )
+
+        try:
+
+            while True:
+
+                with self.running(record):
+
+                    try:
+                        step = next(steps)
+                    except StopIteration:
+                        return
+
+                yield step
+
+        finally:
+
+            steps.close()
+
+            self.finish(record)
+
+    def currentPhase( self ):
+
+        return self.active[-1] if self.active else ""
+
+    def freeze( self ):
+
+        if self.pauseCollector and not self.interactive and hasattr( gc, "freeze" ):
+
+            gc.freeze()
+
+            self.frozen = True
+
+    def restore( self ):
+
+        #collector and tracing back as they were before the import
+
+        if self.frozen:
+
+            gc.unfreeze()
+
+            self.frozen = False
+
+        if self.paused > 0:
+
+            self.paused = 0
+
+            if self.collectorWasEnabled:
+                gc.enable()
+
+        if self.startedTracing:
+
+            tracemalloc.stop()
+
+            self.startedTracing = False
+
+    def report( self ):
+
+        lines = [ "BlendUp memory by phase:" ]
+
+        for record in self.phases:
+
+            line = "  %-12s %8.2fs" % ( record["name"], record["seconds"] )
+
+            if "peak" in record:
+                line += "  peak %8.1f MB  retained %+8.1f MB" % ( record["peak"] / 1e6, record["retained"] / 1e6 )
+
+            if record["collectorPaused"]:
+                line += "  (collector paused)"
+
+            lines.append(line)
+
+        if not hasattr( tracemalloc, "reset_peak" ) and self.trace:
+            lines.append( "  peaks are since the first phase with this Python" )
+
+        return lines
@@ -0,0 +1,367 @@
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# Spread3D BlendUp merge of several exports into one model, usable without bpy
+#
+# The exports of a project (site, shell, interiors...) become the children of
+# one root. Textures are identified by the hash of their file and renamed to
+# their path from the directory the export directories share, so the importer
+# loads each file once from that directory. Material definitions are
+# identified by their text once their textures are renamed, mesh records by
+# the hash of their buffers once their materials are renumbered, and component
+# definitions by the hash of their JSON once their meshes, materials and child
+# definitions are renumbered; each of them is kept once in the merged model.
+
+import array
+import hashlib
+import json
+import os
+import re
+import sys
+
+sys.path.append( os.path.dirname( os.path.abspath(__file__) ) )
+
+import blendup_json
+import blendup_analyze
+import blendup_container
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+textureReference = re.compile(r"(Texture\w*\()([^)]*)(\))")
+
+identity = [ 1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1, 0, 0, 0, 0, 1 ]
+
+def commonDirectory( directories ):
+
+    parts = [ os.path.abspath(directory).split(os.sep) for directory in directories ]
+
+    common = []
+
+    for names in zip(*parts):
+
+        if any( name != names[0] for name in names ):
+            break
+
+        common.append( names[0] )
+
+    if len(common) == 0:
+        raise NameError("The merged exports have no directory in common")
+
+    return os.sep.join(common) or os.sep
+
+def fileDigest( path ):
+
+    sha1 = hashlib.sha1()
+
+    with open(path, 'rb') as file:
+
+        for block in iter( lambda: file.read(1 << 20), b"" ):
+
+            sha1.update(block)
+
+    return sha1.hexdigest()
+
+def remapIds( values, table ):
+
+    #material ids through table, -1 (inherited) is kept
+
+    if numpy is not None and isinstance( values, numpy.ndarray ):
+
+        table = numpy.array( table + [ -1 ], dtype = values.dtype )
+
+        return table[ numpy.where( values < 0, len(table) - 1, values ) ]
+
+    remapped = [ table[v] if v >= 0 else v for v in values ]
+
+    if isinstance( values, array.array ):
+        return array.array( values.typecode, remapped )
+
+    return remapped
+
+def meshDigest( mesh ):
+
+    flat = blendup_json.flattenMesh( mesh, "array" )
+
+    sha1 = hashlib.sha1()
+
+    for key in sorted(blendup_json.flatTypes):
+
+        values = flat[key]
+
+        if not isinstance( values, array.array ) and not ( numpy is not None and isinstance( values, numpy.ndarray ) ):
+            values = array.array( blendup_json.flatTypes[key], values )
+
+        sha1.update( key.encode('utf-8') )
+
+        sha1.update( values.tobytes() )
+
+    return sha1.hexdigest()
+
+class MergedExports:
+
+    #exports is a list of [path, sourceDir], JSON exports or containers
+
+    def __init__ ( self, exports ):
+
+        self.exports = exports
+
+        self.sourceDir = commonDirectory( [ sourceDir for [path, sourceDir] in exports ] )
+
+        self.textures = {}
+
+        self.textureNames = {}
+
+        self.textureBytes = 0
+
+        self.definitionKeys = {}
+
+        self.materialDefinitions = []
+
+        self.meshKeys = {}
+
+        self.meshes = []
+
+        self.componentKeys = {}
+
+        self.components = []
+
+        self.totals = { "textures" : 0, "materials" : 0, "meshes" : 0, "definitions" : 0 }
+
+        self.textureFiles = set()
+
+        self.warnings = []
+
+        roots = []
+
+        views = []
+
+        options = None
+
+        for [path, sourceDir] in exports:
+
+            [model, lines] = self.loadExport( path, sourceDir, options )
+
+            if options is None:
+
+                options = model["options"]
+
+            elif model["options"].get("unit") != options.get("unit"):
+
+                self.warnings.append( "%s is in unit %s, the merged model in %s" % ( path, model["options"].get("unit"), options.get("unit") ) )
+
+            materialIds = self.mergeMaterials( blendup_analyze.parseMaterialLines(lines), sourceDir )
+
+            meshIds = [ self.mergeMesh( mesh, materialIds ) for mesh in model["meshes"] ]
+
+            model["meshes"] = None
+
+            definitionIds = {}
+
+            for definitionId in range( len( model.get("definitions", []) ) ):
+
+                self.mergeDefinition( model, definitionId, definitionIds, meshIds, materialIds )
+
+            roots.append( self.remapNode( model["hierarchy"][0], definitionIds, meshIds, materialIds ) )
+
+            views.extend( model.get("views", []) )
+
+        self.model = { "options" : options,
+                       "meshes" : self.meshes,
+                       "definitions" : self.components,
+                       "views" : views,
+                       "hierarchy" : [ { "name" : "BlendUp merge", "matrix" : identity, "material" : -1, "children" : roots } ] }
+
+    def loadExport( self, path, sourceDir, options ):
+
+        #the model and the lines of the material file the merged model uses
+
+        if blendup_container.isContainer(path):
+
+            with blendup_container.Container(path) as container:
+
+                model = container.loadModel( True, self.typedArrays() )
+
+                materialFile = self.materialFile( options or model["options"] )
+
+                if container.hasText(materialFile):
+
+                    return model, container.readText(materialFile).splitlines(True)
+
+        else:
+
+            model = blendup_json.load( path, None, self.typedArrays() )
+
+            materialFile = self.materialFile( options or model["options"] )
+
+        with open( os.path.join( sourceDir, materialFile ), 'rb' ) as file:
+
+            return model, file.read().decode('utf-8').splitlines(True)
+
+    def typedArrays( self ):
+
+        return "numpy" if numpy is not None else "array"
+
+    def materialFile( self, options ):
+
+        return "materials2.txt" if options.get('rendering') == "Blender Cycles" else "materials.txt"
+
+    def textureName( self, name, sourceDir ):
+
+        #the first path of a texture file is the name every copy of it gets
+
+        path = os.path.join( sourceDir, name.strip() )
+
+        self.totals["textures"] += 1
+
+        if path in self.textureNames:
+            return self.textureNames[path]
+
+        key = fileDigest(path) if os.path.exists(path) else path
+
+        if key not in self.textures:
+
+            self.textures[key] = os.path.relpath( path, self.sourceDir ).replace(os.sep, "/")
+
+            if os.path.exists(path):
+
+                self.textureBytes += os.path.getsize(path)
+
+        self.textureNames[path] = self.textures[key]
+
+        self.textureFiles.add(path)
+
+        return self.textures[key]
+
+    def mergeMaterials( self, definitions, sourceDir ):
+
+        #merged id of each material id of the export, the default material of line 0 included
+
+        mapping = []
+
+        for [line, definition] in enumerate(definitions):
+
+            canonical = {}
+
+            for [name, value] in definition.items():
+
+                canonical[name] = textureReference.sub( lambda match: match.group(1) + self.textureName( match.group(2), sourceDir ) + match.group(3), value )
+
+            #the default material only merges with the defaults of the other exports
+
+            key = json.dumps( [ line == 0, canonical ], sort_keys = True )
+
+            if key not in self.definitionKeys:
+
+                self.definitionKeys[key] = len( self.materialDefinitions )
+
+                self.materialDefinitions.append(canonical)
+
+            mapping.append( self.definitionKeys[key] )
+
+            self.totals["materials"] += 1
+
+        #material ids index the definitions from line 1, line 0 is the default of the first export
+
+        if len(mapping) > 0 and mapping[0] != 0:
+            self.warnings.append( "the default material of %s differs from the first export" % sourceDir )
+
+        return [ line - 1 for line in mapping[1:] ]
+
+    def mergeMesh( self, mesh, materialIds ):
+
+        if mesh is None:
+            return -1
+
+        self.totals["meshes"] += 1
+
+        mesh = dict(mesh)
+
+        for key in [ "materials", "backMaterials" ]:
+
+            if key in mesh:
+                mesh[key] = remapIds( mesh[key], materialIds )
+
+        key = meshDigest(mesh)
+
+        if key not in self.meshKeys:
+
+            self.meshKeys[key] = len( self.meshes )
+
+            self.meshes.append(mesh)
+
+        return self.meshKeys[key]
+
+    def mergeDefinition( self, model, definitionId, definitionIds, meshIds, materialIds ):
+
+        #child definitions are merged first, their merged ids are part of the content
+
+        if definitionId in definitionIds:
+            return definitionIds[definitionId]
+
+        definition = self.remapNode( model["definitions"][definitionId], definitionIds, meshIds, materialIds, model )
+
+        key = hashlib.sha1( json.dumps( definition, sort_keys = True ).encode('utf-8') ).hexdigest()
+
+        if key not in self.componentKeys:
+
+            self.componentKeys[key] = len( self.components )
+
+            self.components.append(definition)
+
+        self.totals["definitions"] += 1
+
+        definitionIds[definitionId] = self.componentKeys[key]
+
+        return definitionIds[definitionId]
+
+    def remapNode( self, node, definitionIds, meshIds, materialIds, model = None ):
+
+        remapped = dict(node)
+
+        if node.get("material", -1) >= 0:
+            remapped["material"] = materialIds[ node["material"] ]
+
+        if "mesh" in node:
+            remapped["mesh"] = meshIds[ node["mesh"] ]
+
+        if "definition" in node:
+
+            if node["definition"] not in definitionIds:
+                raise NameError("Definition %d is used before it is merged" % node["definition"])
+
+            remapped["definition"] = definitionIds[ node["definition"] ]
+
+        if "children" in node:
+
+            for child in node["children"]:
+
+                if "definition" in child and model is not None:
+                    self.mergeDefinition( model, child["definition"], definitionIds, meshIds, materialIds )
+
+            remapped["children"] = [ self.remapNode( child, definitionIds, meshIds, materialIds, model ) for child in node["children"] ]
+
+        return remapped
+
+    def report( self ):
+
+        lines = [ "BlendUp merged import: %d exports from %s" % ( len( self.exports ), self.sourceDir ),
+                  "  meshes %d -> %d, definitions %d -> %d, materials %d -> %d, textures %d references of %d files -> %d loaded (%.1f MB)" %
+                  ( self.totals["meshes"], len( self.meshes ), self.totals["definitions"], len( self.components ),
+                    self.totals["materials"], len( self.materialDefinitions ), self.totals["textures"], len( self.textureFiles ),
+                    len( self.textures ), self.textureBytes / 1e6 ) ]
+
+        return lines + [ "  warning: " + warning for warning in self.warnings ]
@@ -0,0 +1,163 @@
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# Spread3D BlendUp selection of hierarchy subtrees by name patterns, usable without bpy
+#
+# Patterns are shell wildcards matched against the node name and the name of
+# its definition; patterns containing "/" are matched against its path instead,
+# the node names from under the root joined by "/" ("Campus/Building A/Floor 2").
+# A node matching an include pattern is kept with
+# its whole subtree, no include pattern keeps everything; a node matching an
+# exclude pattern is dropped with its subtree. The ancestors of kept nodes stay
+# as empties so the transforms are unchanged.
+
+import fnmatch
+
+def patternList( value ):
+
+    #option values are a list of patterns or a single one
+
+    if value is None or value == "":
+        return []
+
+    if isinstance( value, str ):
+        return [ value ]
+
+    return list(value)
+
+class Selection:
+
+    def __init__ ( self, model, include, exclude ):
+
+        self.include = patternList(include)
+
+        self.exclude = patternList(exclude)
+
+        self.definitions = model.get("definitions", [])
+
+        #without path patterns a definition prunes the same way wherever it is instanced
+
+        self.cacheable = not any( "/" in pattern for pattern in self.include + self.exclude )
+
+        self.cache = {}
+
+        self.meshes = set()
+
+        self.materials = set()
+
+        self.nodes = 0
+
+        root = model["hierarchy"][0]
+
+        self.root = self.select( root, "", len(self.include) == 0, True )
+
+    def matches( self, patterns, names, path ):
+
+        #"*" also matches "/", only path patterns see the path so that the
+        #other ones give the same result wherever a definition is instanced
+
+        for pattern in patterns:
+
+            for name in ( [ path ] if "/" in pattern else names ):
+
+                if fnmatch.fnmatchcase( name, pattern ):
+                    return True
+
+        return False
+
+    def select( self, node, path, selected, isRoot = False ):
+
+        #returns the node itself when it is kept whole, a pruned copy or None
+
+        names = [ node.get("name", "") ]
+
+        if "definition" in node:
+
+            content = self.definitions[ node["definition"] ]
+
+            names.append( content.get("name", "") )
+
+        else:
+
+            content = node
+
+        if not isRoot and self.matches( self.exclude, names, path ):
+            return None
+
+        selected = selected or ( not isRoot and self.matches( self.include, names, path ) )
+
+        [children, changed] = self.selectChildren( node, content, path, selected )
+
+        if not selected and len(children) == 0 and not isRoot:
+            return None
+
+        self.nodes += 1
+
+        if node.get("material", -1) != -1:
+            self.materials.add( node["material"] )
+
+        if selected and "mesh" in content:
+            self.meshes.add( content["mesh"] )
+
+        if selected and not changed:
+            return node
+
+        #this instance differs from its definition, its pruned content is inlined
+
+        copy = dict( (key, value) for [key, value] in node.items() if key not in [ "definition", "mesh", "children" ] )
+
+        copy["children"] = children
+
+        if selected and "mesh" in content:
+            copy["mesh"] = content["mesh"]
+
+        return copy
+
+    def selectChildren( self, node, content, path, selected ):
+
+        key = ( node["definition"], selected ) if "definition" in node else None
+
+        if self.cacheable and key in self.cache:
+
+            [children, changed, nodes] = self.cache[key]
+
+            self.nodes += nodes
+
+            return children, changed
+
+        nodes = self.nodes
+
+        children = []
+
+        changed = False
+
+        for child in content.get("children", []):
+
+            childPath = path + "/" + child.get("name", "") if path else child.get("name", "")
+
+            result = self.select( child, childPath, selected )
+
+            if result is not child:
+                changed = True
+
+            if result is not None:
+                children.append(result)
+
+        if self.cacheable and key is not None:
+
+            #the meshes and materials were collected the first time
+
+            self.cache[key] = [ children, changed, self.nodes - nodes ]
+
+        return children, changed
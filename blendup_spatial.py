@@ -0,0 +1,393 @@
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# Spread3D BlendUp world transforms and spatial index of the hierarchy, usable without bpy
+#
+# The hierarchy is flattened in the order parseNode creates its objects, node 0
+# is the root. Bounds are (count, 2, 3) arrays of min and max corners, empty
+# boxes have min > max.
+#
+#   hierarchy = exportHierarchy( "export.json" )
+#   index = BlendUpSpatialIndex( hierarchy.bounds )
+#   nodes = index.queryBox( [0, 0, 0], [10, 10, 3] )
+#   names = [ hierarchy.names[n] for n in nodes ]
+
+import heapq
+
+import numpy
+
+import blendup_json
+
+#corner i of a box takes the max on the axes whose bit is set
+
+cornerBits = numpy.array( [ [ ( i >> k ) & 1 for k in range(3) ] for i in range(8) ], dtype = bool )
+
+def meshBounds( mesh ):
+
+    #min and max corners of a decoded mesh record, None without vertices
+
+    if mesh is None or len( mesh["vertices"] ) == 0:
+        return None
+
+    points = numpy.asarray( mesh["vertices"], dtype = numpy.float64 ).reshape(-1, 3)
+
+    return [ points.min(axis = 0).tolist(), points.max(axis = 0).tolist() ]
+
+def exportHierarchy( path ):
+
+    #hierarchy of an export with the bounds scanned from the raw mesh records, no mesh is decoded
+
+    with open(path, 'rb') as file:
+
+        data = file.read()
+
+    [offsets, rest] = blendup_json.indexRecords(data)
+
+    model = blendup_json.loads(rest)
+
+    return FlatHierarchy( model, [ blendup_json.recordBounds( data[offset : offset + length] ) for [offset, length] in offsets ] )
+
+def emptyBounds( count ):
+
+    bounds = numpy.empty( ( count, 2, 3 ) )
+
+    bounds[:, 0] = numpy.inf
+
+    bounds[:, 1] = -numpy.inf
+
+    return bounds
+
+def validBounds( bounds ):
+
+    return ( bounds[:, 0] <= bounds[:, 1] ).all(axis = 1)
+
+def transformBoxes( matrices, boxes ):
+
+    #world bounds of boxes under 4x4 matrices, from their 8 transformed corners
+
+    corners = numpy.where( cornerBits[None, :, :], boxes[:, None, 1, :], boxes[:, None, 0, :] )
+
+    points = numpy.einsum( 'nij,nkj->nki', matrices[:, :3, :3], corners ) + matrices[:, None, :3, 3]
+
+    return numpy.stack( ( points.min(axis = 1), points.max(axis = 1) ), axis = 1 )
+
+def worldMatrices( parents, depths, locals ):
+
+    #batched 4x4 products level by level, each level only needs the one above
+
+    world = locals.copy()
+
+    for depth in range( 1, int( depths.max() ) + 1 if len(depths) > 0 else 1 ):
+
+        nodes = numpy.flatnonzero( depths == depth )
+
+        world[nodes] = numpy.matmul( world[ parents[nodes] ], locals[nodes] )
+
+    return world
+
+class FlatHierarchy:
+
+    def __init__ ( self, model, meshBounds = None ):
+
+        self.definitions = model.get("definitions", [])
+
+        parents = []
+
+        depths = []
+
+        matrices = []
+
+        meshes = []
+
+        materials = []
+
+        ends = []
+
+        self.names = []
+
+        self.nodeDefinitions = []
+
+        def visit( node, parent, depth, parentMaterial ):
+
+            index = len(parents)
+
+            parents.append(parent)
+
+            depths.append(depth)
+
+            matrices.extend( node["matrix"] )
+
+            material = node.get("material", -1)
+
+            if material == -1:
+                material = parentMaterial
+
+            materials.append(material)
+
+            self.names.append( node.get("name", "") )
+
+            if "definition" in node:
+
+                self.nodeDefinitions.append( node["definition"] )
+
+                node = self.definitions[ node["definition"] ]
+
+            else:
+
+                self.nodeDefinitions.append(-1)
+
+            meshes.append( node.get("mesh", -1) )
+
+            ends.append(0)
+
+            for child in node.get("children", []):
+
+                visit( child, index, depth + 1, material )
+
+            ends[index] = len(parents)
+
+        visit( model["hierarchy"][0], -1, 0, -1 )
+
+        self.parents = numpy.array( parents, dtype = numpy.int64 )
+
+        self.depths = numpy.array( depths, dtype = numpy.int64 )
+
+        self.meshes = numpy.array( meshes, dtype = numpy.int64 )
+
+        self.materials = numpy.array( materials, dtype = numpy.int64 )
+
+        #nodes index..ends[index] are the subtree of a node
+
+        self.ends = numpy.array( ends, dtype = numpy.int64 )
+
+        #the export stores the matrices column by column
+
+        self.locals = numpy.array( matrices, dtype = numpy.float64 ).reshape(-1, 4, 4).transpose(0, 2, 1)
+
+        self.world = worldMatrices( self.parents, self.depths, self.locals )
+
+        self.bounds = emptyBounds( len(parents) )
+
+        self.subtreeBounds = self.bounds
+
+        if meshBounds is not None:
+
+            self.computeBounds(meshBounds)
+
+    def computeBounds( self, meshBounds ):
+
+        #world bounds of the mesh of each node, and of everything under it
+
+        boxes = emptyBounds( len(meshBounds) )
+
+        for [meshId, bounds] in enumerate(meshBounds):
+
+            if bounds is not None:
+                boxes[meshId] = bounds
+
+        nodes = numpy.flatnonzero( ( self.meshes >= 0 ) & ( self.meshes < len(meshBounds) ) )
+
+        nodes = nodes[ validBounds( boxes[ self.meshes[nodes] ] ) ]
+
+        self.bounds = emptyBounds( len(self.parents) )
+
+        self.bounds[nodes] = transformBoxes( self.world[nodes], boxes[ self.meshes[nodes] ] )
+
+        #children first, each level folds into its parents
+
+        self.subtreeBounds = self.bounds.copy()
+
+        for depth in range( int( self.depths.max() ), 0, -1 ):
+
+            nodes = numpy.flatnonzero( self.depths == depth )
+
+            numpy.minimum.at( self.subtreeBounds[:, 0], self.parents[nodes], self.subtreeBounds[nodes, 0] )
+
+            numpy.maximum.at( self.subtreeBounds[:, 1], self.parents[nodes], self.subtreeBounds[nodes, 1] )
+
+class BlendUpSpatialIndex:
+
+    #bounding volume hierarchy over boxes, split at the median of the longest axis
+
+    leafSize = 8
+
+    def __init__ ( self, bounds ):
+
+        bounds = numpy.asarray( bounds, dtype = numpy.float64 ).reshape(-1, 2, 3)
+
+        #ids of the boxes as given, empty ones are left out
+
+        self.ids = numpy.flatnonzero( validBounds(bounds) )
+
+        self.boxes = bounds[self.ids]
+
+        self.order = numpy.arange( len(self.ids) )
+
+        self.nodeBounds = []
+
+        self.children = []
+
+        self.ranges = []
+
+        if len(self.ids) > 0:
+
+            self.build( 0, len(self.ids) )
+
+        self.nodeBounds = numpy.array( self.nodeBounds ).reshape(-1, 2, 3)
+
+        #boxes in leaf order
+
+        self.boxes = self.boxes[self.order]
+
+        self.ids = self.ids[self.order]
+
+    def build( self, start, end ):
+
+        node = len(self.ranges)
+
+        boxes = self.boxes[ self.order[start:end] ]
+
+        self.nodeBounds.append( [ boxes[:, 0].min(axis = 0), boxes[:, 1].max(axis = 0) ] )
+
+        self.ranges.append( ( start, end ) )
+
+        self.children.append(None)
+
+        if end - start <= self.leafSize:
+            return node
+
+        centers = boxes.sum(axis = 1)
+
+        axis = int( numpy.argmax( centers.max(axis = 0) - centers.min(axis = 0) ) )
+
+        self.order[start:end] = self.order[start:end][ numpy.argsort( centers[:, axis], kind = 'stable' ) ]
+
+        middle = ( start + end ) // 2
+
+        self.children[node] = ( self.build( start, middle ), self.build( middle, end ) )
+
+        return node
+
+    def query( self, nodeTest, boxTest ):
+
+        #ids of the boxes passing boxTest, under the nodes passing nodeTest
+
+        found = []
+
+        stack = [ 0 ] if len(self.ranges) > 0 else []
+
+        while stack:
+
+            node = stack.pop()
+
+            if not nodeTest( self.nodeBounds[node] ):
+                continue
+
+            if self.children[node] is None:
+
+                [start, end] = self.ranges[node]
+
+                found.append( self.ids[start:end][ boxTest( self.boxes[start:end] ) ] )
+
+            else:
+
+                stack.extend( self.children[node] )
+
+        if len(found) == 0:
+            return numpy.zeros( 0, dtype = numpy.int64 )
+
+        return numpy.sort( numpy.concatenate(found) )
+
+    def queryBox( self, low, high ):
+
+        low = numpy.asarray( low, dtype = numpy.float64 )
+
+        high = numpy.asarray( high, dtype = numpy.float64 )
+
+        return self.query( lambda box: ( box[0] <= high ).all() and ( box[1] >= low ).all(),
+                           lambda boxes: ( boxes[:, 0] <= high ).all(axis = 1) & ( boxes[:, 1] >= low ).all(axis = 1) )
+
+    def queryPoint( self, point ):
+
+        return self.queryBox( point, point )
+
+    def querySphere( self, center, radius ):
+
+        center = numpy.asarray( center, dtype = numpy.float64 )
+
+        return self.query( lambda box: boxDistances( box[None], center )[0] <= radius,
+                           lambda boxes: boxDistances( boxes, center ) <= radius )
+
+    def queryPlanes( self, planes ):
+
+        #boxes not fully behind any of the planes, [normal, d] with n.p + d >= 0 inside
+
+        return self.query( lambda box: not outsidePlanes( box[None], planes )[0],
+                           lambda boxes: ~outsidePlanes( boxes, planes ) )
+
+    def nearest( self, point, count = 1 ):
+
+        #ids of the count boxes closest to the point, best first search on the box distances
+
+        point = numpy.asarray( point, dtype = numpy.float64 )
+
+        heap = [ ( 0.0, 0, 0 ) ] if len(self.ranges) > 0 else []
+
+        found = []
+
+        while heap and len(found) < count:
+
+            [distance, isBox, item] = heapq.heappop(heap)
+
+            if isBox:
+
+                found.append( int( self.ids[item] ) )
+
+            elif self.children[item] is None:
+
+                [start, end] = self.ranges[item]
+
+                for [offset, boxDistance] in enumerate( boxDistances( self.boxes[start:end], point ) ):
+
+                    heapq.heappush( heap, ( float(boxDistance), 1, start + offset ) )
+
+            else:
+
+                for child in self.children[item]:
+
+                    heapq.heappush( heap, ( float( boxDistances( self.nodeBounds[child][None], point )[0] ), 0, child ) )
+
+        return found
+
+def boxDistances( boxes, point ):
+
+    gaps = numpy.maximum( numpy.maximum( boxes[:, 0] - point, point - boxes[:, 1] ), 0.0 )
+
+    return numpy.sqrt( ( gaps * gaps ).sum(axis = 1) )
+
+def outsidePlanes( boxes, planes ):
+
+    #a box is behind a plane when its corner furthest along the normal is
+
+    outside = numpy.zeros( len(boxes), dtype = bool )
+
+    for [normal, d] in planes:
+
+        normal = numpy.asarray( normal, dtype = numpy.float64 )
+
+        furthest = numpy.where( normal >= 0, boxes[:, 1], boxes[:, 0] )
+
+        outside |= furthest.dot(normal) + d < 0
+
+    return outside
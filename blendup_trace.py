@@ -0,0 +1,244 @@
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# Spread3D BlendUp call site tracing of the importer, usable without bpy
+#
+#   tracer = CallSiteTracer( [ importPath ], lambda: phases.currentPhase() )
+#   tracer.start()
+#   ...
+#   tracer.stop()
+#   for line in tracer.report(): print(line)
+#   tracer.writeCollapsed( "import.folded" )     # flamegraph.pl / speedscope input
+#
+# The bpy collections, RNA structs and their methods are C types that cannot be
+# wrapped, and attribute writes (".uv =", ".default_value =") are no calls at
+# all. Instead every line executed in the traced files is timed with
+# sys.settrace: a line is charged the time until the next line of its frame,
+# minus the time spent in traced functions it calls, so it holds its own bpy
+# and RNA calls. Lines whose source touches bpy or RNA data are the call sites
+# of the histogram. Only the thread calling start is traced and the tracing
+# slows the import down several times; compare sites with each other, not with
+# untraced timings.
+
+import linecache
+import re
+import sys
+import time
+
+#source of the lines that call into bpy or read and write RNA data
+
+rnaPattern = re.compile( r"\bbpy\.|\.(new|remove|link|unlink|foreach_set|foreach_get|from_pydata|user_remap|scale|validate)\(|\.(pack|update)\(\)|"
+                         r"(?<!self)\.(inputs|outputs|nodes|links|material_slots|uv_layers|uv_textures|default_value|location|image|matrix_local|matrix_world|parent|materials|uv)\b" )
+
+class CallSiteTracer:
+
+    def __init__ ( self, files, phaseSource = None ):
+
+        self.files = set( files )
+
+        self.phaseSource = phaseSource or ( lambda: "" )
+
+        #[phase, filename, line] -> [count, seconds]
+
+        self.sites = {}
+
+        #[phase, function stack, filename, line] -> seconds
+
+        self.stacks = {}
+
+        #entries [code, line, start] of the traced frames being executed
+
+        self.frames = []
+
+        self.rnaLines = {}
+
+        self.previousTrace = None
+
+    def start( self ):
+
+        self.previousTrace = sys.gettrace()
+
+        sys.settrace( self.traceCall )
+
+    def stop( self ):
+
+        sys.settrace( self.previousTrace )
+
+        now = time.perf_counter()
+
+        while self.frames:
+
+            self.charge(now)
+
+            self.frames.pop()
+
+    def isRnaLine( self, filename, line ):
+
+        key = ( filename, line )
+
+        if key not in self.rnaLines:
+
+            self.rnaLines[key] = rnaPattern.search( linecache.getline( filename, line ) ) is not None
+
+        return self.rnaLines[key]
+
+    def charge( self, now ):
+
+        #time of the current line of the innermost traced frame up to now
+
+        entry = self.frames[-1]
+
+        if entry[1] is None or entry[2] is None:
+            return
+
+        elapsed = now - entry[2]
+
+        phase = self.phaseSource()
+
+        site = ( phase, entry[0].co_filename, entry[1] )
+
+        record = self.sites.get(site)
+
+        if record is None:
+
+            record = self.sites[site] = [ 0, 0.0 ]
+
+        record[1] += elapsed
+
+        stack = ( phase, tuple( frame[0].co_name for frame in self.frames ), entry[0].co_filename, entry[1] )
+
+        self.stacks[stack] = self.stacks.get( stack, 0.0 ) + elapsed
+
+    def traceCall( self, frame, event, arg ):
+
+        if event != 'call' or frame.f_code.co_filename not in self.files:
+            return None
+
+        now = time.perf_counter()
+
+        if self.frames:
+
+            #the caller line stops its clock while the traced callee runs
+
+            self.charge(now)
+
+            self.frames[-1][2] = None
+
+        self.frames.append( [ frame.f_code, None, now ] )
+
+        return self.traceLine
+
+    def traceLine( self, frame, event, arg ):
+
+        now = time.perf_counter()
+
+        if not self.frames:
+            return self.traceLine
+
+        if event == 'line':
+
+            self.charge(now)
+
+            entry = self.frames[-1]
+
+            entry[1] = frame.f_lineno
+
+            entry[2] = now
+
+            site = ( self.phaseSource(), entry[0].co_filename, entry[1] )
+
+            record = self.sites.get(site)
+
+            if record is None:
+
+                record = self.sites[site] = [ 0, 0.0 ]
+
+            record[0] += 1
+
+        elif event == 'return':
+
+            #also the yield of a generator, its next resume is a new call
+
+            self.charge(now)
+
+            self.frames.pop()
+
+            if self.frames:
+                self.frames[-1][2] = now
+
+        return self.traceLine
+
+    def report( self, top = 25, width = 40 ):
+
+        #the slowest bpy and RNA call sites of each phase, with the share of all the traced time
+
+        lines = []
+
+        phases = []
+
+        for [phase, filename, line] in self.sites:
+
+            if phase not in phases:
+                phases.append(phase)
+
+        total = sum( record[1] for record in self.sites.values() ) or 1e-12
+
+        for phase in phases:
+
+            sites = [ ( site, record ) for [site, record] in self.sites.items() if site[0] == phase ]
+
+            phaseTime = sum( record[1] for [site, record] in sites )
+
+            rna = [ ( site, record ) for [site, record] in sites if self.isRnaLine( site[1], site[2] ) ]
+
+            rnaTime = sum( record[1] for [site, record] in rna )
+
+            lines.append( "BlendUp call sites, phase %s: %.3fs traced (%.0f%% of the import), %.3fs on %d bpy/RNA lines" %
+                          ( phase or "-", phaseTime, 100.0 * phaseTime / total, rnaTime, len(rna) ) )
+
+            rna.sort( key = lambda item: -item[1][1] )
+
+            longest = rna[0][1][1] if rna else 1.0
+
+            for [site, [count, seconds]] in rna[:top]:
+
+                line = site[2]
+
+                source = linecache.getline( site[1], line ).strip()
+
+                bar = "#" * int( round( width * seconds / ( longest or 1e-12 ) ) )
+
+                lines.append( "  %5d %9d calls %9.3fs %8.2fus  %-*s  %s" %
+                              ( line, count, seconds, 1e6 * seconds / max( count, 1 ), width, bar, source[:60] ) )
+
+        return lines
+
+    def writeCollapsed( self, path ):
+
+        #one "phase;function;...;line source" stack per line with its time in microseconds
+
+        with open(path, 'w') as file:
+
+            for [[phase, functions, filename, line], seconds] in sorted( self.stacks.items() ):
+
+                micros = int( round( seconds * 1e6 ) )
+
+                if micros <= 0:
+                    continue
+
+                source = linecache.getline( filename, line ).strip().replace(";", ",")
+
+                label = "%d %s" % ( line, source[:60] )
+
+                file.write( "%s %d\n" % ( ";".join( [ phase or "-" ] + list(functions) + [ label ] ), micros ) )
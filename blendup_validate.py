@@ -0,0 +1,292 @@
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# Spread3D BlendUp mesh record validation with NumPy, usable without bpy
+
+import collections
+
+import numpy
+
+import blendup_json
+
+#faces listed per issue in the reports
+
+sampleSize = 5
+
+#faces smaller than this fraction of the mesh extent, squared, have no area
+
+areaTolerance = 1e-7
+
+class MeshValidationError(ValueError):
+
+    pass
+
+def asFlatNumpy( mesh ):
+
+    #flat record whose buffers are NumPy arrays, whatever the decoding
+
+    mesh = blendup_json.flattenMesh( mesh, "numpy" )
+
+    flat = dict( mesh )
+
+    for key in blendup_json.flatTypes:
+
+        if key in flat:
+
+            flat[key] = numpy.asarray( flat[key], dtype = blendup_json.numpyTypes[ blendup_json.flatTypes[key] ] )
+
+    return flat
+
+def fitLength( values, expected, fill ):
+
+    if len(values) == expected:
+
+        return values
+
+    if len(values) > expected:
+
+        return values[:expected]
+
+    return numpy.concatenate( ( values, numpy.full( expected - len(values), fill, dtype = values.dtype ) ) )
+
+def nextCorners( faceSizes, nbLoops ):
+
+    #index of the corner following each corner in its face, the last one wraps to the first
+
+    starts = numpy.zeros( len(faceSizes), dtype = numpy.int64 )
+
+    numpy.cumsum( faceSizes[:-1], out = starts[1:] )
+
+    following = numpy.arange( 1, nbLoops + 1, dtype = numpy.int64 )
+
+    nonEmpty = faceSizes > 0
+
+    following[ (starts + faceSizes - 1)[nonEmpty] ] = starts[nonEmpty]
+
+    return following
+
+def validateMesh( mesh, reject = False ):
+
+    #returns the repaired mesh as a flat NumPy record and its issues, an ordered
+    #dict of issue name -> (count, first faces or values)
+
+    mesh = asFlatNumpy(mesh)
+
+    issues = collections.OrderedDict()
+
+    def note( name, faces ):
+
+        faces = numpy.flatnonzero(faces) if faces.dtype == bool else faces
+
+        if len(faces) > 0:
+
+            issues[name] = ( len(faces), [ int(f) for f in faces[:sampleSize] ] )
+
+    vertices = mesh["vertices"]
+
+    indices = mesh["indices"]
+
+    faceSizes = mesh["faceSizes"]
+
+    if len(vertices) % 3 != 0:
+
+        raise MeshValidationError("%d vertex coordinates, not a multiple of 3" % len(vertices))
+
+    if int( faceSizes.sum() ) != len(indices) or ( faceSizes < 0 ).any():
+
+        raise MeshValidationError("face sizes add up to %d corners for %d indices" % ( int( faceSizes.sum() ), len(indices) ))
+
+    nbVertices = len(vertices) // 3
+
+    nbFaces = len(faceSizes)
+
+    nbLoops = len(indices)
+
+    #per corner and per face buffers of the wrong length are cut or padded with neutral values
+
+    for [key, size, expected, fill] in [ [ "normals", 3, nbLoops, 0.0 ], [ "uvs", 2, nbLoops, 0.0 ], [ "edges", 1, nbLoops, 0 ],
+                                         [ "materials", 1, nbFaces, -1 ], [ "backMaterials", 1, nbFaces, -1 ] ]:
+
+        if key not in mesh:
+
+            mesh[key] = numpy.full( size * expected, fill, dtype = blendup_json.numpyTypes[ blendup_json.flatTypes[key] ] )
+
+        elif len(mesh[key]) != size * expected:
+
+            issues["%s length %d, expected %d" % ( key, len(mesh[key]), size * expected )] = ( 1, [] )
+
+            mesh[key] = fitLength( mesh[key], size * expected, fill )
+
+    loopFaces = numpy.repeat( numpy.arange( nbFaces ), faceSizes )
+
+    following = nextCorners( faceSizes, nbLoops )
+
+    #corners out of range or on non finite vertices
+
+    outOfRange = ( indices < 0 ) | ( indices >= nbVertices )
+
+    points = vertices.reshape(-1, 3)
+
+    safeIndices = numpy.where( outOfRange, 0, indices )
+
+    nonFinite = ~numpy.isfinite(points).all(axis = 1)[safeIndices] & ~outOfRange
+
+    dropped = numpy.zeros( nbFaces, dtype = bool )
+
+    for [name, corners] in [ [ "faces with out of range indices", outOfRange ], [ "faces on non finite vertices", nonFinite ] ]:
+
+        faces = numpy.zeros( nbFaces, dtype = bool )
+
+        faces[ loopFaces[corners] ] = True
+
+        note( name, faces & ~dropped )
+
+        dropped |= faces
+
+    #a corner repeating the next one is removed, faces repeating a vertex elsewhere are dropped
+
+    repeated = ( safeIndices == safeIndices[following] ) & ( faceSizes[loopFaces] > 1 )
+
+    keep = ~repeated
+
+    faces = numpy.zeros( nbFaces, dtype = bool )
+
+    faces[ loopFaces[repeated] ] = True
+
+    note( "faces with repeated consecutive corners", faces & ~dropped )
+
+    order = numpy.lexsort( ( safeIndices[keep], loopFaces[keep] ) )
+
+    keptFaces = loopFaces[keep][order]
+
+    keptIndices = safeIndices[keep][order]
+
+    same = ( keptFaces[1:] == keptFaces[:-1] ) & ( keptIndices[1:] == keptIndices[:-1] )
+
+    faces = numpy.zeros( nbFaces, dtype = bool )
+
+    faces[ keptFaces[1:][same] ] = True
+
+    note( "faces repeating a vertex", faces & ~dropped )
+
+    dropped |= faces
+
+    sizes = numpy.bincount( loopFaces[keep], minlength = nbFaces )
+
+    note( "faces with less than 3 corners", ( sizes < 3 ) & ~dropped )
+
+    dropped |= sizes < 3
+
+    #Newell normal of the remaining corners, half its length is the face area
+
+    keep &= ~dropped[loopFaces]
+
+    sizes = numpy.bincount( loopFaces[keep], minlength = nbFaces )
+
+    if keep.any():
+
+        corners = safeIndices[keep]
+
+        keptFollowing = nextCorners( sizes[sizes > 0], len(corners) )
+
+        p = points[corners].astype(numpy.float64)
+
+        q = p[keptFollowing]
+
+        starts = numpy.zeros( int( (sizes > 0).sum() ), dtype = numpy.int64 )
+
+        numpy.cumsum( sizes[sizes > 0][:-1], out = starts[1:] )
+
+        normals = numpy.add.reduceat( numpy.cross(p, q), starts, axis = 0 )
+
+        extent = float( numpy.ptp( points[corners], axis = 0 ).max() ) if len(corners) > 0 else 0.0
+
+        zero = numpy.zeros( nbFaces, dtype = bool )
+
+        zero[sizes > 0] = numpy.linalg.norm( normals, axis = 1 ) * 0.5 <= ( areaTolerance * extent ) ** 2
+
+        note( "zero-area faces", zero & ~dropped )
+
+        dropped |= zero
+
+        keep &= ~dropped[loopFaces]
+
+    if reject and len(issues) > 0:
+
+        raise MeshValidationError( formatIssues(issues) )
+
+    if len(issues) == 0:
+
+        return mesh, issues
+
+    repaired = dict(mesh)
+
+    repaired["indices"] = indices[keep]
+
+    repaired["faceSizes"] = numpy.bincount( loopFaces[keep], minlength = nbFaces )[~dropped].astype(numpy.int32)
+
+    repaired["normals"] = mesh["normals"].reshape(-1, 3)[keep].reshape(-1)
+
+    repaired["uvs"] = mesh["uvs"].reshape(-1, 2)[keep].reshape(-1)
+
+    repaired["edges"] = mesh["edges"][keep]
+
+    repaired["materials"] = mesh["materials"][~dropped]
+
+    repaired["backMaterials"] = mesh["backMaterials"][~dropped]
+
+    return repaired, issues
+
+def uniqueEdges( indices, faceSizes, sharpFlags ):
+
+    #one edge per vertex pair instead of one per corner, a shared edge is sharp when any
+    #of its corners says so; returns the edge vertices, the edge of each corner and the flags
+
+    indices = numpy.asarray( indices, dtype = numpy.int64 )
+
+    following = nextCorners( numpy.asarray( faceSizes, dtype = numpy.int64 ), len(indices) )
+
+    a = indices
+
+    b = indices[following]
+
+    keys = numpy.minimum(a, b) * ( int( indices.max() ) + 1 if len(indices) > 0 else 1 ) + numpy.maximum(a, b)
+
+    [uniqueKeys, first, inverse] = numpy.unique( keys, return_index = True, return_inverse = True )
+
+    edgeVertices = numpy.empty( 2 * len(uniqueKeys), dtype = numpy.int32 )
+
+    edgeVertices[0::2] = a[first]
+
+    edgeVertices[1::2] = b[first]
+
+    sharp = numpy.bincount( inverse.reshape(-1), weights = ( numpy.asarray(sharpFlags) == 1 ), minlength = len(uniqueKeys) ) > 0
+
+    return edgeVertices, inverse.reshape(-1).astype(numpy.int32), sharp
+
+def formatIssues( issues ):
+
+    parts = []
+
+    for [name, [count, faces]] in issues.items():
+
+        if faces:
+
+            parts.append( "%d %s (%s%s)" % ( count, name, ", ".join( str(f) for f in faces ), ", ..." if count > len(faces) else "" ) )
+
+        else:
+
+            parts.append(name)
+
+    return "; ".join(parts)
@@ -0,0 +1,168 @@
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# Spread3D BlendUp vertex welding with a spatial hash, usable without bpy
+
+import itertools
+
+import numpy
+
+import blendup_validate
+
+#length of one model unit in Blender units (meters)
+
+unitLengths = { "m" : 1.0, "cm" : 0.01, "mm" : 0.001, "i" : 0.0254, "f" : 0.3048 }
+
+#SketchUp merges vertices closer than a thousandth of an inch
+
+sketchUpTolerance = 0.001 * 0.0254
+
+#with cells twice the tolerance wide, a vertex can only weld with the cells on the side of
+#its nearest boundary on each axis, 8 cells instead of 27
+
+neighbourSides = numpy.array( list( itertools.product( [0, 1], repeat = 3 ) ), dtype = numpy.int64 )
+
+def weldTolerance( distance, unit ):
+
+    #distance in model units, 0 for the SketchUp tolerance
+
+    if distance <= 0:
+
+        return sketchUpTolerance
+
+    return distance * unitLengths.get(unit, 1.0)
+
+def cellKeys( cells ):
+
+    #hash of integer cell coordinates, colliding cells only cost extra distance tests
+
+    return ( cells[:, 0] * 73856093 ) ^ ( cells[:, 1] * 19349663 ) ^ ( cells[:, 2] * 83492791 )
+
+def weldGroups( points, tolerance ):
+
+    #smallest index of the vertex cluster each vertex belongs to, vertices closer than
+    #tolerance are chained together
+
+    count = len(points)
+
+    labels = numpy.arange( count, dtype = numpy.int64 )
+
+    if count < 2:
+
+        return labels
+
+    scaled = points / ( 2.0 * tolerance )
+
+    cells = numpy.floor(scaled).astype(numpy.int64)
+
+    directions = numpy.where( scaled - cells < 0.5, -1, 1 )
+
+    keys = cellKeys(cells)
+
+    order = numpy.argsort( keys, kind = 'stable' )
+
+    sortedKeys = keys[order]
+
+    firsts = []
+
+    seconds = []
+
+    for offset in neighbourSides:
+
+        neighbourKeys = cellKeys( cells + directions * offset )
+
+        starts = numpy.searchsorted( sortedKeys, neighbourKeys, 'left' )
+
+        ends = numpy.searchsorted( sortedKeys, neighbourKeys, 'right' )
+
+        sizes = ends - starts
+
+        if offset.any():
+
+            candidates = sizes > 0
+
+        else:
+
+            candidates = sizes > 1
+
+        if not candidates.any():
+
+            continue
+
+        vertices = numpy.flatnonzero(candidates)
+
+        sizes = sizes[vertices]
+
+        first = numpy.repeat( vertices, sizes )
+
+        positions = numpy.repeat( starts[vertices] - numpy.cumsum(sizes) + sizes, sizes ) + numpy.arange( sizes.sum() )
+
+        second = order[positions]
+
+        near = ( second < first ) & ( ( ( points[first] - points[second] ) ** 2 ).sum(axis = 1) <= tolerance * tolerance )
+
+        firsts.append( first[near] )
+
+        seconds.append( second[near] )
+
+    if len(firsts) == 0:
+
+        return labels
+
+    first = numpy.concatenate(firsts)
+
+    second = numpy.concatenate(seconds)
+
+    #label propagation with pointer jumping, a few rounds for the short chains of a weld
+
+    while True:
+
+        previous = labels.copy()
+
+        numpy.minimum.at( labels, first, labels[second] )
+
+        numpy.minimum.at( labels, second, labels[first] )
+
+        labels = labels[labels]
+
+        if ( labels == previous ).all():
+
+            return labels
+
+def weldMesh( mesh, tolerance ):
+
+    #merges coincident vertices and remaps the corners, per corner data stays as is;
+    #returns the flat NumPy record and the vertex counts before and after
+
+    mesh = blendup_validate.asFlatNumpy(mesh)
+
+    points = mesh["vertices"].reshape(-1, 3).astype(numpy.float64)
+
+    labels = weldGroups( points, tolerance )
+
+    [kept, remap] = numpy.unique( labels, return_inverse = True )
+
+    welded = dict(mesh)
+
+    welded["vertices"] = mesh["vertices"].reshape(-1, 3)[kept].reshape(-1)
+
+    indices = mesh["indices"]
+
+    valid = ( indices >= 0 ) & ( indices < len(points) )
+
+    #out of range corners are left for the validation to report
+
+    welded["indices"] = numpy.where( valid, remap.reshape(-1)[ numpy.where(valid, indices, 0) ], indices ).astype(numpy.int32)
+
+    return welded, len(points), len(kept)
@@ -0,0 +1,449 @@
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# Spread3D BlendUp persistent import service
+#
+# Server, inside Blender:
+#
+#   blender --background --python blendup_worker.py -- serve --socket /tmp/blendup.sock
+#
+# Client, with a plain python:
+#
+#   python blendup_worker.py submit --socket /tmp/blendup.sock export.json out.blend --option samples=64
+#   python blendup_worker.py stats --socket /tmp/blendup.sock
+#   python blendup_worker.py shutdown --socket /tmp/blendup.sock
+#
+# Requests and replies are single JSON lines over a Unix socket.
+
+import argparse
+import json
+import os
+import socket
+import sys
+import time
+
+sys.path.append( os.path.dirname( os.path.abspath(__file__) ) )
+
+import blendup_batch
+
+defaultSocket = "/tmp/blendup.sock"
+
+stages = [ "wait", "import", "save", "reset", "total" ]
+
+#scene settings written by applyOptions and applyUnits, restored between jobs
+
+sceneSettings = [ ( "render", [ "engine", "resolution_x", "resolution_y" ] ),
+                  ( "cycles", [ "samples", "preview_samples" ] ),
+                  ( "units", [ "system", "scale_length" ] ),
+                  ( "camera", [ "draw_size", "clip_start", "clip_end" ] ),
+                  ( "sun", [ "matrix_world" ] ),
+                  ( "sunLamp", [ "shadow_method" ] ),
+                  ( "light", [ "use_environment_light" ] ) ]
+
+def settingOwner( bpy, name ):
+
+    scene = bpy.context.scene
+
+    if name == "render":
+        return scene.render
+
+    if name == "cycles":
+        return getattr( scene, "cycles", None )
+
+    if name == "units":
+        return scene.unit_settings
+
+    if name == "camera":
+        return bpy.data.cameras.get("Camera")
+
+    if name == "sun":
+        return bpy.data.objects.get("Sun")
+
+    if name == "sunLamp":
+        return bpy.data.lamps.get("Sun") if hasattr( bpy.data, "lamps" ) else None
+
+    world = bpy.data.worlds.get("World")
+
+    return world.light_settings if world is not None else None
+
+#server side, runs inside blender --background
+
+class ImportService:
+
+    def __init__ ( self, importerPath, template ):
+
+        import bpy
+
+        self.template = template
+
+        self.importer = blendup_batch.loadImporter(importerPath)
+
+        if template:
+            bpy.ops.wm.open_mainfile( filepath = template )
+
+        #shader groups are built once and reused by every job through their fingerprint
+
+        self.importer.Skp2Blend().createBlendUpGroups()
+
+        self.baseline = self.importer.Skp2Blend().snapshotData()
+
+        self.settings = self.snapshotSettings()
+
+        self.latencies = dict( (stage, []) for stage in stages )
+
+        self.jobs = 0
+
+        self.failures = 0
+
+    def snapshotSettings( self ):
+
+        import bpy
+
+        settings = []
+
+        for [name, attributes] in sceneSettings:
+
+            owner = settingOwner( bpy, name )
+
+            if owner is None:
+                continue
+
+            for attribute in attributes:
+
+                if hasattr( owner, attribute ):
+
+                    value = getattr( owner, attribute )
+
+                    settings.append( ( name, attribute, value.copy() if hasattr( value, "copy" ) else value ) )
+
+        return settings
+
+    def reset( self ):
+
+        #drops every datablock created since the baseline, keeping the scene and the groups,
+        #and puts back the units, camera and render settings the job changed
+
+        import bpy
+
+        self.importer.Skp2Blend().removeNewData(self.baseline)
+
+        for [name, attribute, value] in self.settings:
+
+            owner = settingOwner( bpy, name )
+
+            if owner is not None:
+                setattr( owner, attribute, value )
+
+    def runJob( self, request, received ):
+
+        import bpy
+
+        timings = { "wait" : time.time() - received }
+
+        skp = None
+
+        try:
+
+            start = time.time()
+
+            skp = self.importer.Skp2Blend( request.get("options") )
+
+            skp.importJSON( request["export"], request.get("sourceDir") or os.path.dirname(request["export"]) )
+
+            skp.end()
+
+            skp = None
+
+            timings["import"] = time.time() - start
+
+            start = time.time()
+
+            if request.get("output"):
+
+                bpy.ops.wm.save_as_mainfile( filepath = request["output"], check_existing = False, copy = True )
+
+            timings["save"] = time.time() - start
+
+            reply = { "status" : "ok" }
+
+        except Exception as e:
+
+            self.failures += 1
+
+            reply = { "status" : "error", "error" : "%s: %s" % ( type(e).__name__, e ) }
+
+            #a failed import must not leave the collector frozen or the tracer running for the next jobs
+
+            if skp is not None:
+                skp.abort()
+
+        start = time.time()
+
+        self.reset()
+
+        timings["reset"] = time.time() - start
+
+        timings["total"] = time.time() - received
+
+        self.jobs += 1
+
+        for stage in timings:
+
+            self.latencies[stage].append( timings[stage] )
+
+        reply["seconds"] = dict( (stage, round(value, 4)) for stage, value in timings.items() )
+
+        return reply
+
+    def stats( self ):
+
+        def percentile( values, p ):
+
+            values = sorted(values)
+
+            return values[ min( len(values) - 1, int( p * len(values) ) ) ]
+
+        stats = { "jobs" : self.jobs, "failures" : self.failures }
+
+        for stage in stages:
+
+            values = self.latencies[stage]
+
+            if len(values) == 0:
+                continue
+
+            stats[stage] = { "mean" : round( sum(values) / len(values), 4 ),
+                             "p50" : round( percentile(values, 0.5), 4 ),
+                             "p95" : round( percentile(values, 0.95), 4 ),
+                             "max" : round( max(values), 4 ) }
+
+        return stats
+
+    def handle( self, request, received ):
+
+        command = request.get("command", "import")
+
+        if command == "import":
+            return self.runJob( request, received )
+
+        if command == "stats":
+            return self.stats()
+
+        if command == "ping":
+            return { "status" : "ok" }
+
+        return { "status" : "error", "error" : "unknown command %s" % command }
+
+def serve( arguments ):
+
+    service = ImportService( arguments.importer, arguments.template )
+
+    if os.path.exists(arguments.socket):
+        os.remove(arguments.socket)
+
+    server = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+
+    server.bind(arguments.socket)
+
+    server.listen(16)
+
+    print( "BlendUp worker listening on %s" % arguments.socket )
+
+    running = True
+
+    #bpy is not thread safe, connections are served one after the other
+
+    while running:
+
+        connection = server.accept()[0]
+
+        stream = connection.makefile('rw')
+
+        try:
+
+            for line in stream:
+
+                received = time.time()
+
+                if line.strip() == "":
+                    continue
+
+                request = json.loads(line)
+
+                if request.get("command") == "shutdown":
+
+                    reply = { "status" : "ok" }
+
+                    running = False
+
+                else:
+
+                    reply = service.handle( request, received )
+
+                stream.write( json.dumps(reply) + "\n" )
+
+                stream.flush()
+
+                if not running:
+                    break
+
+        except (IOError, ValueError) as e:
+
+            print( "BlendUp worker: dropped connection, %s" % e )
+
+        finally:
+
+            stream.close()
+
+            connection.close()
+
+    server.close()
+
+    os.remove(arguments.socket)
+
+#client side
+
+class BlendUpClient:
+
+    def __init__ ( self, path = defaultSocket ):
+
+        self.connection = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+
+        self.connection.connect(path)
+
+        self.stream = self.connection.makefile('rw')
+
+    def request( self, request ):
+
+        self.stream.write( json.dumps(request) + "\n" )
+
+        self.stream.flush()
+
+        line = self.stream.readline()
+
+        if line == "":
+            raise IOError("BlendUp worker closed the connection")
+
+        return json.loads(line)
+
+    def submit( self, export, output = None, options = None ):
+
+        return self.request( { "command" : "import",
+                               "export" : os.path.abspath(export),
+                               "output" : os.path.abspath(output) if output else None,
+                               "options" : options or {} } )
+
+    def stats( self ):
+
+        return self.request( { "command" : "stats" } )
+
+    def shutdown( self ):
+
+        return self.request( { "command" : "shutdown" } )
+
+    def close( self ):
+
+        self.stream.close()
+
+        self.connection.close()
+
+def parseOptions( values ):
+
+    #key=value pairs, values decoded as JSON when possible
+
+    options = {}
+
+    for value in values:
+
+        [key, text] = value.split("=", 1)
+
+        try:
+            options[key] = json.loads(text)
+        except ValueError:
+            options[key] = text
+
+    return options
+
+def main( argv ):
+
+    parser = argparse.ArgumentParser( description = "Long running BlendUp import worker and its client" )
+
+    #--socket follows the subcommand, as in the examples above
+
+    common = argparse.ArgumentParser( add_help = False )
+
+    common.add_argument( "--socket", default = defaultSocket )
+
+    subparsers = parser.add_subparsers( dest = "command" )
+
+    serveParser = subparsers.add_parser( "serve", parents = [ common ], help = "run the worker, inside blender --background" )
+
+    serveParser.add_argument( "--importer", default = os.path.join( blendup_batch.scriptDir, "import.py" ) )
+
+    serveParser.add_argument( "--template", default = "" )
+
+    submitParser = subparsers.add_parser( "submit", parents = [ common ], help = "import an export and optionally save it" )
+
+    submitParser.add_argument( "export" )
+
+    submitParser.add_argument( "output", nargs = "?" )
+
+    submitParser.add_argument( "--option", action = "append", default = [], help = "option override, key=value" )
+
+    subparsers.add_parser( "stats", parents = [ common ], help = "latency metrics of the worker" )
+
+    subparsers.add_parser( "shutdown", parents = [ common ], help = "stop the worker" )
+
+    arguments = parser.parse_args(argv)
+
+    if arguments.command == "serve":
+
+        serve(arguments)
+
+        return 0
+
+    if arguments.command is None:
+
+        parser.print_help()
+
+        return 1
+
+    client = BlendUpClient(arguments.socket)
+
+    if arguments.command == "submit":
+        reply = client.submit( arguments.export, arguments.output, parseOptions(arguments.option) )
+    elif arguments.command == "stats":
+        reply = client.stats()
+    else:
+        reply = client.shutdown()
+
+    client.close()
+
+    print( json.dumps(reply, indent = 2, sort_keys = True) )
+
+    return 0 if reply.get("status", "ok") == "ok" else 1
+
+if __name__ == "__main__":
+
+    #inside Blender our arguments follow "--"
+
+    argv = sys.argv[1:]
+
+    if "--" in sys.argv:
+        argv = sys.argv[ sys.argv.index("--") + 1 : ]
+
+    code = main(argv)
+
+    if "serve" not in argv:
+        sys.exit(code)
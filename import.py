@@ -15,6 +15,7 @@
 # Spread3D BlendUp import script
 
 import os
+import sys
 import struct
 import bpy
 import json
@@ -23,8 +24,35 @@ from bpy_extras.io_utils import unpack_list
 import mathutils
 import re
 import codecs
+import array
+import queue
+import threading
+import time
+import hashlib
+import io
+import shutil
 from bpy.props import *
 
+sys.path.append( os.path.dirname( os.path.abspath(__file__) ) )
+
+import blendup_json
+import blendup_analyze
+import blendup_select
+import blendup_frustum
+import blendup_container
+import blendup_merge
+import blendup_memory
+import blendup_trace
+
+try:
+    import numpy
+    import blendup_validate
+    import blendup_weld
+    import blendup_decimate
+    import blendup_spatial
+except ImportError:
+    numpy = None
+
 class BlendUpMessageOperator(bpy.types.Operator):
     bl_idname = "blenduperror.message"
     bl_label = "BLENDUP ERROR:"
@@ -47,16 +75,223 @@ if blenderVersion < 2740 :
     bpy.ops.blenduperror.message('INVOKE_DEFAULT', message = buperror)
     raise Exception(buperror)
 
+#increase when the BlendUp shader groups change in a way their specs do not show
+
+blendUpGroupsVersion = 1
+
+#smallest side of the textures scaled down by texture_lod
+
+minimumTexturePixels = 16
+
+#node, socket and link specs of the BlendUp shader groups, read once per session
+
+blendUpGroupSpecsPath = os.path.join( os.path.dirname( os.path.abspath(__file__) ), "blendup_groups.json" )
+
+blendUpGroupSpecs = None
+
+def getBlendUpGroupSpecs():
+
+    global blendUpGroupSpecs
+
+    if blendUpGroupSpecs is None:
+
+        with open(blendUpGroupSpecsPath) as file:
+            blendUpGroupSpecs = json.load(file)["groups"]
+
+    return blendUpGroupSpecs
+
 class Skp2Blend:
 
-    def __init__ ( self ):
+    blendUpGroupNames = [ "BlendUpMonochrome", "BlendUpDiffuse", "BlendUpLight", "BlendUpGlass", "BlendUpGlossy",
+                          "BlendUpMixDiffuseGlossy", "BlendUpMixDiffuseGlossy2", "BlendUpFabric",
+                          "BlendUpToon", "BlendUpAO", "BlendUpPBR" ]
+
+    #types whose untextured definitions are folded into a flat node tree
+
+    flatMaterialTypes = [ "BlendUpDiffuse", "BlendUpMonochrome" ]
+
+    dataCollections = [ "objects", "meshes", "cameras", "materials", "node_groups", "textures", "images" ]
+
+    def __init__ ( self, optionOverrides = None ):
 
         self.scene = bpy.context.scene
 
+        #options forced by the caller on top of the ones stored in the export
+
+        self.optionOverrides = optionOverrides or {}
+
+        #fingerprinted BlendUp shader groups bound to this import
+
+        self.blendUpGroups = {}
+
+        self.blendUpGroupFingerprints = {}
+
+        #content hashes of the export files and use of the shared asset store
+
+        self.fileDigests = {}
+
+        self.storeStats = { "linked" : 0, "stored" : 0, "texturesReused" : 0, "texturesAdded" : 0 }
+
+        self.exportPath = ""
+
+        self.lazy_meshes = False
+
+        #reader of a compressed container export, None for JSON
+
+        self.container = None
+
+        #material definitions of a merged import, None to read the material file
+
+        self.mergedMaterialDefinitions = None
+
+        #import phases, memory_report traces their memory, gc_pause pauses the cyclic
+        #collector while they allocate in bulk
+
+        self.memory = blendup_memory.MemoryPhases( self.optionOverrides.get('memory_report', 0) == 1,
+                                                   self.optionOverrides.get('gc_pause', 1) == 1 )
+
+        #trace_calls times the bpy and RNA call sites of this file, 1 prints their histogram,
+        #a path prefix writes it to <prefix>.txt with a collapsed stack file <prefix>.folded
+
+        self.tracer = None
+
+    #lookup tables and decoded data only needed while importing, the spatial index is a result
+
+    transientState = [ "model", "meshes", "materials", "images", "materialGroups", "meshOffsets", "container",
+                       "culling", "selection", "indexedBounds", "mergedMaterialDefinitions", "blendUpGroups",
+                       "blendUpGroupFingerprints", "fileDigests", "textureLimits", "lodRatios", "decimatedFaces" ]
+
+    def startTracing( self ):
+
+        if self.optionOverrides.get('trace_calls', "") in [ "", 0 ] or self.tracer is not None:
+
+            return
+
+        self.tracer = blendup_trace.CallSiteTracer( [ __file__ ], self.memory.currentPhase )
+
+        self.tracer.start()
+
+    def stopTracing( self ):
+
+        if self.tracer is None:
+
+            return
+
+        self.tracer.stop()
+
+        output = self.optionOverrides.get('trace_calls')
+
+        lines = self.tracer.report()
+
+        if output == 1:
+
+            for line in lines:
+
+                print(line)
+
+        else:
+
+            with codecs.open( output + ".txt", "w", "utf-8" ) as file:
+
+                file.write( "\n".join(lines) + "\n" )
+
+            self.tracer.writeCollapsed( output + ".folded" )
+
+            print( "BlendUp call sites written to %s.txt and %s.folded" % ( output, output ) )
+
+        self.tracer = None
+
     def end( self ):
 
         self.scene.update()
 
+        self.stopTracing()
+
+        if self.container is not None:
+
+            self.container.close()
+
+        #a lazy import keeps its state to materialize its proxies
+
+        if lazyImporters.get( self.exportPath ) is not self:
+
+            self.releaseState()
+
+        self.memory.restore()
+
+        if self.memory.trace:
+
+            for line in self.memory.report():
+
+                print(line)
+
+    def abort( self ):
+
+        #after an import failed or was cancelled: tracer, container, collector and tracing
+        #back as they were, without the scene update and the reports of end
+
+        self.stopTracing()
+
+        if self.container is not None:
+
+            self.container.close()
+
+        if lazyImporters.get( getattr( self, "exportPath", None ) ) is self:
+
+            del lazyImporters[self.exportPath]
+
+        self.releaseState()
+
+        self.memory.restore()
+
+    def releaseState( self ):
+
+        for name in self.transientState:
+
+            if hasattr( self, name ):
+
+                setattr( self, name, None )
+
+    def snapshotData( self ):
+
+        #pointers of the datablocks existing before an import, to undo a cancelled one
+
+        snapshot = {}
+
+        for collection in self.dataCollections:
+
+            snapshot[collection] = set( data.as_pointer() for data in getattr(bpy.data, collection) )
+
+        return snapshot
+
+    def removeNewData( self, snapshot ):
+
+        #objects go first so the meshes, materials and groups lose their users
+
+        for collection in self.dataCollections:
+
+            blocks = getattr(bpy.data, collection)
+
+            for data in list(blocks):
+
+                if data.as_pointer() in snapshot[collection]:
+
+                    continue
+
+                if collection == "objects":
+
+                    for scene in bpy.data.scenes:
+
+                        if scene.objects.get(data.name) == data:
+
+                            scene.objects.unlink(data)
+
+                data.use_fake_user = False
+
+                data.user_clear()
+
+                blocks.remove(data)
+
     def matrixLookat(self, eye, target, up):
         z = eye - target
         x = up.cross(z)
@@ -84,1345 +319,2924 @@ class Skp2Blend:
 
     def importJSON( self, path, sourceDir):
 
+        self.runSteps( self.importSteps( path, sourceDir ) )
+
+    def runSteps( self, steps ):
+
+        for step in steps:
+
+            pass
+
+    def importSteps( self, path, sourceDir ):
+
+        #resumable import, each yield ends one unit of work (mesh, node, material)
+
+        self.startTracing()
+
         self.sourceDir = sourceDir
 
-        #load json model from file
-        fileSize = os.stat(path).st_size
-        file = open(path, 'rb')
-        value = file.read(fileSize).decode('utf-8')
-        model = json.loads(value)
-        file.close()
+        self.exportPath = os.path.abspath(path)
 
+        self.container = None
 
-        #read options
-        options = model['options']
+        self.mergedMaterialDefinitions = None
 
-        self.options = options
+        self.progressTotal = 0
 
-        self.useBlenderCycles = (options['rendering'] == "Blender Cycles")
+        #a positive pipeline depth overlaps decoding with the Blender writes
 
-        if options["shadow"] == 1:
-            sun = bpy.data.objects.get('Sun')
+        self.pipeline_depth = int( self.optionOverrides.get('pipeline_depth', 0) )
 
-            if sun :
-                v1 = mathutils.Vector((0,0,0))
-                v2 = mathutils.Vector((-options["shadowX"],-options["shadowY"],-options["shadowZ"]))
+        #lazy imports create bounding box proxies, the geometry is read when materialized
 
-                sun.matrix_world = self.matrixLookat(v1,v2,mathutils.Vector((0,0,1)))
-            if self.useBlenderCycles == False:
-                if bpy.data.lamps.get("Sun") != None:
-                    bpy.data.lamps["Sun"].shadow_method='RAY_SHADOW'
+        self.lazy_meshes = ( self.optionOverrides.get('lazy_meshes', 0) == 1 )
 
-        if self.useBlenderCycles == False:
-            bpy.data.worlds["World"].light_settings.use_environment_light =True
+        #include and exclude patterns import subtrees, only the mesh records they use are decoded
 
-        bpy.data.scenes["Scene"].render.resolution_x = options["vpWidth"]
+        self.include = blendup_select.patternList( self.optionOverrides.get('include') )
 
-        bpy.data.scenes["Scene"].render.resolution_y = options["vpHeight"]
+        self.exclude = blendup_select.patternList( self.optionOverrides.get('exclude') )
 
+        #render jobs can drop ("skip") or box ("proxy") the nodes outside the frusta of the views
 
+        self.frustum_culling = self.optionOverrides.get('frustum_culling', "")
 
-        bpy.context.scene.cycles.samples = options['samples']
+        self.frustum_views = blendup_select.patternList( self.optionOverrides.get('frustum_views') )
 
-        bpy.context.scene.cycles.preview_samples = options['samples']
+        if self.lazy_meshes:
 
+            yield from self.importLazySteps( path )
 
-        if self.useBlenderCycles:
+        elif self.include or self.exclude or self.frustum_culling != "":
+
+            yield from self.importSelectedSteps( path )
+
+        elif blendup_container.isContainer(path):
+
+            if self.pipeline_depth > 0:
+
+                print( "BlendUp pipeline ignored with containers: their meshes are decoded in parallel" )
+
+            yield from self.importContainerSteps( path )
+
+        elif self.pipeline_depth > 0:
+
+            yield from self.importPipelinedSteps( path )
 
-            if hasattr(bpy.context.scene,"cycles") == False:
-                buperror = "Please activate Cycles Render Engine addon"
-                bpy.ops.blenduperror.message('INVOKE_DEFAULT', message = buperror)
-                raise Exception(buperror)
-            bpy.context.scene.render.engine = "CYCLES"
         else:
-            bpy.context.scene.render.engine = "BLENDER_RENDER"
 
-        #if options['useGPU'] == 0:
-        #    bpy.context.user_preferences.system.compute_device_type = "NONE"
-        #else:
-       #     bpy.context.user_preferences.system.compute_device_type = "CUDA"
+            #load json model from file, optionally with a faster backend and flat mesh buffers
+            with self.memory.phase( "decode", bulk = True ):
+                fileSize = os.stat(path).st_size
+                file = open(path, 'rb')
+                value = file.read(fileSize)
+                file.close()
+                model = blendup_json.loads(value, self.optionOverrides.get('json_backend'), self.optionOverrides.get('typed_arrays'))
+                value = None
 
-        self.pack_texture = True
+            #the decoded export lives until the end of the import, later passes skip it
+            self.memory.freeze()
 
-        self.back_materials = ( options['back_materials'] == 1)
+            #read options
+            self.readOptions( model['options'] )
 
-        self.use_sharp_edge = ( options['use_sharp_edge'] == 1)
+            self.applyOptions()
 
-        self.use_seam = ( options['use_seam'] == 1)
+            #create model
+            self.model = model
 
-        self.use_freestyle_mark = ( options['use_freestyle_mark'] == 1)
+            self.progressTotal = len( model["meshes"] ) + self.countNodes( model["hierarchy"][0], {} )
 
+            yield from self.parseModelSteps()
 
-        self.unit = options['unit']
+        self.applyUnits()
 
-        self.materials = {}
+    def importMergedJSON( self, exports ):
 
-        self.images = {}
+        self.runSteps( self.importMergedSteps( exports ) )
 
-        self.materialGroups = {}
+    def importMergedSteps( self, exports ):
 
-        #create model
-        self.model = model
-        self.parseModel()
+        #exports is a list of [path, sourceDir] built into one scene, their shared definitions,
+        #materials and textures are created once (see blendup_merge)
 
-        #set units
+        self.startTracing()
 
-        if self.unit == "m" or self.unit == "cm" or self.unit == "mm" :
-            bpy.context.scene.unit_settings.system = "METRIC"
-        else:
-            bpy.context.scene.unit_settings.system = "IMPERIAL"
+        start = time.time()
 
-        if self.unit == "cm":
-            bpy.context.scene.unit_settings.scale_length = 100
-            bpy.data.cameras["Camera"].draw_size = 0.01
-            bpy.data.cameras["Camera"].clip_start = 0.01
-            bpy.data.cameras["Camera"].clip_end = bpy.data.cameras["Camera"].clip_start * 2000
-        elif self.unit == "mm":
-            bpy.context.scene.unit_settings.scale_length = 1000
-            bpy.data.cameras["Camera"].draw_size = 0.001
-            bpy.data.cameras["Camera"].clip_start = 0.001
-            bpy.data.cameras["Camera"].clip_end = bpy.data.cameras["Camera"].clip_start * 2000
-        elif self.unit == "i":
-            bpy.context.scene.unit_settings.scale_length = 12
-            bpy.data.cameras["Camera"].draw_size = 0.0254
-            bpy.data.cameras["Camera"].clip_start = 0.0254
-            bpy.data.cameras["Camera"].clip_end = bpy.data.cameras["Camera"].clip_start * 2000
-        elif self.unit == "f":
-            bpy.data.cameras["Camera"].draw_size = 0.3048
+        merged = blendup_merge.MergedExports( exports )
 
+        self.sourceDir = merged.sourceDir
 
-    def parseModel( self ):
+        self.exportPath = ""
 
-        #parse meshes
+        self.container = None
 
-        self.parseMeshes( )
+        self.progressTotal = 0
 
-        #parse hierarchy
+        self.pipeline_depth = 0
 
-        self.parseNode( self.model["hierarchy"][0], None, -1)
+        self.lazy_meshes = False
 
-        #convert created materials to Cycles materials
+        self.include = []
 
-        if self.useBlenderCycles:
+        self.exclude = []
 
-            self.createCycleMaterials()
+        self.frustum_culling = ""
 
-        else:
+        self.readOptions( merged.model['options'] )
 
-            self.createBIMaterials()
-        #create camera
+        self.mergedMaterialDefinitions = merged.materialDefinitions
 
-        self.createCamera()
+        self.applyOptions()
 
-    def createCamera( self ) :
+        self.model = merged.model
 
-        views = self.model["views"]
+        for line in merged.report():
 
-        first = True
+            print(line)
 
-        for view in views:
+        self.progressTotal = len( self.model["meshes"] ) + self.countNodes( self.model["hierarchy"][0], {} )
 
+        yield from self.parseModelSteps()
 
+        self.applyUnits()
 
-            if ( first and len(bpy.data.cameras)>= 1 ):
+        print( "BlendUp merged import: %d materials, %d images created in %.2fs" % ( len( self.materials ), len( self.images ), time.time() - start ) )
 
-                camera = bpy.data.cameras[0]
+    def countNodes( self, node, definitionCounts ):
 
-                camera_object  = bpy.context.scene.camera
+        #number of objects created for a node, shared definitions are counted once
 
-                first = False
+        if "definition" not in node:
 
-            else:
+            return 1 + self.countChildren( node, definitionCounts )
 
-                camera = bpy.data.cameras.new(view["name"])
+        definitionId = node["definition"]
 
-                camera_object = bpy.data.objects.new(view["name"], camera)
+        if definitionId not in definitionCounts:
 
-                bpy.context.scene.objects.link(camera_object)
+            definitionCounts[definitionId] = self.countChildren( self.model["definitions"][definitionId], definitionCounts )
 
+        return 1 + definitionCounts[definitionId]
 
+    def countChildren( self, node, definitionCounts ):
 
-            mode = view["mode"]
+        count = 0
 
-            if mode == "perspective":
+        if "children" in node:
 
-                camera.type = "PERSP"
+            for child in node["children"]:
 
-                w = float(self.options["vpWidth"])
+                count += self.countNodes( child, definitionCounts )
 
-                h = float(self.options["vpHeight"])
+        return count
 
-                ratio = w / h
+    def importLazySteps( self, path ):
 
-                #camera.lens = 16/(ratio*math.tan(180/3.14159265359* view["fov"] /2))
+        #mesh records are indexed by byte offset and only their vertices are scanned,
+        #materializeMeshes later reads the records of the proxies a selection uses
 
-                fieldOfViewY = view["fov"]* 3.14159265359 / 180
+        start = time.time()
 
-                camera.sensor_width = 32
+        data = self.indexExport( path, self.sourceDir )
 
-                camera.angle = 2 * math.atan(math.tan(fieldOfViewY * 0.5) * ratio)
+        self.applyOptions()
 
+        referenced = self.selectNodes()
 
-                #camera.lens = camera.sensor_width / ( 2 * math.tan(0.5* camera.angle))
+        if self.frustum_culling != "":
 
-            else:
+            print( "BlendUp frustum culling ignored with lazy meshes" )
 
-                camera.type = "ORTHO"
-                camera.ortho_scale = view["orthoHeight"]
+        if self.static_batching:
 
-            eye = mathutils.Vector(view["eye"])
+            #batches merge the geometry of every instance, all the records are needed
 
-            target = mathutils.Vector(view["target"])
+            print( "BlendUp lazy meshes ignored with static batching" )
 
-            up = mathutils.Vector(view["up"])
+            self.lazy_meshes = False
 
-            camera_object.matrix_world = self.matrixLookat(eye, target, up)
+            self.loadIndexedRecords( data, referenced )
 
+        else:
 
+            self.meshes = []
 
-    def getImage( self, name ):
+            self.indexedBounds = []
 
-        img = self.images.get(name)
+            for meshId in range( len( self.meshOffsets ) ):
 
-        if img is not None:
+                if meshId not in referenced:
 
-            return img
+                    self.meshes.append(None)
 
-        absPath = self.sourceDir + "/" + name
+                    self.indexedBounds.append(None)
 
-        try:
-            img = bpy.data.images.load(absPath)
+                    continue
 
-            if self.pack_texture :
+                self.indexedBounds.append( self.indexedRecordBounds( data, meshId ) )
 
-                bpy.ops.image.pack({'edit_image': img})
+                self.meshes.append( self.createProxyMesh( meshId, self.indexedBounds[-1] ) )
 
-            self.images[name] = img
+                yield
 
-        except:
-            raise NameError("Cannot load image %s" % absPath)
+            lazyImporters[self.exportPath] = self
 
-        return img
+        data = None
 
-    def getEmptyMaterial( self, frontMaterialId, backMaterialId ):
+        self.progressTotal = len(referenced) + self.countNodes( self.model["hierarchy"][0], {} )
 
-        key = str(frontMaterialId)+"#"
+        yield from self.parseModelSteps( meshesCreated = self.lazy_meshes )
 
-        if self.back_materials:
+        if self.lazy_meshes:
 
-            key +=  str(backMaterialId)
+            print( "BlendUp lazy import: %d mesh records indexed, scene ready in %.2fs" % ( len( self.meshOffsets ), time.time() - start ) )
 
-        material = self.materials.get(key);
+    def importContainerSteps( self, path ):
 
-        if material is None:
+        data = self.indexExport( path, self.sourceDir )
 
-            material = bpy.data.materials.new(name=key)
+        self.applyOptions()
 
-            self.materials[ key ] = material
+        start = time.time()
 
-        return material
+        self.loadIndexedRecords( data, set( range( len( self.meshOffsets ) ) ) )
 
-    def parseNode( self, node, parent, parentMaterial ):
+        print( "BlendUp container: %d meshes decoded in %.2fs" % ( len( self.meshOffsets ), time.time() - start ) )
 
-        nodeName = node["name"]
+        self.progressTotal = len( self.meshOffsets ) + self.countNodes( self.model["hierarchy"][0], {} )
 
-        n = node["matrix"]
+        yield from self.parseModelSteps()
 
-        nodeMaterial = node["material"]
+        self.container.close()
 
-        if "definition" in node:
+    def importSelectedSteps( self, path ):
 
-            definitionId = node["definition"]
+        #the hierarchy is pruned before any mesh record is decoded, the materials and
+        #textures follow from the meshes that get built
 
-            node = self.model["definitions"][definitionId]
+        data = self.indexExport( path, self.sourceDir )
 
-        children = None
+        self.applyOptions()
 
-        if  "children" in node:
+        referenced = self.selectNodes()
 
-            children = node["children"]
+        self.culling = None
 
-        objectData = None
+        proxies = []
 
-        if( nodeMaterial == -1 ):
+        if self.frustum_culling != "":
 
-            nodeMaterial = parentMaterial
+            [referenced, proxies] = self.cullNodes( data, referenced )
 
-        if "mesh" in node:
+        self.loadIndexedRecords( data, referenced )
 
-            objectData = self.meshes[node["mesh"]]
+        self.model["meshes"].extend( blendup_frustum.boxRecord(bounds) for bounds in proxies )
 
-        object = bpy.data.objects.new(nodeName, objectData)
+        data = None
 
-        if parent is not None:
+        if self.selection is not None:
 
-            object.parent = parent
+            materials = set( self.selection.materials )
 
-        [pos,rot,scale] = mathutils.Matrix( [ [n[0],n[4],n[8],n[12]],
-                                                [n[1],n[5],n[9],n[13]],
-                                                [n[2],n[6],n[10],n[14]],
-                                                [n[3],n[7],n[11],n[15]] ] ).decompose()
+            for mesh in self.model["meshes"]:
+
+                if mesh is not None:
+
+                    materials.update( m for pair in blendup_analyze.meshMaterialPairs(mesh) for m in pair if m != -1 )
+
+            print( "BlendUp selection: %d of %d meshes, %d objects, %d materials" % ( len( self.selection.meshes ), len( self.meshOffsets ), self.selection.nodes, len(materials) ) )
+
+        if self.culling is not None and self.texture_lod:
+
+            self.computeTextureLimits()
+
+        self.progressTotal = len(referenced) + len(proxies) + self.countNodes( self.model["hierarchy"][0], {} )
+
+        yield from self.parseModelSteps()
+
+        if self.texture_lod:
+
+            print( "BlendUp texture LOD: %d of %d textures scaled down" % ( self.scaledTextures, len( self.images ) ) )
+
+    def cullNodes( self, data, referenced ):
+
+        #world bounds of the nodes against the frusta of the views, from the vertices of the records;
+        #returns the meshes of the visible nodes and the bounds of the proxy boxes
+
+        frusta = blendup_frustum.viewFrusta( self.model.get("views", []), self.frustum_views, self.options, self.frustum_margin )
+
+        if len(frusta) == 0:
+
+            print( "BlendUp frustum culling ignored: no view to cull with" )
+
+            return referenced, []
+
+        bounds = [ self.indexedRecordBounds( data, meshId ) if meshId in referenced else None
+                   for meshId in range( len( self.meshOffsets ) ) ]
+
+        #with NumPy the world bounds of all the nodes are computed level by level beforehand
+
+        hierarchy = blendup_spatial.FlatHierarchy( self.model, bounds ) if numpy is not None else None
+
+        self.culling = blendup_frustum.Culling( self.model, bounds, frusta, self.frustum_culling, len( self.meshOffsets ), hierarchy )
+
+        self.model["hierarchy"] = [ self.culling.root ]
+
+        if self.lod_pixels > 0:
+
+            for [meshId, pixels] in self.culling.meshPixels.items():
+
+                if pixels < self.lod_pixels:
+
+                    self.lodRatios[meshId] = max( ( pixels / self.lod_pixels ) ** 2, self.polygon_min_ratio )
+
+        print( "BlendUp frustum culling (%s, %d views): %d nodes kept, %d culled, %d of %d meshes used, %d below %d pixels" %
+               ( self.frustum_culling, len(frusta), self.culling.kept, self.culling.culled, len( self.culling.meshes ), len(referenced), len( self.lodRatios ), self.lod_pixels ) )
+
+        return self.culling.meshes, self.culling.proxies
+
+    def computeTextureLimits( self ):
+
+        #largest screen size of the objects using each texture, through the materials of their meshes
+
+        materialPixels = {}
+
+        for [[meshId, nodeMaterial], pixels] in self.culling.instancePixels.items():
+
+            for pair in blendup_analyze.meshMaterialPairs( self.model["meshes"][meshId] ):
+
+                for materialId in pair:
+
+                    if materialId == -1:
+
+                        materialId = nodeMaterial
+
+                    materialPixels[materialId] = max( materialPixels.get(materialId, 0.0), pixels )
+
+        definitions = self.parseMaterialDefinitions()
+
+        for [materialId, pixels] in materialPixels.items():
+
+            if materialId + 1 < 0 or materialId + 1 >= len(definitions):
+
+                continue
+
+            for value in definitions[materialId + 1].values():
+
+                for name in re.findall(r"Texture\w*\(([^)]*)\)", value):
+
+                    name = self.cleanSpaces(name)
+
+                    self.textureLimits[name] = max( self.textureLimits.get(name, 0.0), pixels )
+
+    def selectNodes( self ):
+
+        #prunes the hierarchy to the include and exclude patterns, returns the meshes it uses
+
+        self.selection = None
+
+        if not self.include and not self.exclude:
+
+            return set( range( len( self.meshOffsets ) ) )
+
+        self.selection = blendup_select.Selection( self.model, self.include, self.exclude )
+
+        self.model["hierarchy"] = [ self.selection.root ]
+
+        return self.selection.meshes
+
+    def loadIndexedRecords( self, data, referenced ):
+
+        with self.memory.phase( "decode", bulk = True ):
+
+            self.decodeIndexedRecords( data, referenced )
+
+        self.memory.freeze()
+
+    def decodeIndexedRecords( self, data, referenced ):
+
+        #decodes the referenced mesh records, the others stay None
+
+        if self.container is not None:
+
+            #only the chunks of the referenced meshes are read, decompressed in parallel threads
+
+            meshIds = sorted(referenced)
+
+            threads = int( self.optionOverrides.get('container_threads', 0) ) or None
+
+            meshes = dict( zip( meshIds, self.container.loadMeshes( meshIds, self.optionOverrides.get('typed_arrays'), threads ) ) )
+
+            self.model["meshes"] = [ meshes.get(meshId) for meshId in range( len( self.meshOffsets ) ) ]
+
+            return
+
+        file = io.BytesIO(data)
+
+        self.model["meshes"] = [ self.loadIndexedRecord( file, meshId ) if meshId in referenced else None
+                                 for meshId in range( len( self.meshOffsets ) ) ]
+
+    def loadIndexedRecord( self, file, meshId ):
+
+        if self.container is not None:
+
+            return self.container.loadMesh( meshId, self.optionOverrides.get('typed_arrays') )
+
+        [offset, length] = self.meshOffsets[meshId]
+
+        return blendup_json.loadRecord( file, offset, length, self.optionOverrides.get('json_backend'), self.optionOverrides.get('typed_arrays') )
+
+    def indexExport( self, path, sourceDir ):
+
+        #indexes the mesh records and decodes the rest of the export, returns its bytes;
+        #containers index their chunks themselves, no bytes are returned
+
+        with self.memory.phase( "index", bulk = True ):
+
+            if blendup_container.isContainer(path):
+
+                self.container = blendup_container.Container(path)
+
+                self.meshOffsets = self.container.meshEntries
+
+                self.model = self.container.loadModel()
+
+                data = None
+
+            else:
+
+                self.container = None
+
+                with open(path, 'rb') as file:
+
+                    data = file.read()
+
+                [self.meshOffsets, rest] = blendup_json.indexRecords(data)
+
+                self.model = blendup_json.loads( rest, self.optionOverrides.get('json_backend') )
+
+                rest = None
+
+        self.readOptions( self.model['options'] )
+
+        self.sourceDir = sourceDir
+
+        self.exportPath = os.path.abspath(path)
+
+        return data
+
+    def indexedRecordBounds( self, data, meshId ):
+
+        if self.container is not None:
+
+            return self.container.meshBounds(meshId)
+
+        [offset, length] = self.meshOffsets[meshId]
+
+        return blendup_json.recordBounds( data[offset : offset + length] )
+
+    def findConvertedMaterials( self ):
+
+        #materials converted for this export before a reload are found through their key
+
+        for material in bpy.data.materials:
+
+            if material.get("blendup_export") == self.exportPath:
+
+                self.materials[ material["blendup_key"] ] = material
+
+    def createProxyMesh( self, meshId, bounds ):
+
+        me = bpy.data.meshes.new("proxy")
+
+        if bounds is not None:
+
+            corners = [ ( bounds[i & 1][0], bounds[(i >> 1) & 1][1], bounds[(i >> 2) & 1][2] ) for i in range(8) ]
+
+            me.from_pydata( corners, [], [ (0,2,3,1), (4,5,7,6), (0,1,5,4), (2,6,7,3), (0,4,6,2), (1,3,7,5) ] )
+
+        me["blendup_mesh"] = meshId
+
+        me["blendup_export"] = self.exportPath
+
+        me["blendup_source_dir"] = self.sourceDir
+
+        return me
+
+    def materializeMeshes( self, proxies ):
+
+        #replaces proxy meshes by their geometry in every object using them, returns their number
+
+        start = time.time()
+
+        proxies = [ proxy for proxy in proxies if proxy.get("blendup_export") == self.exportPath ]
+
+        users = {}
+
+        for object in bpy.data.objects:
+
+            if object.type == 'MESH' and object.data.get("blendup_mesh") is not None:
+
+                users.setdefault( object.data.name, [] ).append(object)
+
+        nbObjects = 0
+
+        with open(self.exportPath, 'rb') as file:
+
+            for proxy in proxies:
+
+                meshId = proxy["blendup_mesh"]
+
+                record = self.loadIndexedRecord( file, meshId )
+
+                me = self.writeMesh( self.prepareMesh( self.cleanMesh(record) ) )
+
+                objects = users.get( proxy.name, [] )
+
+                if hasattr( proxy, "user_remap" ):
+
+                    proxy.user_remap(me)
+
+                else:
+
+                    for object in objects:
+
+                        object.data = me
+
+                bpy.data.meshes.remove(proxy)
+
+                if meshId < len( getattr( self, "meshes", [] ) ):
+
+                    self.meshes[meshId] = me
+
+                for object in objects:
+
+                    self.assignNodeMaterials( object, me, object.get("blendup_node_material", -1) )
+
+                nbObjects += len(objects)
+
+        self.convertNewMaterials()
+
+        print( "BlendUp materialized %d meshes for %d objects in %.2fs" % ( len(proxies), nbObjects, time.time() - start ) )
+
+        return len(proxies)
+
+    def convertNewMaterials( self ):
+
+        #only the materials created since the last conversion, they have no key yet
+
+        converted = self.materials
+
+        self.materials = dict( (key, material) for [key, material] in converted.items() if material.get("blendup_key") is None )
+
+        if self.useBlenderCycles:
+
+            self.createCycleMaterials()
+
+        else:
+
+            self.createBIMaterials()
+
+        self.materials = converted
+
+    def importPipelinedSteps( self, path ):
+
+        #a background thread decodes the mesh records and prepares their buffers,
+        #the main thread performs the bpy writes as soon as each one is ready
+
+        workQueue = queue.Queue( self.pipeline_depth )
+
+        self.pipelineStopped = False
+
+        self.pipelineDecodeTime = 0.0
+
+        self.pipelineWriteTime = 0.0
+
+        start = time.time()
+
+        producer = threading.Thread( target = self.produceMeshes, args = (path, workQueue) )
+
+        producer.daemon = True
+
+        producer.start()
+
+        model = { "meshes" : [] }
+
+        self.meshes = []
+
+        yield from self.memory.phaseSteps( "pipeline", self.consumeMeshesSteps( workQueue, producer, model ), bulk = True )
+
+        self.model = model
+
+        self.progressTotal += self.countNodes( model["hierarchy"][0], {} )
+
+        print( "BlendUp pipeline: decode %.2fs, mesh writes %.2fs, wall %.2fs" % ( self.pipelineDecodeTime, self.pipelineWriteTime, time.time() - start ) )
+
+        self.reportValidation()
+
+        yield from self.parseModelSteps( meshesCreated = not self.static_batching )
+
+    def consumeMeshesSteps( self, workQueue, producer, model ):
+
+        #writes the prepared meshes of the producer, one step each
+
+        try:
+
+            while True:
+
+                item = workQueue.get()
+
+                kind = item[0]
+
+                if kind == "end":
+
+                    break
+
+                if kind == "error":
+
+                    raise item[1]
+
+                if kind == "options":
+
+                    model["options"] = self.options
+
+                    self.applyOptions()
+
+                    #the records are gone once written, the spatial index gets their bounds from the producer
+
+                    if self.spatial_index:
+                        self.indexedBounds = []
+
+                elif kind == "value":
+
+                    model[item[1]] = item[2]
+
+                elif kind == "raw":
+
+                    model["meshes"].append(item[1])
+
+                    self.progressTotal += 1
+
+                else:
+
+                    writeStart = time.time()
+
+                    self.meshes.append( self.writeMeshChunks(item[1]) )
+
+                    if self.spatial_index:
+                        self.indexedBounds.append(item[2])
+
+                    self.pipelineWriteTime += time.time() - writeStart
+
+                    self.progressTotal += 1
+
+                    yield
+
+        finally:
+
+            #unblock the producer if we leave early
+
+            self.pipelineStopped = True
+
+            while producer.is_alive():
+
+                try:
+                    workQueue.get(timeout = 0.1)
+                except queue.Empty:
+                    pass
+
+    def putWork( self, workQueue, item ):
+
+        while not self.pipelineStopped:
+
+            try:
+                workQueue.put(item, timeout = 0.1)
+                return
+            except queue.Full:
+                pass
+
+        raise StopIteration()
+
+    def skipSpaces( self, text, pos ):
+
+        return self.whitespace.match(text, pos).end()
+
+    def produceMeshes( self, path, workQueue ):
+
+        self.whitespace = re.compile(r'\s*')
+
+        decoder = json.JSONDecoder()
+
+        try:
+
+            start = time.time()
+
+            with open(path, 'rb') as file:
+
+                text = file.read().decode('utf-8')
+
+            #options drive how meshes are prepared, read them ahead wherever they are stored
+
+            match = re.search(r'"options"\s*:\s*\{', text)
+
+            if match is None:
+
+                raise NameError("No options found in %s" % path)
+
+            options = decoder.raw_decode(text, match.end() - 1)[0]
+
+            self.readOptions( options )
+
+            self.pipelineDecodeTime += time.time() - start
+
+            self.putWork( workQueue, ("options",) )
+
+            #walk the top level object, streaming the records of the meshes array
+
+            pos = self.skipSpaces(text, self.skipSpaces(text, 0) + 1)
+
+            while text[pos] != '}':
+
+                start = time.time()
+
+                [key, pos] = decoder.raw_decode(text, pos)
+
+                pos = self.skipSpaces(text, self.skipSpaces(text, pos) + 1)
+
+                if key == "meshes":
+
+                    pos = self.skipSpaces(text, pos + 1)
+
+                    while text[pos] != ']':
+
+                        start = time.time()
+
+                        [record, pos] = decoder.raw_decode(text, pos)
+
+                        pos = self.skipSpaces(text, pos)
+
+                        if text[pos] == ',':
+
+                            pos = self.skipSpaces(text, pos + 1)
+
+                        if self.static_batching:
+
+                            item = ("raw", record)
+
+                        else:
+
+                            item = ("mesh", self.prepareMeshChunks(record), blendup_spatial.meshBounds(record) if self.spatial_index else None)
+
+                        self.pipelineDecodeTime += time.time() - start
+
+                        self.putWork( workQueue, item )
+
+                    pos += 1
+
+                else:
+
+                    [value, pos] = decoder.raw_decode(text, pos)
+
+                    self.pipelineDecodeTime += time.time() - start
+
+                    if key != "options":
+
+                        self.putWork( workQueue, ("value", key, value) )
+
+                pos = self.skipSpaces(text, pos)
+
+                if text[pos] == ',':
+
+                    pos = self.skipSpaces(text, pos + 1)
+
+            self.putWork( workQueue, ("end",) )
+
+        except StopIteration:
+
+            pass
+
+        except Exception as e:
+
+            try:
+                self.putWork( workQueue, ("error", e) )
+            except StopIteration:
+                pass
+
+    def readOptions( self, options ):
+
+        options.update(self.optionOverrides)
+
+        self.options = options
+
+        self.useBlenderCycles = (options['rendering'] == "Blender Cycles")
+
+        #with a shared asset store the images are linked from it instead of packed in each file
+
+        self.pack_texture = ( options.get('asset_store', "") == "" )
+
+        self.back_materials = ( options['back_materials'] == 1)
+
+        self.use_sharp_edge = ( options['use_sharp_edge'] == 1)
+
+        self.use_seam = ( options['use_seam'] == 1)
+
+        self.use_freestyle_mark = ( options['use_freestyle_mark'] == 1)
+
+        #static batching merges all instances into one mesh per material (and per cell)
+
+        self.static_batching = ( options.get('static_batching', 0) == 1)
+
+        self.batch_cell_size = float( options.get('batch_cell_size', 0) )
+
+        #chunking splits very large meshes into "grid" cells or "octree" leaves
+
+        self.chunk_mode = options.get('chunk_mode', "")
+
+        if self.chunk_mode not in [ "", "grid", "octree" ]:
+            raise NameError("Unknown chunk_mode %s, use grid or octree" % self.chunk_mode)
+
+        self.chunk_size = float( options.get('chunk_size', 1000) )
+
+        self.chunk_max_faces = int( options.get('chunk_max_faces', 20000) )
+
+        self.chunk_min_faces = int( options.get('chunk_min_faces', 100000) )
+
+        #untextured diffuse and monochrome materials become a flat node tree instead of nested groups
+
+        self.flat_materials = ( options.get('flat_materials', 1) == 1)
+
+        #"repair" and "reject" check the records with NumPy instead of me.validate, "strict" does both,
+        #"blender" only runs me.validate
+
+        self.mesh_validation = options.get('mesh_validation', "repair")
+
+        if numpy is None:
+
+            self.mesh_validation = "blender"
+
+        self.validatedMeshes = 0
+
+        self.repairedMeshes = 0
+
+        #welding merges the vertices split at uv and normal seams, weld_distance is in model units
+
+        self.weld = ( options.get('weld', 0) == 1 and numpy is not None )
+
+        self.weld_distance = float( options.get('weld_distance', 0) )
+
+        self.weldCounts = [ 0, 0 ]
+
+        #with a polygon budget (flattened faces, 0 for none) the heaviest definitions are decimated,
+        #keep_full_meshes keeps their full resolution meshes as alternates
+
+        self.polygon_budget = int( options.get('polygon_budget', 0) ) if numpy is not None else 0
+
+        self.polygon_min_ratio = float( options.get('polygon_min_ratio', 0.05) )
+
+        self.keep_full_meshes = ( options.get('keep_full_meshes', 1) == 1)
+
+        self.decimatedFaces = {}
+
+        #with frustum culling, lod_pixels decimates the meshes smaller on screen and texture_lod
+        #scales the textures down to the screen size of their objects
+
+        self.frustum_margin = float( options.get('frustum_margin', 0.05) )
+
+        self.lod_pixels = float( options.get('lod_pixels', 0) ) if numpy is not None else 0
+
+        self.texture_lod = ( options.get('texture_lod', 0) == 1 )
+
+        #spatial_index computes the world matrices and bounds of every object before they are
+        #created and indexes them, see buildSpatialIndex
+
+        self.spatial_index = ( options.get('spatial_index', 0) == 1 ) and numpy is not None
+
+        self.indexedBounds = None
+
+        self.hierarchy = None
+
+        self.spatialIndex = None
+
+        self.nodeObjects = []
+
+        self.lodRatios = {}
+
+        self.textureLimits = {}
+
+        self.scaledTextures = 0
+
+        #mesh records are dropped as soon as their Blender mesh is written
+
+        self.release_records = ( options.get('release_records', 1) == 1 )
+
+        self.unit = options['unit']
+
+        self.materials = {}
+
+        self.images = {}
+
+        self.materialGroups = {}
+
+    def applyOptions( self ):
+
+        options = self.options
+
+        if options["shadow"] == 1:
+            sun = bpy.data.objects.get('Sun')
+
+            if sun :
+                v1 = mathutils.Vector((0,0,0))
+                v2 = mathutils.Vector((-options["shadowX"],-options["shadowY"],-options["shadowZ"]))
+
+                sun.matrix_world = self.matrixLookat(v1,v2,mathutils.Vector((0,0,1)))
+            if self.useBlenderCycles == False:
+                if bpy.data.lamps.get("Sun") != None:
+                    bpy.data.lamps["Sun"].shadow_method='RAY_SHADOW'
+
+        if self.useBlenderCycles == False:
+            bpy.data.worlds["World"].light_settings.use_environment_light =True
+
+        bpy.data.scenes["Scene"].render.resolution_x = options["vpWidth"]
+
+        bpy.data.scenes["Scene"].render.resolution_y = options["vpHeight"]
+
+
+
+        bpy.context.scene.cycles.samples = options['samples']
+
+        bpy.context.scene.cycles.preview_samples = options['samples']
+
+
+        if self.useBlenderCycles:
+
+            if hasattr(bpy.context.scene,"cycles") == False:
+                buperror = "Please activate Cycles Render Engine addon"
+                bpy.ops.blenduperror.message('INVOKE_DEFAULT', message = buperror)
+                raise Exception(buperror)
+            bpy.context.scene.render.engine = "CYCLES"
+        else:
+            bpy.context.scene.render.engine = "BLENDER_RENDER"
+
+        #if options['useGPU'] == 0:
+        #    bpy.context.user_preferences.system.compute_device_type = "NONE"
+        #else:
+       #     bpy.context.user_preferences.system.compute_device_type = "CUDA"
+
+    def applyUnits( self ):
+
+        #set units
+
+        if self.unit == "m" or self.unit == "cm" or self.unit == "mm" :
+            bpy.context.scene.unit_settings.system = "METRIC"
+        else:
+            bpy.context.scene.unit_settings.system = "IMPERIAL"
+
+        if self.unit == "cm":
+            bpy.context.scene.unit_settings.scale_length = 100
+            bpy.data.cameras["Camera"].draw_size = 0.01
+            bpy.data.cameras["Camera"].clip_start = 0.01
+            bpy.data.cameras["Camera"].clip_end = bpy.data.cameras["Camera"].clip_start * 2000
+        elif self.unit == "mm":
+            bpy.context.scene.unit_settings.scale_length = 1000
+            bpy.data.cameras["Camera"].draw_size = 0.001
+            bpy.data.cameras["Camera"].clip_start = 0.001
+            bpy.data.cameras["Camera"].clip_end = bpy.data.cameras["Camera"].clip_start * 2000
+        elif self.unit == "i":
+            bpy.context.scene.unit_settings.scale_length = 12
+            bpy.data.cameras["Camera"].draw_size = 0.0254
+            bpy.data.cameras["Camera"].clip_start = 0.0254
+            bpy.data.cameras["Camera"].clip_end = bpy.data.cameras["Camera"].clip_start * 2000
+        elif self.unit == "f":
+            bpy.data.cameras["Camera"].draw_size = 0.3048
+
+
+    def parseModel( self, meshesCreated = False ):
+
+        self.runSteps( self.parseModelSteps( meshesCreated ) )
+
+    def parseModelSteps( self, meshesCreated = False ):
+
+        if self.static_batching:
+
+            #bake the whole hierarchy into merged meshes
+
+            if self.polygon_budget > 0:
+
+                print( "BlendUp polygon budget ignored with static batching" )
+
+            yield from self.memory.phaseSteps( "batches", self.createStaticBatchesSteps(), bulk = True )
+
+        else:
+
+            #parse meshes
+
+            if not meshesCreated:
+
+                yield from self.memory.phaseSteps( "meshes", self.parseMeshesSteps(), bulk = True )
+
+            elif self.polygon_budget > 0:
+
+                print( "BlendUp polygon budget ignored: meshes are created outside the hierarchy walk" )
+
+            if self.spatial_index:
+
+                self.buildSpatialIndex()
+
+            #parse hierarchy
+
+            yield from self.memory.phaseSteps( "nodes", self.parseNodeSteps( self.model["hierarchy"][0], None, -1), bulk = True )
+
+        self.progressTotal += len( self.materials )
+
+        #convert created materials to Cycles materials
+
+        if self.useBlenderCycles:
+
+            yield from self.memory.phaseSteps( "materials", self.createCycleMaterialsSteps() )
+
+        else:
+
+            yield from self.memory.phaseSteps( "materials", self.createBIMaterialsSteps() )
+        #create camera
+
+        self.createCamera()
+
+    def createCamera( self ) :
+
+        views = self.model["views"]
+
+        first = True
+
+        for view in views:
+
+
+
+            if ( first and len(bpy.data.cameras)>= 1 ):
+
+                camera = bpy.data.cameras[0]
+
+                camera_object  = bpy.context.scene.camera
+
+                first = False
+
+            else:
+
+                camera = bpy.data.cameras.new(view["name"])
+
+                camera_object = bpy.data.objects.new(view["name"], camera)
+
+                bpy.context.scene.objects.link(camera_object)
+
+
+
+            mode = view["mode"]
+
+            if mode == "perspective":
+
+                camera.type = "PERSP"
+
+                w = float(self.options["vpWidth"])
+
+                h = float(self.options["vpHeight"])
+
+                ratio = w / h
+
+                #camera.lens = 16/(ratio*math.tan(180/3.14159265359* view["fov"] /2))
+
+                fieldOfViewY = view["fov"]* 3.14159265359 / 180
+
+                camera.sensor_width = 32
+
+                camera.angle = 2 * math.atan(math.tan(fieldOfViewY * 0.5) * ratio)
+
+
+                #camera.lens = camera.sensor_width / ( 2 * math.tan(0.5* camera.angle))
+
+            else:
+
+                camera.type = "ORTHO"
+                camera.ortho_scale = view["orthoHeight"]
+
+            eye = mathutils.Vector(view["eye"])
+
+            target = mathutils.Vector(view["target"])
+
+            up = mathutils.Vector(view["up"])
+
+            camera_object.matrix_world = self.matrixLookat(eye, target, up)
+
+
+
+    def getImage( self, name ):
+
+        img = self.images.get(name)
+
+        if img is not None:
+
+            return img
+
+        absPath = self.sourceDir + "/" + name
+
+        try:
+            img = bpy.data.images.load( self.getStoreImagePath(name) or absPath )
+
+            scaled = self.scaleImage( name, img )
+
+            #scaled pixels only survive in the file when packed
+
+            if self.pack_texture or scaled :
+
+                bpy.ops.image.pack({'edit_image': img}, as_png = scaled)
+
+            self.images[name] = img
+
+        except:
+            raise NameError("Cannot load image %s" % absPath)
+
+        return img
+
+    def scaleImage( self, name, img ):
+
+        #texture_lod: no more pixels than the largest screen size of the objects using the texture
+
+        limit = self.textureLimits.get(name)
+
+        if limit is None:
+
+            return False
+
+        limit = max( int(limit), minimumTexturePixels )
+
+        [width, height] = img.size
+
+        if max(width, height) <= limit:
+
+            return False
+
+        scale = limit / float( max(width, height) )
+
+        img.scale( max( 1, int(width * scale) ), max( 1, int(height * scale) ) )
+
+        self.scaledTextures += 1
+
+        return True
+
+    def getEmptyMaterial( self, frontMaterialId, backMaterialId ):
+
+        key = str(frontMaterialId)+"#"
+
+        if self.back_materials:
+
+            key +=  str(backMaterialId)
+
+        material = self.materials.get(key);
+
+        if material is None:
+
+            material = bpy.data.materials.new(name=key)
+
+            self.materials[ key ] = material
+
+        return material
+
+    def parseNode( self, node, parent, parentMaterial ):
+
+        self.runSteps( self.parseNodeSteps( node, parent, parentMaterial ) )
+
+    def buildSpatialIndex( self ):
+
+        #world matrices and bounds of the objects from the export arrays, without evaluating
+        #the scene; scripts query spatialIndex and map the node ids through nodeObjects
+
+        start = time.time()
+
+        if self.indexedBounds is not None:
+
+            bounds = self.indexedBounds
+
+        else:
+
+            bounds = [ blendup_spatial.meshBounds(mesh) for mesh in self.model["meshes"] ]
+
+        self.hierarchy = blendup_spatial.FlatHierarchy( self.model, bounds )
+
+        self.spatialIndex = blendup_spatial.BlendUpSpatialIndex( self.hierarchy.bounds )
+
+        self.nodeObjects = []
+
+        print( "BlendUp spatial index: %d nodes, %d levels, %d boxes indexed in %.2fs" %
+               ( len( self.hierarchy.parents ), int( self.hierarchy.depths.max() ) + 1, len( self.spatialIndex.ids ), time.time() - start ) )
+
+    def parseNodeSteps( self, node, parent, parentMaterial ):
+
+        nodeName = node["name"]
+
+        n = node["matrix"]
+
+        nodeMaterial = node["material"]
+
+        if "definition" in node:
+
+            definitionId = node["definition"]
+
+            node = self.model["definitions"][definitionId]
+
+        children = None
+
+        if  "children" in node:
+
+            children = node["children"]
+
+        objectData = None
+
+        if( nodeMaterial == -1 ):
+
+            nodeMaterial = parentMaterial
+
+        chunks = None
+
+        if "mesh" in node:
+
+            objectData = self.meshes[node["mesh"]]
+
+            if isinstance( objectData, list ):
+
+                #chunked mesh: an empty carries the node, one child object per chunk
+
+                chunks = objectData
+
+                objectData = None
+
+        object = bpy.data.objects.new(nodeName, objectData)
+
+        if self.spatialIndex is not None:
+
+            #objects in the order of the flattened hierarchy
+
+            self.nodeObjects.append(object)
+
+        if parent is not None:
+
+            object.parent = parent
+
+        [pos,rot,scale] = mathutils.Matrix( [ [n[0],n[4],n[8],n[12]],
+                                                [n[1],n[5],n[9],n[13]],
+                                                [n[2],n[6],n[10],n[14]],
+                                                [n[3],n[7],n[11],n[15]] ] ).decompose()
+
+        object.matrix_local = mathutils.Matrix( [ [n[0],n[1],n[2],n[3]],
+                                                [n[4],n[5],n[6],n[7]],
+                                                [n[8],n[9],n[10],n[11]],
+                                                [n[12],n[13],n[14],n[15]] ] )
+
+
+        self.assignNodeMaterials( object, objectData, nodeMaterial )
+
+        if self.lazy_meshes and objectData is not None:
+
+            #materializing the proxy needs the material inherited by the object
+
+            object["blendup_node_material"] = nodeMaterial
+
+        if chunks is not None:
+
+            for chunk in chunks:
+
+                chunkObject = bpy.data.objects.new(nodeName, chunk)
+
+                chunkObject.parent = object
+
+                self.assignNodeMaterials( chunkObject, chunk, nodeMaterial )
+
+                self.scene.objects.link(chunkObject)
+
+        #object.location = pos
+        #object.rotation_quaternion = rot
+        #object.scale = scale
+
+        #object.location = ( pos[0],pos[1],pos[2])
+
+        if children is not None:
+
+            for child in children:
+
+                yield from self.parseNodeSteps( child, object, nodeMaterial)
+
+        self.scene.objects.link(object)
+
+        yield
+
+    def assignNodeMaterials( self, object, objectData, nodeMaterial ):
+
+        if objectData is not None and nodeMaterial != -1:
+
+            k = 0
+
+            for meshMaterial in objectData.materials:
+
+                meshMaterial =  objectData.materials[k]
+
+                #converted materials are renamed, their ids stay in their key
+
+                temp = meshMaterial.get( "blendup_key", meshMaterial.name ).split("#")
+
+                frontMat = int(temp[0])
+
+                backMat = -1
+
+                if self.back_materials:
+                    backMat = int(temp[1])
+
+                if frontMat == -1 or backMat == -1:
+
+                    if frontMat == -1:
+                        frontMat = nodeMaterial
+
+                    if backMat == -1:
+                        backMat = nodeMaterial
+
+                    object.material_slots[k].link = 'OBJECT'
+
+                    object.material_slots[k].material = self.getEmptyMaterial( frontMat, backMat)
+
+                k = k+1
+
+    def parseMeshes( self):
+
+        self.runSteps( self.parseMeshesSteps() )
+
+    def parseMeshesSteps( self):
+
+        self.meshes = []
+
+        meshes = self.model["meshes"]
+
+        ratios = {}
+
+        if self.polygon_budget > 0:
+
+            flattening = blendup_analyze.Flattening(self.model)
+
+            [allocations, ratios] = blendup_decimate.allocateBudget( flattening, self.polygon_budget, self.polygon_min_ratio )
+
+        for [meshId, ratio] in self.lodRatios.items():
+
+            ratios[meshId] = min( ratios.get(meshId, 1.0), ratio )
+
+        #the spatial index needs the bounds of the records released below
+
+        if self.spatial_index and self.indexedBounds is None:
+
+            self.indexedBounds = []
+
+        for [meshId, m] in enumerate(meshes):
+
+            if self.spatial_index and len( self.indexedBounds ) == meshId:
+
+                self.indexedBounds.append( blendup_spatial.meshBounds(m) )
+
+            if m is None:
+
+                #left out by a selective import
+
+                self.meshes.append(None)
+
+                continue
+
+            if meshId in ratios:
+
+                self.meshes.append( self.createDecimatedMeshChunks( meshId, m, ratios[meshId] ) )
+
+            else:
+
+                self.meshes.append( self.createMeshChunks(m) )
+
+            if self.release_records:
+
+                #the Blender mesh holds the geometry now
+
+                meshes[meshId] = None
+
+                m = None
+
+            yield
+
+        self.reportValidation()
+
+        if self.polygon_budget > 0:
+
+            self.reportPolygonBudget( flattening, allocations )
+
+        if len( self.lodRatios ) > 0:
+
+            faces = [ sum( self.decimatedFaces[meshId][k] for meshId in self.lodRatios if meshId in self.decimatedFaces ) for k in range(2) ]
+
+            print( "BlendUp LOD: %d meshes decimated for their screen size, %d faces -> %d" % ( len( self.lodRatios ), faces[0], faces[1] ) )
+
+    def createMeshChunks( self, mesh ):
+
+        return self.writeMeshChunks( self.prepareMeshChunks(mesh) )
+
+    def createDecimatedMeshChunks( self, meshId, mesh, ratio ):
+
+        mesh = self.cleanMesh(mesh)
+
+        [decimated, before, after] = blendup_decimate.decimateMesh( mesh, ratio )
+
+        self.decimatedFaces[meshId] = [ before, after ]
+
+        me = self.writeMeshChunks( self.prepareChunks(decimated) )
+
+        if self.keep_full_meshes:
+
+            full = self.writeMeshChunks( self.prepareChunks(mesh) )
+
+            #the full resolution alternate is not used by any object, the fake user keeps it in the file
+
+            for fullMesh in ( full if isinstance( full, list ) else [ full ] ):
+
+                fullMesh.use_fake_user = True
+
+            if not isinstance( me, list ) and not isinstance( full, list ):
+
+                me["blendup_full_mesh"] = full.name
+
+                full["blendup_decimated_mesh"] = me.name
+
+        return me
+
+    def reportPolygonBudget( self, flattening, allocations ):
+
+        after = flattening.totals["faces"]
+
+        for [meshId, [meshBefore, meshAfter]] in self.decimatedFaces.items():
+
+            after -= flattening.meshInstances[meshId] * ( meshBefore - meshAfter )
+
+        print( "BlendUp polygon budget: %d faces, %d flattened before, %d after" % ( self.polygon_budget, flattening.totals["faces"], after ) )
+
+        for allocation in allocations:
+
+            if allocation["ratio"] >= 1.0:
+
+                continue
+
+            achieved = allocation["faces"]
+
+            for meshId in flattening.definitionMeshes( allocation["definition"] ):
+
+                [meshBefore, meshAfter] = self.decimatedFaces.get( meshId, [ 0, 0 ] )
+
+                achieved -= meshBefore - meshAfter
+
+            print( "  %s: %d instances x %d faces, target %d, achieved %d (%.1f%% fewer)" %
+                   ( allocation["name"], allocation["instances"], allocation["faces"], allocation["target"], achieved,
+                     100.0 * ( allocation["faces"] - achieved ) / allocation["faces"] ) )
+
+    def prepareMeshChunks( self, mesh ):
+
+        return self.prepareChunks( self.cleanMesh(mesh) )
+
+    def cleanMesh( self, mesh ):
+
+        if self.weld:
+
+            [mesh, before, after] = blendup_weld.weldMesh( mesh, blendup_weld.weldTolerance( self.weld_distance, self.unit ) )
+
+            self.weldCounts[0] += before
+
+            self.weldCounts[1] += after
+
+        return self.validateMesh( mesh, "mesh %d" % self.validatedMeshes )
+
+    def prepareChunks( self, mesh ):
+
+        if self.chunk_mode == "" or blendup_json.faceCount(mesh) < self.chunk_min_faces:
+
+            return self.prepareMesh(mesh)
+
+        chunks = self.chunkMesh( blendup_json.expandMesh(mesh) )
+
+        if len(chunks) == 1:
+
+            return self.prepareMesh(mesh)
+
+        return [ self.prepareMesh(chunk) for chunk in chunks ]
+
+    def writeMeshChunks( self, prepared ):
+
+        if isinstance( prepared, list ):
+
+            return [ self.writeMesh(chunk) for chunk in prepared ]
+
+        return self.writeMesh(prepared)
+
+    def chunkMesh( self, mesh ):
+
+        vertices = mesh["vertices"]
+
+        faces = mesh["indices"]
+
+        #partition faces by centroid
+
+        centroids = []
+
+        for face in faces:
+
+            c = [0.0, 0.0, 0.0]
+
+            for v in face:
+
+                p = vertices[v]
+
+                c[0] += p[0]
+                c[1] += p[1]
+                c[2] += p[2]
+
+            inv = 1.0 / max( len(face), 1 )
+
+            centroids.append( (c[0] * inv, c[1] * inv, c[2] * inv) )
+
+        if self.chunk_mode == "octree":
+
+            groups = []
+
+            self.splitOctree( list( range(0, len(faces)) ), centroids, 0, groups )
+
+        else:
+
+            cells = {}
+
+            size = self.chunk_size
+
+            for f in range(0, len(faces)):
+
+                c = centroids[f]
+
+                cell = ( int(math.floor(c[0] / size)), int(math.floor(c[1] / size)), int(math.floor(c[2] / size)) )
+
+                cells.setdefault(cell, []).append(f)
+
+            groups = [ cells[cell] for cell in sorted(cells) ]
+
+        loopStarts = self.faceLoopStarts(faces)
+
+        return [ self.extractFaces(mesh, group, loopStarts) for group in groups ]
+
+    def splitOctree( self, faceIds, centroids, depth, groups ):
+
+        if len(faceIds) <= self.chunk_max_faces or depth >= 10:
+
+            groups.append(faceIds)
+
+            return
+
+        center = [0.0, 0.0, 0.0]
+
+        for i in range(0, 3):
+            center[i] = ( min( centroids[f][i] for f in faceIds ) + max( centroids[f][i] for f in faceIds ) ) * 0.5
+
+        octants = [ [] for i in range(0, 8) ]
+
+        for f in faceIds:
+
+            c = centroids[f]
+
+            octant = ( c[0] > center[0] ) | ( ( c[1] > center[1] ) << 1 ) | ( ( c[2] > center[2] ) << 2 )
+
+            octants[octant].append(f)
+
+        for octant in octants:
+
+            if len(octant) == len(faceIds):
+
+                #all centroids coincide, no split possible
+
+                groups.append(octant)
+
+                return
+
+        for octant in octants:
+
+            if len(octant) > 0:
+
+                self.splitOctree( octant, centroids, depth + 1, groups )
+
+    def extractFaces( self, mesh, faceIds, loopStarts ):
+
+        vertices = mesh["vertices"]
+
+        faces = mesh["indices"]
+
+        normals = mesh["normals"]
+
+        uvs = mesh["uvs"]
+
+        sharpEdges = mesh["edges"]
+
+        materials = mesh["materials"]
+
+        backMaterials = mesh["backMaterials"]
+
+        chunk = { "vertices" : [], "indices" : [], "normals" : [], "uvs" : [], "edges" : [], "materials" : [], "backMaterials" : [] }
+
+        remap = {}
+
+        for f in faceIds:
+
+            face = faces[f]
+
+            chunkFace = []
+
+            for v in face:
+
+                index = remap.get(v)
+
+                if index is None:
+
+                    index = len(chunk["vertices"])
+
+                    chunk["vertices"].append( vertices[v] )
+
+                    remap[v] = index
+
+                chunkFace.append(index)
+
+            start = loopStarts[f]
+
+            end = start + len(face)
+
+            chunk["indices"].append(chunkFace)
+
+            chunk["normals"].extend( normals[start:end] )
+
+            chunk["uvs"].extend( uvs[start:end] )
+
+            chunk["edges"].extend( sharpEdges[start:end] )
+
+            chunk["materials"].append( materials[f] )
+
+            chunk["backMaterials"].append( backMaterials[f] )
+
+        return chunk
+
+    def faceLoopStarts( self, faces ):
+
+        loopStarts = []
+
+        nbLoops = 0
+
+        for face in faces:
+
+            loopStarts.append(nbLoops)
+
+            nbLoops += len(face)
+
+        return loopStarts
+
+    def nodeMatrix( self, n ):
+
+        #export matrices are column major, translation in n[12..14]
+
+        return mathutils.Matrix( [ [n[0],n[4],n[8],n[12]],
+                                   [n[1],n[5],n[9],n[13]],
+                                   [n[2],n[6],n[10],n[14]],
+                                   [n[3],n[7],n[11],n[15]] ] )
+
+    def createStaticBatchesSteps( self ):
+
+        self.meshes = []
+
+        batches = {}
+
+        stats = { "objects" : 0, "drawCalls" : 0 }
+
+        self.collectBatches( self.model["hierarchy"][0], mathutils.Matrix(), -1, batches, stats)
+
+        #progress now counts batches instead of meshes and nodes
+
+        self.progressTotal = len(batches)
+
+        for batchKey in sorted( batches ):
+
+            [materialKey, cell] = batchKey
+
+            name = "Batch " + materialKey
+
+            if cell is not None:
+
+                name += " (%d,%d,%d)" % cell
+
+            me = self.createMesh( batches[batchKey] )
+
+            object = bpy.data.objects.new(name, me)
+
+            self.scene.objects.link(object)
+
+            yield
+
+        self.batchingReport = { "objectsBefore" : stats["objects"],
+                                "objectsAfter" : len(batches),
+                                "drawCallsBefore" : stats["drawCalls"],
+                                "drawCallsAfter" : len(batches) }
+
+        print( "BlendUp static batching: %d objects -> %d, %d draw calls -> %d" % ( stats["objects"], len(batches), stats["drawCalls"], len(batches) ) )
+
+    def collectBatches( self, node, parentMatrix, parentMaterial, batches, stats ):
+
+        nodeMaterial = node["material"]
+
+        matrix = parentMatrix * self.nodeMatrix( node["matrix"] )
+
+        if "definition" in node:
+
+            node = self.model["definitions"][node["definition"]]
+
+        if( nodeMaterial == -1 ):
+
+            nodeMaterial = parentMaterial
+
+        stats["objects"] += 1
+
+        if "mesh" in node:
+
+            self.batchMeshInstance( self.model["meshes"][node["mesh"]], matrix, nodeMaterial, batches, stats )
+
+        if "children" in node:
+
+            for child in node["children"]:
+
+                self.collectBatches( child, matrix, nodeMaterial, batches, stats )
+
+    def batchMeshInstance( self, mesh, matrix, nodeMaterial, batches, stats ):
+
+        mesh = blendup_json.expandMesh(mesh)
+
+        faces = mesh["indices"]
+
+        normals = mesh["normals"]
+
+        uvs = mesh["uvs"]
+
+        sharpEdges = mesh["edges"]
+
+        materials = mesh["materials"]
+
+        backMaterials = mesh["backMaterials"]
+
+        #bake the world matrix into positions and normals, whole arrays at once with NumPy
+
+        try:
+            normalMatrix = matrix.to_3x3().inverted().transposed()
+        except ValueError:
+            normalMatrix = matrix.to_3x3()
+
+        bakedNormals = None
+
+        if numpy is not None:
+
+            m = numpy.array( [ list(row) for row in matrix ], dtype = numpy.float64 )
+
+            points = numpy.asarray( mesh["vertices"], dtype = numpy.float64 ).reshape(-1, 3)
+
+            vertices = ( points.dot( m[:3, :3].T ) + m[:3, 3] ).tolist()
+
+            n = numpy.asarray( normals, dtype = numpy.float64 ).reshape(-1, 3).dot( numpy.array( [ list(row) for row in normalMatrix ] ).T )
+
+            lengths = numpy.sqrt( ( n * n ).sum(axis = 1) )
+
+            lengths[ lengths == 0 ] = 1.0
+
+            bakedNormals = ( n / lengths[:, None] ).tolist()
+
+        else:
+
+            vertices = [ matrix * mathutils.Vector(v) for v in mesh["vertices"] ]
+
+        #mirrored instances need their winding flipped to keep faces pointing outwards
+
+        mirrored = matrix.determinant() < 0
+
+        cell = None
+
+        if self.batch_cell_size > 0 and len(vertices) > 0:
+
+            center = mathutils.Vector()
+
+            for i in range(0, 3):
+                center[i] = ( min( v[i] for v in vertices ) + max( v[i] for v in vertices ) ) * 0.5
+
+            cell = tuple( int( math.floor( c / self.batch_cell_size ) ) for c in center )
+
+        remaps = {}
+
+        loopStart = 0
+
+        for f in range(0, len(faces) ):
+
+            face = faces[f]
+
+            nbCorners = len(face)
+
+            frontMaterialId = materials[f]
+
+            backMaterialId = backMaterials[f]
+
+            if nodeMaterial != -1:
+
+                if frontMaterialId == -1:
+                    frontMaterialId = nodeMaterial
+
+                if backMaterialId == -1:
+                    backMaterialId = nodeMaterial
+
+            materialKey = str(frontMaterialId) + "#"
+
+            if self.back_materials:
+
+                materialKey += str(backMaterialId)
+
+            batchKey = (materialKey, cell)
+
+            batch = batches.get(batchKey)
+
+            if batch is None:
+
+                batch = { "vertices" : [], "indices" : [], "normals" : [], "uvs" : [], "edges" : [], "materials" : [], "backMaterials" : [] }
+
+                batches[batchKey] = batch
+
+            if batchKey not in remaps:
+
+                remaps[batchKey] = {}
+
+                stats["drawCalls"] += 1
+
+            remap = remaps[batchKey]
+
+            corners = list( range(loopStart, loopStart + nbCorners) )
+
+            cornerEdges = list( corners )
+
+            if mirrored:
+
+                #reversing the corners turns edge i into edge n-2-i, the closing edge stays
+
+                corners.reverse()
+
+                cornerEdges = corners[1:] + corners[:1]
+
+            batchFace = []
+
+            for loop in corners:
+
+                v = face[loop - loopStart]
+
+                index = remap.get(v)
+
+                if index is None:
+
+                    index = len(batch["vertices"])
+
+                    batch["vertices"].append( vertices[v] )
+
+                    remap[v] = index
+
+                batchFace.append(index)
+
+                if bakedNormals is not None:
+
+                    batch["normals"].append( bakedNormals[loop] )
+
+                else:
+
+                    n = normalMatrix * mathutils.Vector( normals[loop] )
+
+                    n.normalize()
+
+                    batch["normals"].append( n )
+
+                batch["uvs"].append( uvs[loop] )
+
+            for loop in cornerEdges:
+
+                batch["edges"].append( sharpEdges[loop] )
+
+            batch["indices"].append(batchFace)
+
+            batch["materials"].append(frontMaterialId)
+
+            batch["backMaterials"].append(backMaterialId)
+
+            loopStart += nbCorners
+
+    def createMesh( self, mesh):
+
+        return self.writeMesh( self.prepareMesh( self.validateMesh(mesh, "batch") ) )
+
+    def validateMesh( self, mesh, label ):
+
+        if self.mesh_validation == "blender":
+
+            return mesh
+
+        self.validatedMeshes += 1
+
+        try:
+
+            [mesh, issues] = blendup_validate.validateMesh( mesh, self.mesh_validation == "reject" )
+
+        except blendup_validate.MeshValidationError as e:
+
+            raise NameError( "BlendUp %s is invalid: %s" % ( label, e ) )
+
+        if len(issues) > 0:
+
+            self.repairedMeshes += 1
+
+            print( "BlendUp %s repaired: %s" % ( label, blendup_validate.formatIssues(issues) ) )
+
+        return mesh
+
+    def reportValidation( self ):
+
+        if self.mesh_validation != "blender":
+
+            print( "BlendUp mesh validation (%s): %d meshes checked, %d repaired" % ( self.mesh_validation, self.validatedMeshes, self.repairedMeshes ) )
+
+        if self.weld:
+
+            print( "BlendUp weld: %d vertices -> %d (%.1f%% fewer)" %
+                   ( self.weldCounts[0], self.weldCounts[1], 100.0 * ( self.weldCounts[0] - self.weldCounts[1] ) / max( self.weldCounts[0], 1 ) ) )
+
+    def prepareMesh( self, mesh ):
+
+        #computes the flat buffers of a mesh record, no bpy access here
+
+        if self.mesh_validation != "blender":
+
+            #validated records, and chunks of them, take the NumPy path that merges the shared edges
+
+            mesh = blendup_json.flattenMesh( mesh, "numpy" )
+
+        if blendup_json.isFlatMesh(mesh):
+
+            return self.prepareFlatMesh(mesh)
+
+        vertices = mesh["vertices"]
+
+        faces = mesh["indices"]
+
+        sharpEdgesTemp = mesh["edges"]
+
+        materials = mesh["materials"]
+
+        backMaterials = mesh["backMaterials"]
+
+        #computed mesh values
+
+        edgeVertices = array.array('i')
+
+        loopVertexIndices = array.array('i')
+
+        loopEdgeIndices = array.array('i')
+
+        polygonLoopStarts = array.array('i')
+
+        polygonLoopTotals = array.array('i')
+
+        polygonMaterialIndices = array.array('i')
+
+        meshMaterials = {}
+
+        materialPairs = []
+
+        nbEdges = 0
+
+        nbLoops = 0
+
+        nbPolygons = 0
+
+        for f in range(0, len(faces) ):
+            face = faces[f]
+            polygonLoopStarts.append(nbLoops)
+            polygonLoopTotals.append(len(face))
+
+            frontMaterialId = materials[f]
+
+            backMaterialId = backMaterials[f]
+
+            key = str(frontMaterialId) + "#" + str(backMaterialId)
+
+            materialId = meshMaterials.get(key)
+
+            if( materialId is None ) :
+
+                materialId = len(materialPairs)
+
+                materialPairs.append( (frontMaterialId, backMaterialId) )
+
+                meshMaterials[key] = materialId
+
+            polygonMaterialIndices.append(materialId)
+
+            nbLoops += len(face)
+
+            nbPolygons += 1
+
+            for i in range(0, len(face) ):
+                loopVertexIndices.append(face[i])
+                loopEdgeIndices.append(nbEdges)
+                if( i != ( len(face) -1 ) ):
+                    edgeVertices.extend([face[i],face[i+1]])
+                else:
+                    edgeVertices.extend([face[i],face[0]])
+                nbEdges += 1
+
+
+        sharpEdges = [ flag == 1 for flag in sharpEdgesTemp ]
+
+        return { "nbVertices" : len(vertices),
+                 "vertices" : array.array('f', unpack_list(vertices)),
+                 "nbEdges" : nbEdges,
+                 "edgeVertices" : edgeVertices,
+                 "sharpEdges" : sharpEdges,
+                 "nbLoops" : nbLoops,
+                 "loopVertexIndices" : loopVertexIndices,
+                 "loopEdgeIndices" : loopEdgeIndices,
+                 "nbPolygons" : nbPolygons,
+                 "polygonLoopStarts" : polygonLoopStarts,
+                 "polygonLoopTotals" : polygonLoopTotals,
+                 "polygonMaterialIndices" : polygonMaterialIndices,
+                 "materialPairs" : materialPairs,
+                 "uvs" : array.array('f', unpack_list(mesh["uvs"])),
+                 "normals" : mesh["normals"] }
+
+    def prepareFlatMesh( self, mesh ):
+
+        #same buffers as prepareMesh from a record decoded with typed arrays
+
+        indices = mesh["indices"]
+
+        faceSizes = mesh["faceSizes"]
+
+        materials = mesh["materials"]
+
+        backMaterials = mesh["backMaterials"]
+
+        nbLoops = len(indices)
+
+        nbPolygons = len(faceSizes)
+
+        meshMaterials = {}
+
+        materialPairs = []
+
+        if numpy is not None:
+
+            indices = numpy.asarray( indices, dtype = numpy.int32 )
+
+            faceSizes = numpy.asarray( faceSizes, dtype = numpy.int32 )
+
+            polygonLoopStarts = numpy.zeros( nbPolygons, dtype = numpy.int32 )
+
+            numpy.cumsum( faceSizes[:-1], out = polygonLoopStarts[1:] )
+
+            if self.mesh_validation != "blender":
+
+                #me.validate is skipped, merge the edge each pair of adjacent faces repeats
+
+                [edgeVertices, loopEdgeIndices, sharpEdges] = blendup_validate.uniqueEdges( indices, faceSizes, mesh["edges"] )
+
+                sharpEdges = sharpEdges.tolist()
+
+            else:
+
+                #each corner is followed by the next one in its face, the last one closes the face
+
+                following = numpy.arange( 1, nbLoops + 1, dtype = numpy.int32 )
+
+                following[ polygonLoopStarts + faceSizes - 1 ] = polygonLoopStarts
+
+                edgeVertices = numpy.empty( 2 * nbLoops, dtype = numpy.int32 )
+
+                edgeVertices[0::2] = indices
+
+                edgeVertices[1::2] = indices[following]
+
+                loopEdgeIndices = numpy.arange( nbLoops, dtype = numpy.int32 )
+
+                sharpEdges = ( numpy.asarray( mesh["edges"] ) == 1 ).tolist()
+
+            pairs = numpy.stack( ( numpy.asarray(materials, dtype = numpy.int64), numpy.asarray(backMaterials, dtype = numpy.int64) ), axis = 1 )
+
+            [uniquePairs, firstFaces, inverse] = numpy.unique( pairs, axis = 0, return_index = True, return_inverse = True )
+
+            #keep the slots in order of first use like prepareMesh does
+
+            order = numpy.argsort(firstFaces)
+
+            rank = numpy.empty_like(order)
+
+            rank[order] = numpy.arange( len(order) )
+
+            polygonMaterialIndices = rank[ inverse.reshape(-1) ].astype( numpy.int32 )
+
+            materialPairs = [ ( int(uniquePairs[i][0]), int(uniquePairs[i][1]) ) for i in order ]
+
+            normals = numpy.asarray( mesh["normals"], dtype = numpy.float32 ).reshape(-1, 3)
+
+        else:
+
+            polygonLoopStarts = array.array('i')
+
+            polygonMaterialIndices = array.array('i')
+
+            edgeVertices = array.array('i')
+
+            start = 0
+
+            for f in range(0, nbPolygons):
+
+                size = faceSizes[f]
+
+                polygonLoopStarts.append(start)
+
+                for i in range(start, start + size - 1):
+                    edgeVertices.append(indices[i])
+                    edgeVertices.append(indices[i + 1])
+
+                edgeVertices.append(indices[start + size - 1])
+                edgeVertices.append(indices[start])
+
+                key = ( materials[f], backMaterials[f] )
+
+                materialId = meshMaterials.get(key)
+
+                if( materialId is None ) :
+
+                    materialId = len(materialPairs)
+
+                    materialPairs.append(key)
+
+                    meshMaterials[key] = materialId
+
+                polygonMaterialIndices.append(materialId)
+
+                start += size
+
+            loopEdgeIndices = array.array( 'i', range(0, nbLoops) )
+
+            sharpEdges = [ flag == 1 for flag in mesh["edges"] ]
+
+            flatNormals = mesh["normals"]
+
+            normals = [ flatNormals[i:i+3] for i in range(0, len(flatNormals), 3) ]
+
+        nbEdges = len(edgeVertices) // 2
+
+        return { "nbVertices" : len(mesh["vertices"]) // 3,
+                 "vertices" : mesh["vertices"],
+                 "nbEdges" : nbEdges,
+                 "edgeVertices" : edgeVertices,
+                 "sharpEdges" : sharpEdges,
+                 "nbLoops" : nbLoops,
+                 "loopVertexIndices" : indices,
+                 "loopEdgeIndices" : loopEdgeIndices,
+                 "nbPolygons" : nbPolygons,
+                 "polygonLoopStarts" : polygonLoopStarts,
+                 "polygonLoopTotals" : faceSizes,
+                 "polygonMaterialIndices" : polygonMaterialIndices,
+                 "materialPairs" : materialPairs,
+                 "uvs" : mesh["uvs"],
+                 "normals" : normals }
+
+    def writeMesh( self, prepared ):
+
+        me = bpy.data.meshes.new("mesh")
+
+        for [frontMaterialId, backMaterialId] in prepared["materialPairs"]:
+
+            me.materials.append( self.getEmptyMaterial(frontMaterialId, backMaterialId) )
+
+        #create vertices
+
+        me.vertices.add(prepared["nbVertices"])
+
+        me.vertices.foreach_set("co", prepared["vertices"])
+
+        #create edges
+
+        sharpEdges = prepared["sharpEdges"]
+
+        me.edges.add(prepared["nbEdges"])
+
+        me.edges.foreach_set("vertices", prepared["edgeVertices"] )
+
+        if self.use_sharp_edge :
+            me.edges.foreach_set("use_edge_sharp", sharpEdges )
+
+        if self.use_freestyle_mark :
+            me.edges.foreach_set("use_freestyle_mark", sharpEdges )
+
+        if self.use_seam :
+            me.edges.foreach_set("use_seam", sharpEdges )
+
+        #create loops
+
+        me.loops.add(prepared["nbLoops"])
+
+        me.loops.foreach_set("vertex_index", prepared["loopVertexIndices"])
+
+        me.loops.foreach_set("edge_index", prepared["loopEdgeIndices"])
+
+        #create polygons
+
+        me.polygons.add(prepared["nbPolygons"])
+
+        me.polygons.foreach_set("loop_start", prepared["polygonLoopStarts"])
+
+        me.polygons.foreach_set("loop_total", prepared["polygonLoopTotals"])
+
+        me.polygons.foreach_set("material_index", prepared["polygonMaterialIndices"])
+
+        #create two uv textures for front and back face
+
+        me.uv_textures.new("UVMap")
+
+        #me.uv_textures.new("BackUV")
+
+        #set uv
+
+        me.uv_layers[0].data.foreach_set("uv", prepared["uvs"])
+
+        #set custom split normals
+
+        me.normals_split_custom_set(prepared["normals"])
+
+        #me.show_normal_loop = True # debug normals
+
+        if self.mesh_validation in [ "strict", "blender" ]:
+
+            me.validate(verbose=False,clean_customdata=False)  # *Very* important to not remove lnors here!
+
+        me.use_auto_smooth = True
+
+        me.show_edge_sharp = True
+
+
+        return me
+
+    def buildBlendUpGroup( self, name ):
+
+        #instantiates a spec of blendup_groups.json, creating everything before setting values
+        #so each collection is looked up once instead of once per statement
+
+        spec = getBlendUpGroupSpecs()[name]
+
+        group = bpy.data.node_groups.new(name, 'ShaderNodeTree')
+        group.use_fake_user = True
+
+        groupNodes = group.nodes
+
+        nodes = [ groupNodes.new(node["type"]) for node in spec["nodes"] ]
+
+        for [sockets, socketSpecs] in [ [group.inputs, spec["inputs"]], [group.outputs, spec["outputs"]] ]:
+
+            created = [ sockets.new(socket["type"], socket["name"]) for socket in socketSpecs ]
+
+            for [socket, socketSpec] in zip(created, socketSpecs):
+
+                #range first, a default outside the previous range would be clamped
+
+                for attribute in [ "min_value", "max_value", "default_value" ]:
+
+                    if attribute in socketSpec:
+                        setattr(socket, attribute, socketSpec[attribute])
+
+        for [node, nodeSpec] in zip(nodes, spec["nodes"]):
+
+            node.location = nodeSpec["location"]
+
+            for [attribute, value] in nodeSpec.get("properties", {}).items():
+                setattr(node, attribute, value)
+
+            inputValues = nodeSpec.get("inputs")
+
+            if inputValues:
+
+                inputs = node.inputs
+
+                for [index, value] in inputValues.items():
+                    inputs[int(index)].default_value = value
+
+        outputs = [ node.outputs for node in nodes ]
+
+        inputs = [ node.inputs for node in nodes ]
+
+        links = group.links
+
+        for [fromNode, fromSocket, toNode, toSocket] in spec["links"]:
+
+            links.new(outputs[fromNode][fromSocket], inputs[toNode][toSocket], False)
+
+        return group
+
+
+    def createBlendUpGroups( self ):
+
+        for name in self.blendUpGroupNames:
+
+            self.getBlendUpGroup(name)
+
+    def getBlendUpGroupBuilder( self, name ):
+
+        if name not in self.blendUpGroupNames:
+
+            raise NameError("Unknown BlendUp material type %s" % name)
+
+        return lambda: self.buildBlendUpGroup(name)
+
+    def getBlendUpGroupFingerprint( self, name ):
+
+        #the spec identifies the group content, bump the version to force rebuilds
+
+        fingerprint = self.blendUpGroupFingerprints.get(name)
+
+        if fingerprint is None:
+
+            self.getBlendUpGroupBuilder(name)
+
+            spec = json.dumps( getBlendUpGroupSpecs()[name], sort_keys = True )
+
+            fingerprint = hashlib.sha1( (str(blendUpGroupsVersion) + spec).encode('utf-8') ).hexdigest()[:16]
+
+            self.blendUpGroupFingerprints[name] = fingerprint
+
+        return fingerprint
+
+    def isBlendUpGroup( self, group, name, fingerprint ):
+
+        return group.get("blendup_type") == name and group.get("blendup_fingerprint") == fingerprint
+
+    def getBlendUpGroup( self, name ):
+
+        #reuse an up to date group from this file or from the asset library before building one
+
+        group = self.blendUpGroups.get(name)
+
+        if group is not None:
+
+            return group
+
+        fingerprint = self.getBlendUpGroupFingerprint(name)
+
+        for candidate in bpy.data.node_groups:
+
+            if self.isBlendUpGroup( candidate, name, fingerprint ):
+
+                group = candidate
+
+                break
+
+        if group is None:
+
+            group = self.loadLibraryBlendUpGroup( name, fingerprint )
+
+        storePath = self.getStorePath( "groups", "%s-%s.blend" % ( name, fingerprint ) )
+
+        match = lambda candidate: self.isBlendUpGroup( candidate, name, fingerprint )
+
+        if group is None:
+
+            group = self.linkStoreGroup( storePath, match )
+
+        if group is None:
+
+            group = self.getBlendUpGroupBuilder(name)()
+
+            group["blendup_type"] = name
+
+            group["blendup_fingerprint"] = fingerprint
+
+            group["blendup_version"] = blendUpGroupsVersion
+
+            group = self.shareStoreGroup( group, storePath, match )
+
+        self.blendUpGroups[name] = group
+
+        return group
+
+    def loadLibraryBlendUpGroup( self, name, fingerprint ):
+
+        library = self.getOption('asset_library', "")
+
+        if library == "" or not os.path.exists(library):
+
+            return None
+
+        with bpy.data.libraries.load(library, link = True) as (dataFrom, dataTo):
+
+            if name in dataFrom.node_groups:
+
+                dataTo.node_groups = [ name ]
+
+        for group in dataTo.node_groups:
+
+            if group is not None and self.isBlendUpGroup( group, name, fingerprint ):
+
+                return group
+
+            if group is not None:
+
+                #outdated library copy, rebuild locally
+
+                bpy.data.node_groups.remove(group)
+
+        return None
+
+    def getOption( self, name, default ):
+
+        #before readOptions only the caller overrides are known
+
+        if hasattr( self, "options" ):
+
+            return self.options.get(name, default)
+
+        return self.optionOverrides.get(name, default)
+
+    def getStorePath( self, folder, name ):
+
+        #content addressed shared asset store, None when the import does not use one
+
+        store = self.getOption('asset_store', "")
+
+        if store == "":
+
+            return None
+
+        directory = os.path.join( store, folder )
+
+        if not os.path.isdir(directory):
+
+            os.makedirs( directory, exist_ok = True )
+
+        return os.path.join( directory, name )
+
+    def getFileDigest( self, name ):
+
+        digest = self.fileDigests.get(name)
+
+        if digest is None:
+
+            sha1 = hashlib.sha1()
+
+            with open( self.sourceDir + "/" + name, 'rb' ) as file:
+
+                for block in iter( lambda: file.read(1 << 20), b"" ):
+
+                    sha1.update(block)
 
-        object.matrix_local = mathutils.Matrix( [ [n[0],n[1],n[2],n[3]],
-                                                [n[4],n[5],n[6],n[7]],
-                                                [n[8],n[9],n[10],n[11]],
-                                                [n[12],n[13],n[14],n[15]] ] )
+            digest = sha1.hexdigest()
 
+            self.fileDigests[name] = digest
 
-        if objectData is not None and nodeMaterial != -1:
+        return digest
 
-            k = 0
+    def getStoreImagePath( self, name ):
 
-            for meshMaterial in objectData.materials:
+        #copies the texture to the store under its content hash, the same image of another
+        #export then resolves to the same file
 
-                meshMaterial =  objectData.materials[k]
+        if self.getOption('asset_store', "") == "":
 
-                temp = meshMaterial.name.split("#")
+            return None
 
-                frontMat = int(temp[0])
+        path = self.getStorePath( "textures", self.getFileDigest(name) + os.path.splitext(name)[1].lower() )
 
-                backMat = -1
+        if os.path.exists(path):
 
-                if self.back_materials:
-                    backMat = int(temp[1])
+            self.storeStats["texturesReused"] += 1
 
-                if frontMat == -1 or backMat == -1:
+        else:
 
-                    if frontMat == -1:
-                        frontMat = nodeMaterial
+            temp = "%s.%d.tmp" % ( path, os.getpid() )
 
-                    if backMat == -1:
-                        backMat = nodeMaterial
+            shutil.copyfile( self.sourceDir + "/" + name, temp )
 
-                    object.material_slots[k].link = 'OBJECT'
+            os.replace( temp, path )
 
-                    object.material_slots[k].material = self.getEmptyMaterial( frontMat, backMat)
+            self.storeStats["texturesAdded"] += 1
 
-                k = k+1
+        return path
 
-        #object.location = pos
-        #object.rotation_quaternion = rot
-        #object.scale = scale
+    def getMaterialGroupKey( self, definition ):
 
-        #object.location = ( pos[0],pos[1],pos[2])
+        #content of a definition, without its name, and of the textures it uses
 
-        if children is not None:
+        content = dict( (k, v) for k, v in definition.items() if k not in [ "Name", "ID" ] )
 
-            for child in children:
+        textures = [ self.cleanSpaces(name) for name in re.findall(r"Texture\w*\(([^)]*)\)", "".join( sorted( content.values() ) ) ) ]
 
-                self.parseNode( child, object, nodeMaterial)
+        digests = [ self.getFileDigest(name) for name in sorted(textures) ]
 
-        self.scene.objects.link(object)
+        key = json.dumps( [ content, digests, self.getBlendUpGroupFingerprint( definition["Type"] ) ], sort_keys = True )
 
-    def parseMeshes( self):
+        return hashlib.sha1( key.encode('utf-8') ).hexdigest()[:16]
 
-        self.meshes = []
+    def linkStoreGroup( self, path, match ):
 
-        meshes = self.model["meshes"]
+        if path is None or not os.path.exists(path):
 
-        for m in meshes:
+            return None
 
-            self.meshes.append( self.createMesh(m) )
+        with bpy.data.libraries.load(path, link = True) as (dataFrom, dataTo):
 
-    def createMesh( self, mesh):
+            dataTo.node_groups = list( dataFrom.node_groups )
 
-        me = bpy.data.meshes.new("mesh")
+        for group in dataTo.node_groups:
 
-        vertices = mesh["vertices"]
+            if group is not None and match(group):
 
-        faces = mesh["indices"]
+                self.storeStats["linked"] += 1
 
-        normals = mesh["normals"]
+                return group
 
-        sharpEdgesTemp = mesh["edges"]
+        return None
 
-        materials = mesh["materials"]
+    def shareStoreGroup( self, group, path, match ):
 
-        backMaterials = mesh["backMaterials"]
+        #writes a group built here to the store and swaps it for the linked copy
 
-        #computed mesh values
+        if path is None or not hasattr( bpy.data.libraries, "write" ):
 
-        edgeVertices = []
+            return group
 
-        loopVertexIndices = []
+        temp = "%s.%d.blend" % ( path[:-len(".blend")], os.getpid() )
 
-        loopEdgeIndices = []
+        bpy.data.libraries.write( temp, set( [ group ] ), relative_remap = True, fake_user = True )
 
-        polygonLoopStarts = []
+        os.replace( temp, path )
 
-        polygonLoopTotals = []
+        self.storeStats["stored"] += 1
 
-        polygonMaterialIndices = []
+        linked = self.linkStoreGroup( path, match )
 
-        meshMaterials = {}
+        if linked is None:
 
-        nbEdges = 0
+            return group
 
-        nbLoops = 0
+        self.storeStats["linked"] -= 1
 
-        nbPolygons = 0
+        bpy.data.node_groups.remove(group)
 
-        for f in range(0, len(faces) ):
-            face = faces[f]
-            polygonLoopStarts.append(nbLoops)
-            polygonLoopTotals.append(len(face))
+        return linked
 
-            frontMaterialId = materials[f]
+    def cleanSpaces( self, str):
 
-            backMaterialId = backMaterials[f]
+        return str.lstrip().rstrip()
 
-            key = str(frontMaterialId) + "#" + str(backMaterialId)
 
-            materialId = meshMaterials.get(key)
+    def parseMaterialDefinitions( self ):
 
-            if( materialId is None ) :
+        if self.mergedMaterialDefinitions is not None:
 
-                newMat = self.getEmptyMaterial(frontMaterialId,backMaterialId)
+            return self.mergedMaterialDefinitions
 
-                materialId = len(me.materials)
+        materials = []
 
-                me.materials.append(newMat)
+        matFile = self.sourceDir+"/materials2.txt"
 
-                meshMaterials[key] = materialId
+        if self.useBlenderCycles == False:
 
-            polygonMaterialIndices.append(materialId)
+            matFile = self.sourceDir+"/materials.txt"
 
-            nbLoops += len(face)
+        if self.container is not None and self.container.hasText( os.path.basename(matFile) ):
 
-            nbPolygons += 1
+            materialLines = self.container.readText( os.path.basename(matFile) ).splitlines(True)
 
-            for i in range(0, len(face) ):
-                loopVertexIndices.append(face[i])
-                loopEdgeIndices.append(nbEdges)
-                if( i != ( len(face) -1 ) ):
-                    edgeVertices.extend([face[i],face[i+1]])
-                else:
-                    edgeVertices.extend([face[i],face[0]])
-                nbEdges += 1
+        else:
 
+            with codecs.open(matFile, "r", "utf-8") as f:
 
-        sharpEdges = []
+                materialLines = f.readlines()
 
-        for f in range(0, len(sharpEdgesTemp) ):
-            if( sharpEdgesTemp[f] == 1 ):
-                sharpEdges.append(True)
-            else:
-                sharpEdges.append(False)
+        for line in materialLines:
 
-        #print( "mesh:"+str(len(self.meshes)))
-        #print( "nbEdges:"+str(nbEdges))
-        #print( "nbLoops:"+str(nbLoops))
-        #print( "nbPolygons:"+str(nbPolygons))
-        #print( "edgeVertices:"+str(len((edgeVertices))))
+            mat = {}
 
-        #create vertices
+            line = self.cleanSpaces(line)
 
-        me.vertices.add(len(vertices))
+            parameters = line.split(";")
 
-        me.vertices.foreach_set("co", unpack_list(vertices))
+            for param in parameters:
 
-        #create edges
+                if not "=" in param: continue
 
-        me.edges.add(nbEdges)
+                vals = param.split("=")
 
-        me.edges.foreach_set("vertices", edgeVertices )
+                if len(vals) != 2 : continue
 
-        if self.use_sharp_edge :
-            me.edges.foreach_set("use_edge_sharp", sharpEdges )
+                valType = self.cleanSpaces(vals[0])
 
-        if self.use_freestyle_mark :
-            me.edges.foreach_set("use_freestyle_mark", sharpEdges )
+                valValue = self.cleanSpaces(vals[1])
 
-        if self.use_seam :
-            me.edges.foreach_set("use_seam", sharpEdges )
+                mat[valType] = valValue
 
-        #create loops
+            materials.append(mat)
 
-        me.loops.add(nbLoops)
+        return materials
 
-        me.loops.foreach_set("vertex_index", loopVertexIndices)
+    def getMaterialGroup( self, id, definition, nodes ):
 
-        me.loops.foreach_set("edge_index", loopEdgeIndices)
+        mat = nodes.new('ShaderNodeGroup')
 
-        #create polygons
+        group = self.materialGroups.get(id)
 
-        me.polygons.add(nbPolygons)
+        storePath = None
 
-        me.polygons.foreach_set("loop_start", polygonLoopStarts)
+        if group is None and self.getOption('asset_store', "") != "":
 
-        me.polygons.foreach_set("loop_total", polygonLoopTotals)
+            key = self.getMaterialGroupKey(definition)
 
-        me.polygons.foreach_set("material_index", polygonMaterialIndices)
+            storePath = self.getStorePath( "groups", key + ".blend" )
 
-        #create two uv textures for front and back face
+            match = lambda candidate: candidate.get("blendup_key") == key
 
-        me.uv_textures.new("UVMap")
+            group = self.linkStoreGroup( storePath, match )
 
-        #me.uv_textures.new("BackUV")
+            if group is not None:
 
-        #set uv
+                self.materialGroups[id] = group
 
-        frontUvs = mesh["uvs"]
-        frontLayerData = me.uv_layers[0].data
+        if group is None:
 
-        #backUvs = mesh["backUvs"]
-        #backLayerData = me.uv_layers[1].data
+            group = bpy.data.node_groups.new(definition["Name"], 'ShaderNodeTree')
 
-        for k in range(0, nbLoops):
-            frontLayerData[k].uv = frontUvs[k]
-            #backLayerData[k].uv = backUvs[k]
+            group.use_fake_user = True
 
+            group.outputs.new('NodeSocketShader','out')
 
-        #set custom split normals
+            shader = group.nodes.new('ShaderNodeGroup')
 
-        me.loops.foreach_get("normal", unpack_list(normals))
+            outputNode = group.nodes.new('NodeGroupOutput')
 
-        me.normals_split_custom_set(normals)
+            shader.node_tree = self.getBlendUpGroup( definition["Type"] )
 
-        #me.show_normal_loop = True # debug normals
+            shader.location = (0,150)
 
-        me.validate(verbose=False,clean_customdata=False)  # *Very* important to not remove lnors here!
+            outputNode.location = (200,150)
 
-        me.use_auto_smooth = True
+            textureNodes = {}
 
-        me.show_edge_sharp = True
+            #TODO: Shouldn't be always True for front face here, it will create a UV bug sometimes
 
+            self.connectNodes(definition,shader,textureNodes, group.nodes, group.links, True )
 
-        return me
+            group.links.new(group.nodes[0].outputs[0], outputNode.inputs[0], False)
 
-    def createBlendUpGlossy( self ):
+            if storePath is not None:
 
-        group = bpy.data.node_groups.new('BlendUpGlossy', 'ShaderNodeTree')
-        group.use_fake_user = True
-        nodes = []
+                group["blendup_key"] = key
 
-        nodes.append(group.nodes.new('ShaderNodeBsdfTransparent'))
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('NodeGroupOutput'))
-        nodes.append(group.nodes.new('ShaderNodeBsdfGlossy'))
-        nodes.append(group.nodes.new('NodeGroupInput'))
+                group = self.shareStoreGroup( group, storePath, match )
 
-        group.inputs.new('NodeSocketColor','Color')
-        group.inputs.new('NodeSocketFloatFactor','Transparency')
-        group.inputs.new('NodeSocketFloatFactor','Roughness')
-        group.inputs.new('NodeSocketVector','Normal Map')
+            self.materialGroups[id] = group
 
-        group.outputs.new('NodeSocketShader','out')
+        mat.node_tree = group
 
-        setattr(nodes[0], 'location', [-93.27900695800781, 22.7655029296875])
-        setattr(nodes[1], 'location', [158.4275360107422, -18.004966735839844])
-        setattr(nodes[2], 'location', [392.5262756347656, -23.345855712890625])
-        setattr(nodes[3], 'location', [-98.65467834472656, -140.48617553710938])
-        setattr(nodes[4], 'location', [-363.0636901855469, -19.837453842163086])
+        return mat
 
-        group.links.new(group.nodes[4].outputs[1], group.nodes[1].inputs[0], False)
-        group.links.new(group.nodes[1].outputs[0], group.nodes[2].inputs[0], False)
-        group.links.new(group.nodes[0].outputs[0], group.nodes[1].inputs[1], False)
-        group.links.new(group.nodes[4].outputs[0], group.nodes[3].inputs[0], False)
-        group.links.new(group.nodes[4].outputs[2], group.nodes[3].inputs[1], False)
-        group.links.new(group.nodes[4].outputs[3], group.nodes[3].inputs[2], False)
-        group.links.new(group.nodes[3].outputs[0], group.nodes[1].inputs[2], False)
+    def parseFlatDefinition( self, definition ):
 
-        setattr(group.inputs[0], 'default_value', [0.4793201982975006, 0.4793201982975006, 0.4793201982975006, 1.0])
+        #group input values of an untextured definition, None when it can not be folded
 
-        setattr(group.inputs[1], 'default_value', 1.0)
-        setattr(group.inputs[1], 'max_value', 1.0)
-        setattr(group.inputs[1], 'min_value', 0.0)
+        def lin(x):
+            a = 0.055
+            if x <=0.04045 :
+                y = x * (1.0 / 12.92)
+            else:
+                y = pow( (x + a) * (1.0 / (1 + a)), 2.4)
+            return y
 
-        setattr(group.inputs[2], 'default_value', 0.0)
-        setattr(group.inputs[2], 'max_value', 1.0)
-        setattr(group.inputs[2], 'min_value', 0.0)
+        if definition.get("Type") not in self.flatMaterialTypes:
 
-        setattr(group.inputs[3], 'default_value', [0.0, 0.0, 0.0])
-        setattr(group.inputs[3], 'max_value', 1.0)
-        setattr(group.inputs[3], 'min_value', -1.0)
+            return None
 
-        return group
+        inputs = getBlendUpGroupSpecs()[ definition["Type"] ]["inputs"]
 
-    def createBlendUpDiffuse( self ):
+        names = [ socket["name"] for socket in inputs ]
 
-        group = bpy.data.node_groups.new('BlendUpDiffuse', 'ShaderNodeTree')
-        group.use_fake_user = True
-        nodes = []
+        values = [ socket.get("default_value") for socket in inputs ]
 
-        nodes.append(group.nodes.new('ShaderNodeBsdfTransparent'))
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('NodeGroupOutput'))
-        nodes.append(group.nodes.new('ShaderNodeBsdfDiffuse'))
-        nodes.append(group.nodes.new('NodeGroupInput'))
+        for param in definition:
 
-        group.inputs.new('NodeSocketColor','Color')
-        group.inputs.new('NodeSocketFloatFactor','Transparency')
-        group.inputs.new('NodeSocketFloatFactor','Roughness')
-        group.inputs.new('NodeSocketVector','Normal Map')
+            if param in [ "Type", "ID", "Name", "UVScale" ] or param not in names : continue
 
-        group.outputs.new('NodeSocketShader','out')
+            value = definition[param]
 
-        setattr(nodes[0], 'location', [-93.27900695800781, 22.7655029296875])
-        setattr(nodes[1], 'location', [158.4275360107422, -18.004966735839844])
-        setattr(nodes[2], 'location', [392.5262756347656, -23.345855712890625])
-        setattr(nodes[3], 'location', [-98.65467834472656, -140.48617553710938])
-        setattr(nodes[4], 'location', [-363.0636901855469, -19.837453842163086])
+            if "Texture" in value:
 
-        group.links.new(group.nodes[4].outputs[1], group.nodes[1].inputs[0], False)
-        group.links.new(group.nodes[1].outputs[0], group.nodes[2].inputs[0], False)
-        group.links.new(group.nodes[0].outputs[0], group.nodes[1].inputs[1], False)
-        group.links.new(group.nodes[4].outputs[0], group.nodes[3].inputs[0], False)
-        group.links.new(group.nodes[4].outputs[2], group.nodes[3].inputs[1], False)
-        group.links.new(group.nodes[4].outputs[3], group.nodes[3].inputs[2], False)
-        group.links.new(group.nodes[3].outputs[0], group.nodes[1].inputs[2], False)
+                return None
 
-        setattr(group.inputs[0], 'default_value', [0.4793201982975006, 0.4793201982975006, 0.4793201982975006, 1.0])
+            index = names.index(param)
 
-        setattr(group.inputs[1], 'default_value', 1.0)
-        setattr(group.inputs[1], 'max_value', 1.0)
-        setattr(group.inputs[1], 'min_value', 0.0)
+            v = [ float(x) for x in re.findall(r"[-+]?\d*\.\d+|\d+",value) ]
 
-        setattr(group.inputs[2], 'default_value', 0.0)
-        setattr(group.inputs[2], 'max_value', 1.0)
-        setattr(group.inputs[2], 'min_value', 0.0)
+            inputType = inputs[index]["type"]
 
-        setattr(group.inputs[3], 'default_value', [0.0, 0.0, 0.0])
-        setattr(group.inputs[3], 'max_value', 1.0)
-        setattr(group.inputs[3], 'min_value', -1.0)
+            if inputType == "NodeSocketColor":
 
-        return group
+                if "Color(" in value and len(v) == 3:
 
-    def createBlendUpMixDiffuseGlossy( self ):
+                    values[index] = [ lin(v[0] / 255), lin(v[1] / 255), lin(v[2] / 255), values[index][3] ]
 
-        group = bpy.data.node_groups.new('BlendUpMixDiffuseGlossy', 'ShaderNodeTree')
-        group.use_fake_user = True
-        nodes = []
-
-        nodes.append(group.nodes.new('ShaderNodeBsdfGlossy'))
-        nodes.append(group.nodes.new('NodeGroupOutput'))
-        nodes.append(group.nodes.new('ShaderNodeBsdfDiffuse'))
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('NodeGroupInput'))
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('ShaderNodeBsdfTransparent'))
-
-
-        group.inputs.new('NodeSocketColor','Color')
-        group.inputs.new('NodeSocketColor','Gloss Color')
-        group.inputs.new('NodeSocketFloatFactor','Gloss')
-        group.inputs.new('NodeSocketFloatFactor','Transparency')
-        group.inputs.new('NodeSocketFloatFactor','Roughness')
-        group.inputs.new('NodeSocketVector','Normal')
-
-        group.outputs.new('NodeSocketShader','out')
-
-        setattr(nodes[0], 'location', [-98.08839416503906, -284.52398681640625])
-        setattr(nodes[1], 'location', [479.94244384765625, -22.178813934326172])
-        setattr(nodes[2], 'location', [-98.65467834472656, -140.48617553710938])
-        setattr(nodes[3], 'location', [104.83003997802734, -196.83013916015625])
-        setattr(nodes[4], 'location', [-363.0636901855469, -19.837453842163086])
-        setattr(nodes[5], 'location', [279.025634765625, -66.3199462890625])
-        setattr(nodes[6], 'location', [97.43165588378906, -9.969608306884766])
-
-        group.links.new(group.nodes[4].outputs[3], group.nodes[5].inputs[0], False)
-        group.links.new(group.nodes[5].outputs[0], group.nodes[1].inputs[0], False)
-        group.links.new(group.nodes[6].outputs[0], group.nodes[5].inputs[1], False)
-        group.links.new(group.nodes[4].outputs[0], group.nodes[2].inputs[0], False)
-        group.links.new(group.nodes[4].outputs[4], group.nodes[2].inputs[1], False)
-        group.links.new(group.nodes[4].outputs[5], group.nodes[2].inputs[2], False)
-        group.links.new(group.nodes[4].outputs[1], group.nodes[0].inputs[0], False)
-        group.links.new(group.nodes[4].outputs[4], group.nodes[0].inputs[1], False)
-        group.links.new(group.nodes[3].outputs[0], group.nodes[5].inputs[2], False)
-        group.links.new(group.nodes[2].outputs[0], group.nodes[3].inputs[1], False)
-        group.links.new(group.nodes[0].outputs[0], group.nodes[3].inputs[2], False)
-        group.links.new(group.nodes[4].outputs[2], group.nodes[3].inputs[0], False)
-
-
-        setattr(group.inputs[0], 'default_value', [0.4793201982975006, 0.4793201982975006, 0.4793201982975006, 1.0])
-        setattr(group.inputs[1], 'default_value', [0.800000011920929, 0.800000011920929, 0.800000011920929, 1.0])
-        setattr(group.inputs[2], 'default_value', 0.20000000298023224)
-        setattr(group.inputs[2], 'max_value', 1.0)
-        setattr(group.inputs[2], 'min_value', 0.0)
-
-        setattr(group.inputs[3], 'default_value', 1.0)
-        setattr(group.inputs[3], 'max_value', 1.0)
-        setattr(group.inputs[3], 'min_value', 0.0)
-
-        setattr(group.inputs[4], 'default_value', 0.0)
-        setattr(group.inputs[4], 'max_value', 1.0)
-        setattr(group.inputs[4], 'min_value', 0.0)
-
-        setattr(group.inputs[5], 'default_value', [0.0, 0.0, 0.0])
-        setattr(group.inputs[5], 'max_value', 1.0)
-        setattr(group.inputs[5], 'min_value', -1.0)
+            elif inputType == "NodeSocketVector":
 
-        return group
+                #only the null vector, which lets the shader use the surface normal, is folded
 
-    def createBlendUpMixDiffuseGlossy2( self ):
+                if len(v) == 3 and v != [ 0.0, 0.0, 0.0 ]:
 
-        group = bpy.data.node_groups.new('BlendUpMixDiffuseGlossy2', 'ShaderNodeTree')
-        group.use_fake_user = True
-        nodes = []
-
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('ShaderNodeBsdfDiffuse'))
-        nodes.append(group.nodes.new('ShaderNodeBsdfTransparent'))
-        nodes.append(group.nodes.new('ShaderNodeLayerWeight'))
-        nodes.append(group.nodes.new('NodeGroupOutput'))
-        nodes.append(group.nodes.new('ShaderNodeBsdfGlossy'))
-        nodes.append(group.nodes.new('NodeGroupInput'))
-
-
-        group.inputs.new('NodeSocketColor','Color')
-        group.inputs.new('NodeSocketColor','Gloss Color')
-        group.inputs.new('NodeSocketFloatFactor','Transparency')
-        group.inputs.new('NodeSocketFloatFactor','Roughness')
-        group.inputs.new('NodeSocketFloatFactor','Blend')
-        group.inputs.new('NodeSocketVector','Normal')
-
-        group.outputs.new('NodeSocketShader','out')
-
-        setattr(nodes[0], 'location', [58.88031005859375, -1.1132183074951172])
-        setattr(nodes[1], 'location', [295.30865478515625, 43.30387878417969])
-        setattr(nodes[2], 'location', [-212.7175750732422, 22.63483428955078])
-        setattr(nodes[3], 'location', [67.42587280273438, 99.98251342773438])
-        setattr(nodes[4], 'location', [-213.2921600341797, 171.57620239257812])
-        setattr(nodes[5], 'location', [496.9807434082031, 9.520580291748047])
-        setattr(nodes[6], 'location', [-216.29188537597656, -123.47525024414062])
-        setattr(nodes[7], 'location', [-523.8729858398438, 6.868438720703125])
-
-        group.links.new(group.nodes[6].outputs[0], group.nodes[0].inputs[2], False)
-        group.links.new(group.nodes[4].outputs[1], group.nodes[0].inputs[0], False)
-        group.links.new(group.nodes[3].outputs[0], group.nodes[1].inputs[1], False)
-        group.links.new(group.nodes[7].outputs[0], group.nodes[2].inputs[0], False)
-        group.links.new(group.nodes[2].outputs[0], group.nodes[0].inputs[1], False)
-        group.links.new(group.nodes[0].outputs[0], group.nodes[1].inputs[2], False)
-        group.links.new(group.nodes[1].outputs[0], group.nodes[5].inputs[0], False)
-        group.links.new(group.nodes[7].outputs[2], group.nodes[1].inputs[0], False)
-        group.links.new(group.nodes[7].outputs[3], group.nodes[2].inputs[1], False)
-        group.links.new(group.nodes[7].outputs[5], group.nodes[2].inputs[2], False)
-        group.links.new(group.nodes[7].outputs[3], group.nodes[6].inputs[1], False)
-        group.links.new(group.nodes[7].outputs[5], group.nodes[6].inputs[2], False)
-        group.links.new(group.nodes[7].outputs[4], group.nodes[4].inputs[0], False)
-        group.links.new(group.nodes[7].outputs[5], group.nodes[4].inputs[1], False)
-        group.links.new(group.nodes[7].outputs[1], group.nodes[6].inputs[0], False)
-
-
-        setattr(group.inputs[0], 'default_value', [0.800000011920929, 0.800000011920929, 0.800000011920929, 1.0])
-        setattr(group.inputs[1], 'default_value', [0.6382714509963989, 0.6382714509963989, 0.6382714509963989, 1.0])
-        setattr(group.inputs[2], 'default_value', 1.0)
-        setattr(group.inputs[2], 'max_value', 1.0)
-        setattr(group.inputs[2], 'min_value', 0.0)
-        setattr(group.inputs[3], 'default_value', 0.0)
-        setattr(group.inputs[3], 'max_value', 1.0)
-        setattr(group.inputs[3], 'min_value', 0.0)
-        setattr(group.inputs[4], 'default_value', 0.10000000149011612)
-        setattr(group.inputs[4], 'max_value', 1.0)
-        setattr(group.inputs[4], 'min_value', 0.0)
-        setattr(group.inputs[5], 'default_value', [0.0, 0.0, 0.0])
-        setattr(group.inputs[5], 'max_value', 1.0)
-        setattr(group.inputs[5], 'min_value', -1.0)
+                    return None
 
-        return group
+            elif len(v) == 1:
 
-    def createBlendUpFabric( self ):
+                values[index] = v[0]
 
-        group = bpy.data.node_groups.new('BlendUpFabric', 'ShaderNodeTree')
-        group.use_fake_user = True
-        nodes = []
-
-        nodes.append(group.nodes.new('ShaderNodeBsdfVelvet'))
-        nodes.append(group.nodes.new('ShaderNodeBsdfDiffuse'))
-        nodes.append(group.nodes.new('ShaderNodeBsdfTransparent'))
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('NodeGroupOutput'))
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('ShaderNodeCombineHSV'))
-        nodes.append(group.nodes.new('ShaderNodeSeparateHSV'))
-        nodes.append(group.nodes.new('ShaderNodeMath'))
-        nodes.append(group.nodes.new('ShaderNodeLayerWeight'))
-        nodes.append(group.nodes.new('ShaderNodeBsdfGlossy'))
-        nodes.append(group.nodes.new('NodeGroupInput'))
-
-
-
-
-        group.inputs.new('NodeSocketColor','Color')
-        group.inputs.new('NodeSocketFloatFactor','Transparency')
-        group.inputs.new('NodeSocketFloatFactor','Roughness')
-        group.inputs.new('NodeSocketFloatFactor','Velvet')
-        group.inputs.new('NodeSocketFloatFactor','Blend')
-        group.outputs.new('NodeSocketShader','out')
-        group.inputs.new('NodeSocketVector','Normal')
-
-        setattr(nodes[0], 'location', [-106.10821533203125, -137.16693115234375])
-        setattr(nodes[1], 'location', [-114.49026489257812, -294.1087646484375])
-        setattr(nodes[2], 'location', [-101.3060302734375, 58.19593048095703])
-        setattr(nodes[3], 'location', [468.136962890625, -55.72111129760742])
-        setattr(nodes[4], 'location', [418.14990234375, -235.820556640625])
-        setattr(nodes[5], 'location', [655.2421875, -59.36756134033203])
-        setattr(nodes[6], 'location', [102.14228820800781, -74.29711151123047])
-        setattr(nodes[7], 'location', [-416.46148681640625, -162.48497009277344])
-        setattr(nodes[8], 'location', [-662.0545043945312, -154.95553588867188])
-        setattr(nodes[9], 'location', [-541.9961547851562, -322.1856384277344])
-        setattr(nodes[10], 'location', [134.7645263671875, -201.5348663330078])
-        setattr(nodes[11], 'location', [130.19033813476562, -338.1103515625])
-        setattr(nodes[12], 'location', [-854.2901000976562, -1.4631919860839844])
-
-        group.links.new(group.nodes[2].outputs[0], group.nodes[3].inputs[1], False)
-        group.links.new(group.nodes[12].outputs[0], group.nodes[1].inputs[0], False)
-        group.links.new(group.nodes[12].outputs[0], group.nodes[2].inputs[0], False)
-        group.links.new(group.nodes[12].outputs[1], group.nodes[3].inputs[0], False)
-        group.links.new(group.nodes[12].outputs[2], group.nodes[1].inputs[1], False)
-        group.links.new(group.nodes[12].outputs[3], group.nodes[6].inputs[0], False)
-        group.links.new(group.nodes[12].outputs[5], group.nodes[1].inputs[2], False)
-        group.links.new(group.nodes[3].outputs[0], group.nodes[5].inputs[0], False)
-        group.links.new(group.nodes[11].outputs[0], group.nodes[4].inputs[2], False)
-        group.links.new(group.nodes[6].outputs[0], group.nodes[4].inputs[1], False)
-        group.links.new(group.nodes[10].outputs[1], group.nodes[4].inputs[0], False)
-        group.links.new(group.nodes[4].outputs[0], group.nodes[3].inputs[2], False)
-        group.links.new(group.nodes[12].outputs[0], group.nodes[8].inputs[0], False)
-        group.links.new(group.nodes[7].outputs[0], group.nodes[0].inputs[0], False)
-        group.links.new(group.nodes[0].outputs[0], group.nodes[6].inputs[2], False)
-        group.links.new(group.nodes[1].outputs[0], group.nodes[6].inputs[1], False)
-        group.links.new(group.nodes[8].outputs[2], group.nodes[9].inputs[1], False)
-        group.links.new(group.nodes[9].outputs[0], group.nodes[7].inputs[2], False)
-        group.links.new(group.nodes[8].outputs[1], group.nodes[7].inputs[1], False)
-        group.links.new(group.nodes[8].outputs[0], group.nodes[7].inputs[0], False)
-        group.links.new(group.nodes[12].outputs[2], group.nodes[11].inputs[1], False)
-        group.links.new(group.nodes[12].outputs[5], group.nodes[11].inputs[2], False)
-        group.links.new(group.nodes[12].outputs[4], group.nodes[10].inputs[0], False)
-        group.links.new(group.nodes[12].outputs[5], group.nodes[10].inputs[1], False)
-        group.links.new(group.nodes[12].outputs[5], group.nodes[0].inputs[2], False)
-
-        setattr(nodes[9], 'operation', 'MULTIPLY')
-        setattr(nodes[9].inputs[0], 'default_value', 1.2)
-
-        setattr(group.inputs[0], 'default_value', [1.0, 1.0, 1.0, 1.0])
-
-        setattr(group.inputs[1], 'default_value', 1.0)
-        setattr(group.inputs[1], 'max_value', 1.0)
-        setattr(group.inputs[1], 'min_value', 0.0)
-
-        setattr(group.inputs[2], 'default_value', 0.699999988079071)
-        setattr(group.inputs[2], 'max_value', 1.0)
-        setattr(group.inputs[2], 'min_value', 0.0)
-
-
-        setattr(group.inputs[3], 'default_value', 0.800000011920929)
-        setattr(group.inputs[3], 'max_value', 1.0)
-        setattr(group.inputs[3], 'min_value', 0.0)
-
-        setattr(group.inputs[4], 'default_value', 0.05000000074505806)
-        setattr(group.inputs[4], 'max_value', 1.0)
-        setattr(group.inputs[4], 'min_value', 0.0)
-
-        setattr(group.inputs[5], 'default_value', [0.0, 0.0, 0.0])
-        setattr(group.inputs[5], 'max_value', 1.0)
-        setattr(group.inputs[5], 'min_value', -1.0)
+        return values
 
+    def foldFlatMaterial( self, type, values ):
 
-        return group
-    def createBlendUpGlass( self ):
+        #replaces the group inputs by constants and each mix shader with a constant 0 or 1 factor
+        #by the shader it selects, keeping only the nodes that still reach the group output
 
-        group = bpy.data.node_groups.new('BlendUpGlass', 'ShaderNodeTree')
-        group.use_fake_user = True
-        nodes = []
-
-        nodes.append(group.nodes.new('ShaderNodeBsdfTransparent'))
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('ShaderNodeBsdfTransparent'))
-        nodes.append(group.nodes.new('ShaderNodeBsdfGlossy'))
-        nodes.append(group.nodes.new('ShaderNodeLightPath'))
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('NodeGroupOutput'))
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('ShaderNodeBsdfTransparent'))
-        nodes.append(group.nodes.new('ShaderNodeLayerWeight'))
-        nodes.append(group.nodes.new('ShaderNodeMath'))
-        nodes.append(group.nodes.new('NodeGroupInput'))
-
-
-        group.inputs.new('NodeSocketColor','Color')
-        group.inputs.new('NodeSocketFloatFactor','Transparency')
-
-        group.outputs.new('NodeSocketShader','out')
-
-        setattr(nodes[0], 'location', [-0.8359482288360596, -84.36238098144531])
-        setattr(nodes[1], 'location', [-78.04933166503906, 59.87400817871094])
-        setattr(nodes[2], 'location', [-344.62945556640625, 56.638755798339844])
-        setattr(nodes[3], 'location', [-327.3433837890625, -31.67084312438965])
-        setattr(nodes[4], 'location', [-65.95742797851562, 397.6812438964844])
-        setattr(nodes[5], 'location', [211.79600524902344, 80.58950805664062])
-        setattr(nodes[6], 'location', [671.5985107421875, 48.43199920654297])
-        setattr(nodes[7], 'location', [474.40582275390625, 70.64627838134766])
-        setattr(nodes[8], 'location', [287.7782897949219, -96.51539611816406])
-        setattr(nodes[9], 'location', [-605.169921875, 381.7786865234375])
-        setattr(nodes[10], 'location', [-373.617919921875, 246.37042236328125])
-        setattr(nodes[11], 'location', [-778.1406860351562, 83.45103454589844])
-
-        setattr(nodes[10], 'operation', 'ADD')
-        setattr(nodes[10].inputs[1], 'default_value', 0.075)
-
-        group.links.new(group.nodes[4].outputs[1], group.nodes[5].inputs[0], False)
-        group.links.new(group.nodes[0].outputs[0], group.nodes[5].inputs[2], False)
-        group.links.new(group.nodes[1].outputs[0], group.nodes[5].inputs[1], False)
-        group.links.new(group.nodes[2].outputs[0], group.nodes[1].inputs[1], False)
-        group.links.new(group.nodes[3].outputs[0], group.nodes[1].inputs[2], False)
-        group.links.new(group.nodes[11].outputs[0], group.nodes[3].inputs[0], False)
-        group.links.new(group.nodes[11].outputs[0], group.nodes[2].inputs[0], False)
-        group.links.new(group.nodes[11].outputs[0], group.nodes[0].inputs[0], False)
-        group.links.new(group.nodes[10].outputs[0], group.nodes[1].inputs[0], False)
-        group.links.new(group.nodes[9].outputs[1], group.nodes[10].inputs[0], False)
-        group.links.new(group.nodes[11].outputs[1], group.nodes[7].inputs[0], False)
-        group.links.new(group.nodes[5].outputs[0], group.nodes[7].inputs[2], False)
-        group.links.new(group.nodes[7].outputs[0], group.nodes[6].inputs[0], False)
-        group.links.new(group.nodes[8].outputs[0], group.nodes[7].inputs[1], False)
-
-
-        setattr(group.inputs[0], 'default_value', [1.0, 1.0, 1.0, 1.0])
-
-        setattr(group.inputs[1], 'default_value', 0.5)
-        setattr(group.inputs[1], 'max_value', 1.0)
-        setattr(group.inputs[1], 'min_value', 0.0)
+        spec = getBlendUpGroupSpecs()[type]
 
+        types = [ node["type"] for node in spec["nodes"] ]
 
+        groupInput = types.index('NodeGroupInput')
 
-        return group
+        sources = {}
 
-    def createBlendUpAO( self ):
+        for [fromNode, fromSocket, toNode, toSocket] in spec["links"]:
 
-        group = bpy.data.node_groups.new('BlendUpAO', 'ShaderNodeTree')
-        group.use_fake_user = True
-        nodes = []
+            sources[ (toNode, toSocket) ] = (fromNode, fromSocket)
 
-        nodes.append(group.nodes.new('ShaderNodeBsdfTransparent'))
-        nodes.append(group.nodes.new('NodeGroupOutput'))
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('ShaderNodeAmbientOcclusion'))
-        nodes.append(group.nodes.new('ShaderNodeEmission'))
-        nodes.append(group.nodes.new('NodeGroupInput'))
+        def constant( node, socket ):
 
+            source = sources.get( (node, socket) )
 
-        group.inputs.new('NodeSocketColor','Color')
-        group.inputs.new('NodeSocketFloatFactor','Strength')
-        group.inputs.new('NodeSocketFloatFactor','Transparency')
-        group.inputs.new('NodeSocketVector','Normal')
+            if source is None:
 
-        group.outputs.new('NodeSocketShader','out')
+                return spec["nodes"][node].get("inputs", {}).get( str(socket) )
 
-        setattr(nodes[0], 'location', [-93.27900695800781, 22.7655029296875])
-        setattr(nodes[1], 'location', [614.4639892578125, -21.853071212768555])
-        setattr(nodes[2], 'location', [158.82533264160156, -100.75477600097656])
-        setattr(nodes[3], 'location', [382.217041015625, -30.9155330657959])
-        setattr(nodes[4], 'location', [-91.35116577148438, -300.3694763183594])
-        setattr(nodes[5], 'location', [-89.15872955322266, -168.53524780273438])
-        setattr(nodes[6], 'location', [-363.0636901855469, -19.837453842163086])
+            if source[0] == groupInput:
 
+                return values[ source[1] ]
 
-        group.links.new(group.nodes[6].outputs[2], group.nodes[3].inputs[0], False)
-        group.links.new(group.nodes[3].outputs[0], group.nodes[1].inputs[0], False)
-        group.links.new(group.nodes[0].outputs[0], group.nodes[3].inputs[1], False)
-        group.links.new(group.nodes[6].outputs[1], group.nodes[2].inputs[0], False)
-        group.links.new(group.nodes[6].outputs[0], group.nodes[5].inputs[0], False)
-        group.links.new(group.nodes[2].outputs[0], group.nodes[3].inputs[2], False)
-        group.links.new(group.nodes[6].outputs[0], group.nodes[4].inputs[0], False)
-        group.links.new(group.nodes[4].outputs[0], group.nodes[2].inputs[2], False)
-        group.links.new(group.nodes[5].outputs[0], group.nodes[2].inputs[1], False)
+            return None
 
-        setattr(group.inputs[0], 'default_value', [0.800000011920929, 0.800000011920929, 0.800000011920929, 1.0])
+        def resolve( node, socket ):
 
-        setattr(group.inputs[1], 'default_value', 1.0)
-        setattr(group.inputs[1], 'max_value', 1.0)
-        setattr(group.inputs[1], 'min_value', 0.0)
+            source = sources.get( (node, socket) )
 
-        setattr(group.inputs[2], 'default_value', 1.0)
-        setattr(group.inputs[2], 'max_value', 1.0)
-        setattr(group.inputs[2], 'min_value', 0.0)
+            while source is not None and types[ source[0] ] == 'ShaderNodeMixShader':
 
-        setattr(group.inputs[3], 'default_value', [0.0, 0.0, 0.0])
-        setattr(group.inputs[3], 'max_value', 1.0)
-        setattr(group.inputs[3], 'min_value', -1.0)
+                factor = constant( source[0], 0 )
 
-        return group
+                if factor is None or ( factor > 0 and factor < 1 ):
 
-    def createBlendUpMonochrome( self ):
+                    break
 
-        group = bpy.data.node_groups.new('BlendUpMonochrome', 'ShaderNodeTree')
-        group.use_fake_user = True
-        nodes = []
-
-        nodes.append(group.nodes.new('ShaderNodeBsdfDiffuse'))
-        nodes.append(group.nodes.new('ShaderNodeBsdfTransparent'))
-        nodes.append(group.nodes.new('NodeGroupOutput'))
-        nodes.append(group.nodes.new('ShaderNodeAmbientOcclusion'))
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('NodeGroupInput'))
-
-
-        group.inputs.new('NodeSocketColor','Color')
-        group.inputs.new('NodeSocketFloatFactor','Direct Shadow')
-        group.inputs.new('NodeSocketFloatFactor','Transparency')
-        group.inputs.new('NodeSocketVector','Normal')
-
-        group.outputs.new('NodeSocketShader','out')
-
-        setattr(nodes[0], 'location', [-121.84773254394531, -201.3492889404297])
-        setattr(nodes[1], 'location', [-91.5101089477539, 129.0993194580078])
-        setattr(nodes[2], 'location', [635.9929809570312, 41.98583984375])
-        setattr(nodes[3], 'location', [-110.73641967773438, -98.85674285888672])
-        setattr(nodes[4], 'location', [149.810791015625, -45.246009826660156])
-        setattr(nodes[5], 'location', [377.5273132324219, 46.166465759277344])
-        setattr(nodes[6], 'location', [-414.78717041015625, 60.5648193359375])
-
-        group.links.new(group.nodes[6].outputs[0], group.nodes[3].inputs[0], False)
-        group.links.new(group.nodes[6].outputs[2], group.nodes[5].inputs[0], False)
-        group.links.new(group.nodes[3].outputs[0], group.nodes[4].inputs[1], False)
-        group.links.new(group.nodes[0].outputs[0], group.nodes[4].inputs[2], False)
-        group.links.new(group.nodes[4].outputs[0], group.nodes[5].inputs[2], False)
-        group.links.new(group.nodes[1].outputs[0], group.nodes[5].inputs[1], False)
-        group.links.new(group.nodes[5].outputs[0], group.nodes[2].inputs[0], False)
-        group.links.new(group.nodes[6].outputs[0], group.nodes[0].inputs[0], False)
-        group.links.new(group.nodes[6].outputs[3], group.nodes[0].inputs[2], False)
-        group.links.new(group.nodes[6].outputs[1], group.nodes[4].inputs[0], False)
-
-
-        setattr(group.inputs[0], 'default_value', [0.800000011920929, 0.800000011920929, 0.800000011920929, 1.0])
-
-        setattr(group.inputs[1], 'default_value', 0.2)
-        setattr(group.inputs[1], 'max_value', 1.0)
-        setattr(group.inputs[1], 'min_value', 0.0)
-
-        setattr(group.inputs[2], 'default_value', 1.0)
-        setattr(group.inputs[2], 'max_value', 1.0)
-        setattr(group.inputs[2], 'min_value', 0.0)
-
-        setattr(group.inputs[3], 'default_value', [0.0, 0.0, 0.0])
-        setattr(group.inputs[3], 'max_value', 1.0)
-        setattr(group.inputs[3], 'min_value', -1.0)
+                source = sources.get( (source[0], 2 if factor >= 1 else 1) )
 
-        return group
+            return source
 
-    def createBlendUpLight( self ):
+        folded = { "nodes" : [], "constants" : {}, "links" : [] }
 
-        group = bpy.data.node_groups.new('BlendUpLight', 'ShaderNodeTree')
-        group.use_fake_user = True
-        nodes = []
-        nodes.append(group.nodes.new('ShaderNodeBsdfTransparent'))
-        nodes.append(group.nodes.new('ShaderNodeLightPath'))
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('NodeGroupOutput'))
-        nodes.append(group.nodes.new('ShaderNodeEmission'))
-        nodes.append(group.nodes.new('NodeGroupInput'))
+        def visit( node ):
 
+            if node in folded["nodes"]:
 
-        group.inputs.new('NodeSocketColor','Color')
-        group.inputs.new('NodeSocketFloatFactor','Strength')
+                return
 
-        group.outputs.new('NodeSocketShader','out')
+            folded["nodes"].append(node)
 
-        setattr(nodes[0], 'location', [-316.57318115234375, -32.83460998535156])
-        setattr(nodes[1], 'location', [-322.07952880859375, 387.5373229980469])
-        setattr(nodes[2], 'location', [-67.0149154663086, 147.7364501953125])
-        setattr(nodes[3], 'location', [200.0, 143.9700164794922])
-        setattr(nodes[4], 'location', [-316.3206787109375, 106.69867706298828])
-        setattr(nodes[5], 'location', [-655.5391235351562, 87.66107940673828])
+            for [toNode, toSocket] in sorted(sources):
 
-        group.links.new(group.nodes[1].outputs[0], group.nodes[2].inputs[0], False)
-        group.links.new(group.nodes[0].outputs[0], group.nodes[2].inputs[2], False)
-        group.links.new(group.nodes[4].outputs[0], group.nodes[2].inputs[1], False)
-        group.links.new(group.nodes[2].outputs[0], group.nodes[3].inputs[0], False)
-        group.links.new(group.nodes[5].outputs[0], group.nodes[4].inputs[0], False)
-        group.links.new(group.nodes[5].outputs[1], group.nodes[4].inputs[1], False)
+                if toNode != node: continue
 
-        setattr(group.inputs[0], 'default_value', [1.0, 1.0, 1.0, 1.0])
+                source = resolve( node, toSocket )
 
-        setattr(group.inputs[1], 'default_value', 1.0)
-        setattr(group.inputs[1], 'max_value', 1000000.0)
-        setattr(group.inputs[1], 'min_value', 0.0)
+                if source is None: continue
 
-        return group
+                if source[0] != groupInput:
 
-    def createBlendUpToon( self ):
+                    visit( source[0] )
 
-        #not used for now...
+                    folded["links"].append( [ source[0], source[1], node, toSocket ] )
 
-        group = bpy.data.node_groups.new('BlendUpToon', 'ShaderNodeTree')
-        group.use_fake_user = True
-        nodes = []
-
-        nodes.append(group.nodes.new('NodeGroupOutput'))
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('NodeGroupInput'))
-        nodes.append(group.nodes.new('ShaderNodeBsdfToon'))
-        nodes.append(group.nodes.new('ShaderNodeBsdfTransparent'))
-
-        group.inputs.new('NodeSocketColor','Color')
-        group.inputs.new('NodeSocketFloatFactor','Size')
-        group.inputs.new('NodeSocketFloatFactor','Smooth')
-        group.inputs.new('NodeSocketFloatFactor','Transparency')
-
-        group.outputs.new('NodeSocketShader','out')
-
-        setattr(nodes[0], 'location', [429.60736083984375, 2.82112455368042])
-        setattr(nodes[1], 'location', [231.41314697265625, 14.527313232421875])
-        setattr(nodes[2], 'location', [-213.65118408203125, 55.83436965942383])
-        setattr(nodes[3], 'location', [8.007874488830566, -115.88105773925781])
-        setattr(nodes[4], 'location', [16.742874145507812, 89.47240447998047])
-
-        group.links.new(group.nodes[2].outputs[0], group.nodes[3].inputs[0], False)
-        group.links.new(group.nodes[2].outputs[1], group.nodes[3].inputs[1], False)
-        group.links.new(group.nodes[2].outputs[2], group.nodes[3].inputs[2], False)
-        group.links.new(group.nodes[2].outputs[4], group.nodes[3].inputs[3], False)
-        group.links.new(group.nodes[1].outputs[0], group.nodes[0].inputs[0], False)
-        group.links.new(group.nodes[2].outputs[3], group.nodes[1].inputs[0], False)
-        group.links.new(group.nodes[4].outputs[0], group.nodes[1].inputs[1], False)
-        group.links.new(group.nodes[3].outputs[0], group.nodes[1].inputs[2], False)
-
-        setattr(group.inputs[0], 'default_value', [0.800000011920929, 0.800000011920929, 0.800000011920929, 1.0])
-
-        setattr(group.inputs[1], 'default_value', 0.5)
-        setattr(group.inputs[1], 'max_value', 1.0)
-        setattr(group.inputs[1], 'min_value', 0.0)
-
-        setattr(group.inputs[2], 'default_value', 0.0)
-        setattr(group.inputs[2], 'max_value', 1.0)
-        setattr(group.inputs[2], 'min_value', 0.0)
-
-        setattr(group.inputs[3], 'default_value', 1.0)
-        setattr(group.inputs[3], 'max_value', 1.0)
-        setattr(group.inputs[3], 'min_value', 0.0)
-
-        setattr(group.inputs[4], 'default_value', [0.0, 0.0, 0.0])
-        setattr(group.inputs[4], 'max_value', 1.0)
-        setattr(group.inputs[4], 'min_value', -1.0)
+                elif spec["inputs"][ source[1] ]["type"] != "NodeSocketVector":
 
-        return group
+                    folded["constants"][ (node, toSocket) ] = values[ source[1] ]
 
-    def createBlendUpPBR( self ):
+        folded["output"] = resolve( types.index('NodeGroupOutput'), 0 )
 
-        group = bpy.data.node_groups.new('BlendUpPBR', 'ShaderNodeTree')
-        group.use_fake_user = True
-        nodes = []
-        nodes.append(group.nodes.new('ShaderNodeBsdfDiffuse'))
-        nodes.append(group.nodes.new('ShaderNodeBsdfGlossy'))
-        nodes.append(group.nodes.new('ShaderNodeSeparateHSV'))
-        nodes.append(group.nodes.new('ShaderNodeMath'))
-        nodes.append(group.nodes.new('ShaderNodeMath'))
-        nodes.append(group.nodes.new('ShaderNodeMath'))
-        nodes.append(group.nodes.new('ShaderNodeFresnel'))
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('ShaderNodeEmission'))
-        nodes.append(group.nodes.new('ShaderNodeMath'))
-        nodes.append(group.nodes.new('ShaderNodeCombineHSV'))
-        nodes.append(group.nodes.new('ShaderNodeMixRGB'))
-        nodes.append(group.nodes.new('ShaderNodeMath'))
-        nodes.append(group.nodes.new('ShaderNodeMath'))
-        nodes.append(group.nodes.new('NodeGroupInput'))
-        nodes.append(group.nodes.new('ShaderNodeAddShader'))
-        nodes.append(group.nodes.new('ShaderNodeBsdfTransparent'))
-        nodes.append(group.nodes.new('ShaderNodeMixShader'))
-        nodes.append(group.nodes.new('NodeGroupOutput'))
-
-        setattr(nodes[0], 'location', [-174.95565795898438, 380.4754943847656])
-        setattr(nodes[1], 'location', [-90.94093322753906, -41.52635955810547])
-        setattr(nodes[2], 'location', [-773.2938842773438, -332.9705810546875])
-        setattr(nodes[3], 'location', [-552.3074340820312, -566.122314453125])
-        setattr(nodes[4], 'location', [-275.2654113769531, -404.73870849609375])
-        setattr(nodes[5], 'location', [-269.20556640625, -661.11865234375])
-        setattr(nodes[6], 'location', [159.6534881591797, -264.4090881347656])
-        setattr(nodes[7], 'location', [372.57501220703125, 26.189916610717773])
-        setattr(nodes[8], 'location', [382.9889831542969, -190.98712158203125])
-        setattr(nodes[9], 'location', [-32.4528694152832, -566.8570556640625])
-        setattr(nodes[10], 'location', [-507.0903625488281, -307.22235107421875])
-        setattr(nodes[11], 'location', [-460.05743408203125, 442.8718566894531])
-        setattr(nodes[12], 'location', [-779.4415893554688, 372.6409606933594])
-        setattr(nodes[13], 'location', [-447.469970703125, 97.66339111328125])
-        setattr(nodes[14], 'location', [-1017.5684814453125, 13.1002197265625])
-        setattr(nodes[15], 'location', [601.329833984375, -89.056640625])
-        setattr(nodes[16], 'location', [599.4542846679688, 90.07467651367188])
-        setattr(nodes[17], 'location', [959.8967895507812, 1.5410175323486328])
-        setattr(nodes[18], 'location', [1204.2589111328125, -4.1744384765625])
-
-        group.inputs.new('NodeSocketColor','Albedo')
-        group.inputs.new('NodeSocketFloatFactor','Transparency')
-        group.inputs.new('NodeSocketColor','Specular')
-        group.inputs.new('NodeSocketFloatFactor','Smoothness')
-        group.inputs.new('NodeSocketVector','Normal')
-        group.inputs.new('NodeSocketColor','Occlusion')
-        group.inputs.new('NodeSocketFloat','Occlusion Strength')
-        group.inputs.new('NodeSocketColor','Emission')
-        group.inputs.new('NodeSocketFloat','Emission Strength')
-
-        group.outputs.new('NodeSocketShader','out')
-
-        group.links.new(group.nodes[2].outputs[2], group.nodes[3].inputs[0], False)
-        group.links.new(group.nodes[3].outputs[0], group.nodes[4].inputs[0], False)
-        group.links.new(group.nodes[4].outputs[0], group.nodes[9].inputs[0], False)
-        group.links.new(group.nodes[5].outputs[0], group.nodes[9].inputs[1], False)
-        group.links.new(group.nodes[3].outputs[0], group.nodes[5].inputs[1], False)
-        group.links.new(group.nodes[2].outputs[0], group.nodes[10].inputs[0], False)
-        group.links.new(group.nodes[2].outputs[1], group.nodes[10].inputs[1], False)
-        group.links.new(group.nodes[14].outputs[3], group.nodes[13].inputs[1], False)
-        group.links.new(group.nodes[0].outputs[0], group.nodes[7].inputs[1], False)
-        group.links.new(group.nodes[1].outputs[0], group.nodes[7].inputs[2], False)
-        group.links.new(group.nodes[11].outputs[0], group.nodes[0].inputs[0], False)
-        group.links.new(group.nodes[6].outputs[0], group.nodes[7].inputs[0], False)
-        group.links.new(group.nodes[10].outputs[0], group.nodes[1].inputs[0], False)
-        group.links.new(group.nodes[13].outputs[0], group.nodes[1].inputs[1], False)
-        group.links.new(group.nodes[13].outputs[0], group.nodes[0].inputs[1], False)
-        group.links.new(group.nodes[14].outputs[4], group.nodes[0].inputs[2], False)
-        group.links.new(group.nodes[14].outputs[4], group.nodes[1].inputs[2], False)
-        group.links.new(group.nodes[14].outputs[4], group.nodes[6].inputs[1], False)
-        group.links.new(group.nodes[14].outputs[2], group.nodes[2].inputs[0], False)
-        group.links.new(group.nodes[7].outputs[0], group.nodes[15].inputs[0], False)
-        group.links.new(group.nodes[8].outputs[0], group.nodes[15].inputs[1], False)
-        group.links.new(group.nodes[14].outputs[7], group.nodes[8].inputs[0], False)
-        group.links.new(group.nodes[14].outputs[8], group.nodes[8].inputs[1], False)
-        group.links.new(group.nodes[9].outputs[0], group.nodes[6].inputs[0], False)
-        group.links.new(group.nodes[14].outputs[6], group.nodes[12].inputs[1], False)
-        group.links.new(group.nodes[14].outputs[5], group.nodes[12].inputs[0], False)
-        group.links.new(group.nodes[14].outputs[0], group.nodes[11].inputs[2], False)
-        group.links.new(group.nodes[12].outputs[0], group.nodes[11].inputs[1], False)
-        group.links.new(group.nodes[17].outputs[0], group.nodes[18].inputs[0], False)
-        group.links.new(group.nodes[14].outputs[1], group.nodes[17].inputs[0], False)
-        group.links.new(group.nodes[15].outputs[0], group.nodes[17].inputs[2], False)
-        group.links.new(group.nodes[16].outputs[0], group.nodes[17].inputs[1], False)
-
-        setattr(group.inputs[0], 'default_value', [0.4793201982975006, 0.4793201982975006, 0.4793201982975006, 1.0])
-
-        setattr(group.inputs[1], 'default_value', 1.0)
-        setattr(group.inputs[1], 'max_value', 1.0)
-        setattr(group.inputs[1], 'min_value', 0.0)
-
-        setattr(group.inputs[2], 'default_value', [0.04373502731323242, 0.04373502731323242, 0.04373502731323242, 1.0])
-
-        setattr(group.inputs[3], 'default_value', 0.5)
-        setattr(group.inputs[3], 'max_value', 1.0)
-        setattr(group.inputs[3], 'min_value', 0.0)
-
-        setattr(group.inputs[4], 'default_value', [0.0, 0.0, 0.0])
-        setattr(group.inputs[4], 'max_value', 1.0)
-        setattr(group.inputs[4], 'min_value', -1.0)
-
-        setattr(group.inputs[5], 'default_value', [1.0, 1.0, 1.0, 1.0])
-
-        setattr(group.inputs[6], 'default_value', 1.0)
-        setattr(group.inputs[6], 'max_value', 10000.0)
-        setattr(group.inputs[6], 'min_value', 0.0)
-
-        setattr(group.inputs[7], 'default_value', [0.0, 0.0, 0.0, 1.0])
-
-        setattr(group.inputs[8], 'default_value', 1.0)
-        setattr(group.inputs[8], 'max_value', 10000.0)
-        setattr(group.inputs[8], 'min_value', 0.0)
-
-        setattr(nodes[3], 'operation', 'POWER')
-
-        setattr(nodes[4], 'operation', 'ADD')
-        setattr(nodes[4].inputs[1], 'default_value', 1.0)
-
-        setattr(nodes[5], 'operation', 'SUBTRACT')
-        setattr(nodes[5].inputs[0], 'default_value', 1.0)
-
-
-        setattr(nodes[10].inputs[2], 'default_value', 1.0)
-
-        setattr(nodes[11], 'blend_type', 'MULTIPLY')
-        setattr(nodes[11].inputs[0], 'default_value', 1.0)
-
-        setattr(nodes[12], 'operation', 'POWER')
-        setattr(nodes[12].inputs[1], 'default_value', 0.5)
-
-        setattr(nodes[13], 'operation', 'SUBTRACT')
-        setattr(nodes[13].inputs[0], 'default_value', 1.0)
-        setattr(nodes[13].inputs[1], 'default_value', 1.0)
+        if folded["output"] is None or folded["output"][0] == groupInput:
 
-        return group
+            return None
 
+        visit( folded["output"][0] )
 
-    def cleanSpaces( self, str):
+        return folded
 
-        return str.lstrip().rstrip()
+    def createFlatShader( self, type, folded, nodes, links, location ):
 
+        #instantiates a folded group in the material tree, returns the shader output socket
 
-    def parseMaterialDefinitions( self ):
+        spec = getBlendUpGroupSpecs()[type]
 
-        materials = []
+        created = {}
 
-        matFile = self.sourceDir+"/materials2.txt"
+        for index in folded["nodes"]:
 
-        if self.useBlenderCycles == False:
+            nodeSpec = spec["nodes"][index]
 
-            matFile = self.sourceDir+"/materials.txt"
+            node = nodes.new(nodeSpec["type"])
 
-        with codecs.open(matFile, "r", "utf-8") as f:
+            node.location = ( location[0] + nodeSpec["location"][0], location[1] + nodeSpec["location"][1] )
 
-            materialLines = f.readlines()
+            for [attribute, value] in nodeSpec.get("properties", {}).items():
+                setattr(node, attribute, value)
 
-            for line in materialLines:
+            for [socket, value] in nodeSpec.get("inputs", {}).items():
+                node.inputs[int(socket)].default_value = value
 
-                mat = {}
+            created[index] = node
 
-                line = self.cleanSpaces(line)
+        for [(index, socket), value] in folded["constants"].items():
 
-                parameters = line.split(";")
+            created[index].inputs[socket].default_value = value
 
-                for param in parameters:
+        for [fromNode, fromSocket, toNode, toSocket] in folded["links"]:
 
-                    if not "=" in param: continue
+            links.new(created[fromNode].outputs[fromSocket], created[toNode].inputs[toSocket])
 
-                    vals = param.split("=")
+        return created[ folded["output"][0] ].outputs[ folded["output"][1] ]
 
-                    if len(vals) != 2 : continue
+    def countExpandedNodes( self, nodes ):
 
-                    valType = self.cleanSpaces(vals[0])
+        #nodes Cycles compiles once the groups are expanded
 
-                    valValue = self.cleanSpaces(vals[1])
+        count = 0
 
-                    mat[valType] = valValue
+        for node in nodes:
 
-                materials.append(mat)
+            count += 1
 
-        return materials
+            if node.type == 'GROUP' and node.node_tree is not None:
 
-    def getMaterialGroup( self, id, definition, nodes ):
+                count += self.countExpandedNodes( node.node_tree.nodes )
 
-        mat = nodes.new('ShaderNodeGroup')
+        return count
 
-        group = self.materialGroups.get(id)
+    def getSideShader( self, id, definition, nodes, links, location ):
 
-        if group is None:
+        #shader output socket of one side and the node count it has without folding
 
-            group = bpy.data.node_groups.new(definition["Name"], 'ShaderNodeTree')
+        folded = None
 
-            group.use_fake_user = True
+        if self.flat_materials:
 
-            group.outputs.new('NodeSocketShader','out')
+            values = self.parseFlatDefinition( definition )
 
-            shader = group.nodes.new('ShaderNodeGroup')
+            if values is not None:
 
-            outputNode = group.nodes.new('NodeGroupOutput')
+                folded = self.foldFlatMaterial( definition["Type"], values )
 
-            shader.node_tree = bpy.data.node_groups[definition["Type"]]
+        if folded is None:
 
-            shader.location = (0,150)
+            shader = self.getMaterialGroup(id, definition, nodes)
 
-            outputNode.location = (200,150)
+            shader.location = location
 
-            textureNodes = {}
+            return [ shader.outputs[0], 1 + self.countExpandedNodes( shader.node_tree.nodes ) ]
 
-            #TODO: Shouldn't be always True for front face here, it will create a UV bug sometimes
+        self.flatMaterialSides += 1
 
-            self.connectNodes(definition,shader,textureNodes, group.nodes, group.links, True )
+        #group node, wrapper group output and group node, then the BlendUp group itself
 
-            group.links.new(group.nodes[0].outputs[0], outputNode.inputs[0], False)
+        unfolded = 3 + len( getBlendUpGroupSpecs()[ definition["Type"] ]["nodes"] )
 
-            self.materialGroups[id] = group
+        return [ self.createFlatShader( definition["Type"], folded, nodes, links, location ), unfolded ]
 
-        mat.node_tree = group
+    def sameShading( self, frontDef, backDef ):
 
-        return mat
+        ignored = [ "Name", "ID" ]
+
+        return dict( (k, v) for k, v in frontDef.items() if k not in ignored ) == dict( (k, v) for k, v in backDef.items() if k not in ignored )
 
     def getMaterialGroupBI( self, id, definition, nodes, textureNodes ):
 
@@ -2074,6 +3888,10 @@ class Skp2Blend:
 
     def createBIMaterials( self ):
 
+        self.runSteps( self.createBIMaterialsSteps() )
+
+    def createBIMaterialsSteps( self ):
+
         self.BItextures =  {}
 
         #get material definitions
@@ -2090,6 +3908,12 @@ class Skp2Blend:
 
             temp = material.name.split("#")
 
+            #the key outlives the renaming, lazy materializations find the material by it
+
+            material["blendup_key"] = key
+
+            material["blendup_export"] = self.exportPath
+
             frontMatId = int(temp[0]) + 1
 
             frontDef = materialDefinitions[frontMatId]
@@ -2200,36 +4024,31 @@ class Skp2Blend:
 
                 material.node_tree.links.new(node_backMix2.outputs[0], nodes["Output"].inputs['Alpha'])
 
+            yield
 
-    def createCycleMaterials( self ):
-
-        #get material definitions
-
-        materialDefinitions = self.parseMaterialDefinitions()
-
-        #create blendup standard material groups
 
-        #self.createBlendUpAO()
+    def createCycleMaterials( self ):
 
-        self.createBlendUpMonochrome()
+        self.runSteps( self.createCycleMaterialsSteps() )
 
-        self.createBlendUpDiffuse()
+    def createCycleMaterialsSteps( self ):
 
-        self.createBlendUpLight()
+        #get material definitions
 
-        self.createBlendUpGlass()
+        materialDefinitions = self.parseMaterialDefinitions()
 
-        self.createBlendUpGlossy()
+        #only the blendup standard material groups referenced by the materials get built,
+        #on demand from getMaterialGroup
 
-        self.createBlendUpMixDiffuseGlossy()
+        materialGroups = {}
 
-        self.createBlendUpMixDiffuseGlossy2()
+        #expanded node counts of all materials, without and with folding
 
-        self.createBlendUpFabric()
+        self.materialNodeCounts = [ 0, 0 ]
 
-        #self.createBlendUpPBR()
+        self.flatMaterialSides = 0
 
-        materialGroups = {}
+        droppedMixes = 0
 
         for key in self.materials:
 
@@ -2237,6 +4056,12 @@ class Skp2Blend:
 
             temp = material.name.split("#")
 
+            #the key outlives the renaming, lazy materializations find the material by it
+
+            material["blendup_key"] = key
+
+            material["blendup_export"] = self.exportPath
+
             frontMatId = int(temp[0]) + 1
 
             frontDef = materialDefinitions[frontMatId]
@@ -2267,35 +4092,33 @@ class Skp2Blend:
 
             nodes["Material Output"].location = (600,0)
 
-            #add front material group
+            links = material.node_tree.links
 
-            frontShader = self.getMaterialGroup(frontMatId, frontDef, nodes)
+            #add front shader, a material group or its folded flat tree
 
-            #frontShader = nodes.new('ShaderNodeGroup')
+            [frontOutput, frontCount] = self.getSideShader(frontMatId, frontDef, nodes, links, (0,150))
 
-            #frontShader.node_tree = bpy.data.node_groups [frontDef["Type"]]
+            nodesBefore = 1 + frontCount
 
-            #self.connectNodes(frontDef,frontShader,textureNodes, nodes, material.node_tree.links, True )
+            if not self.back_materials or self.sameShading(frontDef, backDef):
 
-            frontShader.location = (0,150)
+                #link output, identical sides need no backface mix
 
-            if not self.back_materials:
+                links.new(frontOutput, nodes["Material Output"].inputs['Surface'])
 
-                #link output
+                if self.back_materials:
 
-                material.node_tree.links.new(frontShader.outputs[0], nodes["Material Output"].inputs['Surface'])
+                    nodesBefore += 2 + frontCount
+
+                    droppedMixes += 1
 
             else:
 
                 #create back shader and mix them based on the geometry
 
-                backShader = self.getMaterialGroup(backMatId, backDef, nodes)
-
-                #backShader = nodes.new('ShaderNodeGroup')
-
-                #backShader.node_tree = bpy.data.node_groups [backDef["Type"]]
+                [backOutput, backCount] = self.getSideShader(backMatId, backDef, nodes, links, (0,-150))
 
-                backShader.location = (0,-150)
+                nodesBefore += 2 + backCount
 
                 #create geometry shader
 
@@ -2311,14 +4134,175 @@ class Skp2Blend:
 
                 #link
 
-                material.node_tree.links.new(node_geometry.outputs[6], node_backMix.inputs[0])
+                links.new(node_geometry.outputs[6], node_backMix.inputs[0])
+
+                links.new(frontOutput, node_backMix.inputs[1])
+
+                links.new(backOutput, node_backMix.inputs[2])
+
+                links.new(node_backMix.outputs[0], nodes["Material Output"].inputs['Surface'])
+
+            self.materialNodeCounts[0] += nodesBefore
+
+            self.materialNodeCounts[1] += self.countExpandedNodes( nodes )
+
+            yield
+
+        print( "BlendUp shader groups used: %d of %d (%s)" % ( len( self.blendUpGroups ), len( self.blendUpGroupNames ), ", ".join( sorted( self.blendUpGroups ) ) ) )
+
+        print( "BlendUp material nodes: %d before folding, %d after (%d flat shaders, %d backface mixes dropped)" %
+               ( self.materialNodeCounts[0], self.materialNodeCounts[1], self.flatMaterialSides, droppedMixes ) )
+
+        if self.getOption('asset_store', "") != "":
+
+            print( "BlendUp asset store: %d groups linked, %d stored, %d textures reused, %d added" %
+                   ( self.storeStats["linked"], self.storeStats["stored"], self.storeStats["texturesReused"], self.storeStats["texturesAdded"] ) )
+
+
+#importers of the lazy imports of this session, by export path
+
+lazyImporters = {}
+
+def getLazyImporter( path, sourceDir ):
+
+    importer = lazyImporters.get(path)
+
+    if importer is None:
+
+        #after reloading the .blend file the export is indexed again and its own options apply
+
+        importer = Skp2Blend()
+
+        importer.lazy_meshes = True
+
+        importer.indexExport( path, sourceDir )
+
+        importer.findConvertedMaterials()
+
+        lazyImporters[path] = importer
+
+    return importer
+
+def materializeObjects( objects ):
 
-                material.node_tree.links.new(frontShader.outputs[0], node_backMix.inputs[1])
+    #reads the geometry of the proxies used by the objects and their children, for scripts
+    #and the blendup.materialize operator; returns the number of meshes read
 
-                material.node_tree.links.new(backShader.outputs[0], node_backMix.inputs[2])
+    proxies = {}
 
-                material.node_tree.links.new(node_backMix.outputs[0], nodes["Material Output"].inputs['Surface'])
+    objects = list(objects)
 
-                #self.connectNodes(frontDef,frontShader,textureNodes, nodes, material.node_tree.links, True )
+    while objects:
+
+        object = objects.pop()
+
+        objects.extend( object.children )
+
+        if object.type == 'MESH' and object.data.get("blendup_mesh") is not None:
+
+            proxies.setdefault( object.data["blendup_export"], {} )[object.data.name] = object.data
+
+    count = 0
+
+    for [path, meshes] in proxies.items():
+
+        meshes = list( meshes.values() )
+
+        importer = getLazyImporter( path, meshes[0]["blendup_source_dir"] )
+
+        count += importer.materializeMeshes(meshes)
+
+        importer.end()
+
+    return count
+
+class BlendUpImportOperator(bpy.types.Operator):
+    bl_idname = "blendup.import_modal"
+    bl_label = "BlendUp Import"
+    filepath = StringProperty()
+    directory = StringProperty()
+    time_budget = FloatProperty(default = 0.1, min = 0.01)
+
+    def execute(self, context):
+        self.importer = Skp2Blend()
+        self.importer.memory.interactive = True
+        self.snapshot = self.importer.snapshotData()
+        sourceDir = self.directory or os.path.dirname(self.filepath)
+        self.steps = self.importer.importSteps(self.filepath, sourceDir)
+        self.stepsDone = 0
+        wm = context.window_manager
+        wm.progress_begin(0, 100)
+        self.timer = wm.event_timer_add(0.01, context.window)
+        wm.modal_handler_add(self)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC':
+            self.cancel(context)
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        #run as many steps as fit in the time budget, then give the UI back
+        deadline = time.time() + self.time_budget
+        try:
+            while time.time() < deadline:
+                next(self.steps)
+                self.stepsDone += 1
+        except StopIteration:
+            self.importer.end()
+            self.finish(context)
+            return {'FINISHED'}
+        except Exception as e:
+            self.cancel(context)
+            self.report({'ERROR'}, str(e))
+            return {'CANCELLED'}
+
+        total = max(getattr(self.importer, "progressTotal", 0), 1)
+        context.window_manager.progress_update(min(100, 100 * self.stepsDone / total))
+        return {'RUNNING_MODAL'}
+
+    def finish(self, context):
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+
+    def cancel(self, context):
+        self.steps.close()
+        self.importer.abort()
+        self.importer.removeNewData(self.snapshot)
+        self.finish(context)
+
+bpy.utils.register_class(BlendUpImportOperator)
+
+class BlendUpSwapResolutionOperator(bpy.types.Operator):
+    bl_idname = "blendup.swap_resolution"
+    bl_label = "BlendUp Swap Mesh Resolution"
+
+    def execute(self, context):
+        #objects of a decimated definition switch between its mesh and the full resolution alternate
+        swapped = 0
+        for object in context.selected_objects:
+            if object.type != 'MESH':
+                continue
+            name = object.data.get("blendup_full_mesh") or object.data.get("blendup_decimated_mesh")
+            if name and name in bpy.data.meshes:
+                object.data = bpy.data.meshes[name]
+                swapped += 1
+        self.report({'INFO'}, "%d objects swapped" % swapped)
+        return {'FINISHED'}
+
+bpy.utils.register_class(BlendUpSwapResolutionOperator)
+
+class BlendUpMaterializeOperator(bpy.types.Operator):
+    bl_idname = "blendup.materialize"
+    bl_label = "BlendUp Load Selected Meshes"
+
+    def execute(self, context):
+        #proxies of a lazy import are replaced by their geometry for the selection
+        count = materializeObjects(context.selected_objects)
+        self.report({'INFO'}, "%d meshes loaded" % count)
+        return {'FINISHED'}
 
-                #self.connectNodes(backDef,backShader,textureNodes, nodes, material.node_tree.links, False )
+bpy.utils.register_class(BlendUpMaterializeOperator)